@@ -1,11 +1,14 @@
 import uuid
 from datetime import datetime
-from typing import Generator
+from typing import Callable, Generator
 
 from sqlalchemy import (
+    Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
+    Integer,
     String,
     Text,
     UniqueConstraint,
@@ -37,6 +40,11 @@ def get_session() -> Generator[Session, None, None]:
         session.close()
 
 
+def get_session_factory() -> Callable[[], Session]:
+    """Get the factory of the sessions used outside of requests (e.g., by jobs)."""
+    return SessionClass
+
+
 class TimestampedModel(Base):
     """An abstract base model that includes the timestamp fields."""
 
@@ -90,6 +98,11 @@ class Example(TimestampedModel):
         JSONB,
         comment="The output associated with the example.",
     )
+    token_count = Column(
+        Integer,
+        nullable=True,
+        comment="Estimated number of tokens the example adds to a prompt.",
+    )
     extractor_id = Column(
         UUID(as_uuid=True),
         ForeignKey("extractors.uuid", ondelete="CASCADE"),
@@ -175,6 +188,185 @@ class Extractor(TimestampedModel):
         return f"<Extractor(id={self.uuid}, description={self.description})>"
 
 
+class CachedResult(TimestampedModel):
+    """An extraction result of a single chunk cached by content hash.
+
+    Used by the postgres backend of the result cache.
+    """
+
+    __tablename__ = "cached_results"
+
+    key = Column(
+        String(64),
+        index=True,
+        nullable=False,
+        unique=True,
+        comment="Hash of the chunk text, schema, instructions, examples and model.",
+    )
+    response = Column(
+        JSONB,
+        nullable=False,
+        comment="The extraction response for the chunk.",
+    )
+    num_tokens = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="Estimated number of tokens used to compute the response.",
+    )
+
+    def __repr__(self) -> str:
+        return f"<CachedResult(key={self.key})>"
+
+
+class ExtractionJob(TimestampedModel):
+    """An extraction of an entire document running in the background.
+
+    The progress of the job is updated as its chunks complete.
+    """
+
+    __tablename__ = "extraction_jobs"
+
+    owner_id = Column(
+        UUID(as_uuid=True),
+        index=True,
+        nullable=False,
+        comment="Owner uuid.",
+    )
+    extractor_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("extractors.uuid", ondelete="CASCADE"),
+        nullable=False,
+        comment="The extractor used by the job.",
+    )
+    model_name = Column(
+        String(100),
+        nullable=False,
+        comment="The model used by the job.",
+    )
+    status = Column(
+        String(20),
+        nullable=False,
+        server_default="pending",
+        comment="One of pending, running or succeeded. Jobs succeed once every "
+        "chunk was extracted or failed.",
+    )
+    total_chunks = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="The number of chunks of the document.",
+    )
+    completed_chunks = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="The number of chunks extracted successfully.",
+    )
+    failed_chunks = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="The number of chunks whose extraction failed on every attempt.",
+    )
+    skipped_chunks = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="The number of chunks skipped as duplicates of another chunk.",
+    )
+    tokens_used = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="Estimated number of tokens used by the extracted chunks.",
+    )
+    content_too_long = Column(
+        Boolean,
+        nullable=False,
+        server_default="false",
+        comment="Whether the document was truncated to the max number of chunks.",
+    )
+    chunks = relationship("JobChunk", backref="job", passive_deletes=True)
+
+    def __repr__(self) -> str:
+        return f"<ExtractionJob(uuid={self.uuid}, status={self.status})>"
+
+
+class JobChunk(TimestampedModel):
+    """A chunk of the document of an extraction job, with its result."""
+
+    __tablename__ = "job_chunks"
+
+    job_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("extraction_jobs.uuid", ondelete="CASCADE"),
+        nullable=False,
+        comment="The job the chunk belongs to.",
+    )
+    index = Column(
+        Integer,
+        nullable=False,
+        comment="The position of the chunk in the document.",
+    )
+    text = Column(
+        Text,
+        nullable=False,
+        comment="The text of the chunk.",
+    )
+    status = Column(
+        String(20),
+        nullable=False,
+        server_default="pending",
+        comment="One of pending, running, success, error or skipped.",
+    )
+    data = Column(
+        JSONB,
+        nullable=True,
+        comment="The items extracted from the chunk.",
+    )
+    error = Column(
+        Text,
+        nullable=True,
+        comment="The error of the extraction of the chunk.",
+    )
+    duplicate_of = Column(
+        Integer,
+        nullable=True,
+        comment="The index of the chunk this chunk duplicates, if skipped.",
+    )
+    attempts = Column(
+        Integer,
+        nullable=False,
+        server_default="0",
+        comment="The number of times the chunk was claimed by a worker.",
+    )
+    worker_id = Column(
+        String(100),
+        nullable=True,
+        comment="The worker holding the lease of the running chunk.",
+    )
+    lease_expires_at = Column(
+        DateTime,
+        nullable=True,
+        comment="The time (UTC) after which the running chunk may be claimed again.",
+    )
+    not_before = Column(
+        DateTime,
+        nullable=True,
+        comment="The time (UTC) before which the failed chunk is not retried.",
+    )
+
+    __table_args__ = (
+        UniqueConstraint("job_id", "index", name="unique_job_chunk"),
+        # Used by workers to find the chunks to claim
+        Index("job_chunks_queue", "status", "lease_expires_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<JobChunk(job_id={self.job_id}, index={self.index})>"
+
+
 def validate_extractor_owner(
     session: Session, extractor_id: UUID, user_id: UUID
 ) -> Extractor:
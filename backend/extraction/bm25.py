@@ -0,0 +1,71 @@
+"""Rank texts against a query with Okapi BM25.
+
+An in-memory inverted index maps each term to the texts it appears in and its
+frequency in each of them, so scoring a query only touches the postings of
+its terms. No embeddings are needed.
+"""
+from __future__ import annotations
+
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+_TERM_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercased word terms."""
+    return _TERM_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """An inverted index scoring texts with BM25."""
+
+    def __init__(self, texts: Sequence[str], *, k1: float = 1.5, b: float = 0.75):
+        """Index texts.
+
+        Args:
+            texts: The texts to index.
+            k1: Saturation of the term frequencies.
+            b: Strength of the normalization by the length of the texts.
+        """
+        self.k1 = k1
+        self.b = b
+        self.num_texts = len(texts)
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(texts), dtype=np.float64)
+        for idx, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths[idx] = len(terms)
+            for term, frequency in Counter(terms).items():
+                text_ids, frequencies = postings[term]
+                text_ids.append(idx)
+                frequencies.append(frequency)
+        self._postings = {
+            term: (np.array(text_ids), np.array(frequencies, dtype=np.float64))
+            for term, (text_ids, frequencies) in postings.items()
+        }
+        average_length = lengths.mean() if len(texts) else 0.0
+        # The part of the denominator of BM25 that only depends on the text
+        self._length_norms = k1 * (
+            1 - b + b * lengths / (average_length if average_length else 1.0)
+        )
+
+    def score(self, query: str) -> np.ndarray:
+        """Score every indexed text against a query."""
+        scores = np.zeros(self.num_texts, dtype=np.float64)
+        for term in set(tokenize(query)):
+            if term not in self._postings:
+                continue
+            text_ids, frequencies = self._postings[term]
+            num_matches = len(text_ids)
+            idf = np.log(1 + (self.num_texts - num_matches + 0.5) / (num_matches + 0.5))
+            scores[text_ids] += (
+                idf
+                * frequencies
+                * (self.k1 + 1)
+                / (frequencies + self._length_norms[text_ids])
+            )
+        return scores
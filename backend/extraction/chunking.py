@@ -0,0 +1,201 @@
+"""Split large documents into overlapping windows of tokens.
+
+The document is tokenized once into a compact integer array. Window boundaries
+are computed with index arithmetic on that array, and the text of a chunk is
+only decoded when the chunk is accessed, so chunks that are never sent to a
+model (e.g., past the max number of chunks) cost nothing.
+"""
+from __future__ import annotations
+
+import array
+import functools
+from typing import List, Sequence, Union, overload
+
+import numpy as np
+import tiktoken
+
+# Documents larger than this are tokenized in segments, in parallel.
+SEGMENT_SIZE = 100_000  # in characters
+
+# Number of threads used to tokenize the segments of a document.
+NUM_THREADS = 8
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name: str) -> tiktoken.Encoding:
+    """Get a tiktoken encoding, loading it only once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def _split_segments(text: str, segment_size: int) -> List[str]:
+    """Split a text into segments of about `segment_size` characters.
+
+    Segments end right after a newline when possible, so that tokens are not cut
+    in the middle. Tokens spanning a cut may differ from tokenizing the text as
+    a whole, which only affects the boundaries of a few chunks.
+    """
+    segments = []
+    start = 0
+    while len(text) - start > segment_size:
+        end = text.rfind("\n", start + segment_size // 2, start + segment_size)
+        end = start + segment_size if end == -1 else end + 1
+        segments.append(text[start:end])
+        start = end
+    segments.append(text[start:])
+    return segments
+
+
+def tokenize(
+    text: str, encoding: tiktoken.Encoding, *, segment_size: int = SEGMENT_SIZE
+) -> np.ndarray:
+    """Tokenize a text into an array of token ids.
+
+    Special tokens are encoded as ordinary text.
+    """
+    if len(text) <= segment_size:
+        return np.array(encoding.encode_ordinary(text), dtype=np.uint32)
+    segments = _split_segments(text, segment_size)
+    tokens = array.array("I")
+    # Segments are appended batch by batch, so that only a few of them are held
+    # as lists of python ints at any time.
+    for idx in range(0, len(segments), NUM_THREADS):
+        batch = encoding.encode_ordinary_batch(
+            segments[idx : idx + NUM_THREADS], num_threads=NUM_THREADS
+        )
+        for segment_tokens in batch:
+            tokens.extend(segment_tokens)
+    return np.frombuffer(tokens, dtype=np.uint32)
+
+
+def compute_windows(num_tokens: int, chunk_size: int, chunk_overlap: int) -> np.ndarray:
+    """Compute the boundaries of overlapping windows covering `num_tokens` tokens.
+
+    Returns:
+        An array of shape (num_windows, 2) with the start (inclusive) and end
+        (exclusive) of each window. The last window ends at `num_tokens`.
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError(
+            f"Chunk overlap ({chunk_overlap}) must be smaller than "
+            f"the chunk size ({chunk_size})."
+        )
+    if num_tokens == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    step = chunk_size - chunk_overlap
+    num_windows = 1 + max(0, -(-(num_tokens - chunk_size) // step))
+    starts = np.arange(num_windows, dtype=np.int64) * step
+    ends = np.minimum(starts + chunk_size, num_tokens)
+    return np.stack([starts, ends], axis=1)
+
+
+class TokenChunks(Sequence[str]):
+    """The chunks of a tokenized document, decoded on access."""
+
+    def __init__(
+        self, tokens: np.ndarray, windows: np.ndarray, encoding: tiktoken.Encoding
+    ) -> None:
+        self.tokens = tokens
+        self.windows = windows
+        self.encoding = encoding
+
+    def __len__(self) -> int:
+        return len(self.windows)
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> TokenChunks:
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, TokenChunks]:
+        if isinstance(index, slice):
+            return TokenChunks(self.tokens, self.windows[index], self.encoding)
+        start, end = self.windows[index]
+        return self.encoding.decode(self.tokens[start:end].tolist())
+
+    def num_tokens(self, index: int) -> int:
+        """Get the number of tokens of a chunk without decoding it."""
+        start, end = self.windows[index]
+        return int(end - start)
+
+
+class TokenChunker:
+    """Split texts into chunks of at most `chunk_size` tokens.
+
+    This is a drop-in replacement for langchain's `TokenTextSplitter`
+    that is suited to very large documents.
+    """
+
+    def __init__(
+        self,
+        encoding: tiktoken.Encoding,
+        *,
+        chunk_size: int,
+        chunk_overlap: int = 20,
+    ) -> None:
+        """Initialize the chunker.
+
+        Args:
+            encoding: The tiktoken encoding used to count tokens.
+            chunk_size: Max number of tokens per chunk.
+            chunk_overlap: Number of tokens shared by consecutive chunks.
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"Chunk overlap ({chunk_overlap}) must be smaller than "
+                f"the chunk size ({chunk_size})."
+            )
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split_text(self, text: str) -> TokenChunks:
+        """Split a text into chunks, which are decoded lazily."""
+        tokens = tokenize(text, self.encoding)
+        windows = compute_windows(len(tokens), self.chunk_size, self.chunk_overlap)
+        return TokenChunks(tokens, windows, self.encoding)
+
+
+class IncrementalChunker:
+    """Split a text fed piece by piece (e.g., page by page) into chunks.
+
+    Chunks are returned as soon as they are complete, so only the tokens of
+    the current window are held in memory. The chunks are the ones
+    `TokenChunker.split_text` makes from the whole text, except that tokens
+    spanning two pieces are tokenized separately.
+    """
+
+    def __init__(self, chunker: TokenChunker) -> None:
+        self.chunker = chunker
+        # The tokens from the start of the next window
+        self._tokens = np.empty(0, dtype=np.uint32)
+        # Number of leading tokens already in the previous window (the overlap)
+        self._num_covered = 0
+
+    def _decode(self, tokens: np.ndarray) -> str:
+        return self.chunker.encoding.decode(tokens.tolist())
+
+    def feed(self, text: str) -> List[str]:
+        """Add the next piece of text and get the chunks it completes."""
+        tokens = tokenize(text, self.chunker.encoding)
+        self._tokens = np.concatenate([self._tokens, tokens])
+        chunk_size = self.chunker.chunk_size
+        step = chunk_size - self.chunker.chunk_overlap
+        chunks = []
+        # A window is complete once more tokens follow it
+        while len(self._tokens) > chunk_size:
+            chunks.append(self._decode(self._tokens[:chunk_size]))
+            self._tokens = self._tokens[step:]
+            self._num_covered = self.chunker.chunk_overlap
+        return chunks
+
+    def finish(self) -> List[str]:
+        """Get the last chunk, once all the text was fed."""
+        if len(self._tokens) <= self._num_covered:
+            return []
+        chunk = self._decode(self._tokens)
+        self._tokens = self._tokens[:0]
+        self._num_covered = 0
+        return [chunk]
@@ -0,0 +1,132 @@
+"""Detect duplicate and near-duplicate chunks of a document.
+
+Exact duplicates are found by hashing the normalized text of each chunk.
+Near-duplicates are found with SimHash: every chunk gets a 64-bit signature
+built from its word shingles, and the fraction of bits two signatures share
+estimates how similar the chunks are. Repeated headers, footers, disclaimers
+and tables therefore only need to be extracted once.
+"""
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+SIGNATURE_BITS = 64
+
+
+def _normalize(text: str) -> str:
+    """Normalize case and whitespace."""
+    return " ".join(text.lower().split())
+
+
+def _hash_features(features: Sequence[str]) -> np.ndarray:
+    """Hash features to 64-bit integers."""
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(),
+                "little",
+            )
+            for feature in features
+        ],
+        dtype=np.uint64,
+    )
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    """Count the bits set in each of an array of 64-bit integers."""
+    bits = np.unpackbits(values.astype(np.uint64).view(np.uint8).reshape(-1, 8))
+    return bits.reshape(-1, SIGNATURE_BITS).sum(axis=1)
+
+
+def simhash(text: str, *, shingle_size: int = 3) -> int:
+    """Compute the 64-bit SimHash signature of a text from its word shingles."""
+    words = _normalize(text).split()
+    if len(words) <= shingle_size:
+        shingles = words
+    else:
+        shingles = [
+            " ".join(words[idx : idx + shingle_size])
+            for idx in range(len(words) - shingle_size + 1)
+        ]
+    if not shingles:
+        return 0
+    hashes = _hash_features(shingles)
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1)
+    # Each bit of the signature is the majority vote of the shingles' bits
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    signature = np.packbits(votes > 0).view(np.uint64)[0]
+    return int(signature)
+
+
+class DuplicateFinder:
+    """Find the texts that duplicate an earlier text, one text at a time.
+
+    Texts are added in order, e.g., as the chunks of a document are made.
+    """
+
+    def __init__(self, *, threshold: float = 1.0) -> None:
+        """Initialize the finder.
+
+        Args:
+            threshold: Texts whose estimated similarity with an earlier text is
+                at least this value are near-duplicates of it. The similarity
+                is the fraction of matching bits in their SimHash signatures.
+                If 1 or more, only exact duplicates (up to case and whitespace)
+                are found.
+        """
+        self.max_distance = int((1 - threshold) * SIGNATURE_BITS)
+        self._num_texts = 0
+        self._seen: Dict[bytes, int] = {}
+        self._unique_indexes: List[int] = []
+        self._signatures = np.empty(16, dtype=np.uint64)
+
+    def add(self, text: str) -> Optional[int]:
+        """Add the next text.
+
+        Returns:
+            The index of the earlier text it duplicates, or None. Only texts
+            that are not duplicates themselves are referenced.
+        """
+        idx = self._num_texts
+        self._num_texts += 1
+        normalized = _normalize(text)
+        digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).digest()
+        if digest in self._seen:
+            return self._seen[digest]
+        if self.max_distance > 0:
+            signature = simhash(normalized)
+            num_unique = len(self._unique_indexes)
+            if num_unique:
+                distances = _popcount(
+                    self._signatures[:num_unique] ^ np.uint64(signature)
+                )
+                closest = int(np.argmin(distances))
+                if distances[closest] <= self.max_distance:
+                    return self._unique_indexes[closest]
+            if num_unique == len(self._signatures):
+                self._signatures = np.resize(self._signatures, 2 * num_unique)
+            self._signatures[num_unique] = signature
+        self._seen[digest] = idx
+        self._unique_indexes.append(idx)
+        return None
+
+
+def find_duplicates(
+    texts: Sequence[str], *, threshold: float = 1.0
+) -> List[Optional[int]]:
+    """Find the texts that duplicate an earlier text.
+
+    Args:
+        texts: The texts to check, e.g., the chunks of a document.
+        threshold: Texts whose estimated similarity with an earlier text is at
+            least this value are near-duplicates of it (see `DuplicateFinder`).
+
+    Returns:
+        For each text, the index of the earlier text it duplicates, or None.
+        Only texts that are not duplicates themselves are referenced.
+    """
+    finder = DuplicateFinder(threshold=threshold)
+    return [finder.add(text) for text in texts]
@@ -0,0 +1,104 @@
+"""Embed texts locally, on the CPU, without a model.
+
+Texts are embedded as hashed bags of character n-grams (the "hashing trick"):
+each n-gram of the lowercased text is hashed to one of `num_features`
+dimensions with a random sign, counts are dampened logarithmically and the
+vectors are normalized. Texts sharing many n-grams get similar vectors, which
+is enough to rank the chunks of a document against a query.
+
+The n-grams of a whole batch of texts are hashed at once with NumPy.
+"""
+from __future__ import annotations
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Multiplier of the polynomial rolling hash of the n-grams.
+_HASH_MULTIPLIER = np.uint64(0x100000001B3)
+
+
+def _encode_texts(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate the normalized bytes of texts.
+
+    Returns:
+        The bytes of every text, and the offset of each text in them.
+    """
+    encoded = [" ".join(text.lower().split()).encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(data) for data in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+    return data, offsets
+
+
+def hash_ngrams(
+    texts: Sequence[str],
+    *,
+    num_features: int,
+    ngram_range: Tuple[int, int] = (3, 5),
+) -> np.ndarray:
+    """Count the hashed character n-grams of texts.
+
+    Args:
+        texts: The texts to vectorize.
+        num_features: The number of dimensions n-grams are hashed to.
+        ngram_range: The min and max lengths of the n-grams.
+
+    Returns:
+        A (len(texts), num_features) array of signed n-gram counts.
+    """
+    data, offsets = _encode_texts(texts)
+    rows = np.repeat(np.arange(len(texts)), np.diff(offsets))
+    counts = np.zeros(len(texts) * num_features, dtype=np.float64)
+    min_n, max_n = ngram_range
+    hashes = np.zeros(len(data), dtype=np.uint64)
+    for n in range(1, max_n + 1):
+        # hashes[i] is the hash of the n bytes starting at i
+        num_ngrams = len(data) - n + 1
+        if num_ngrams <= 0:
+            break
+        hashes = hashes[:num_ngrams] * _HASH_MULTIPLIER + data[n - 1 :]
+        if n < min_n:
+            continue
+        # Only keep the n-grams that do not cross the end of their text
+        starts = np.arange(num_ngrams)
+        valid = starts + n <= offsets[rows[:num_ngrams] + 1]
+        ngram_hashes = hashes[valid]
+        ngram_rows = rows[:num_ngrams][valid]
+        mixed = ngram_hashes ^ (ngram_hashes >> np.uint64(29))
+        columns = (mixed % np.uint64(num_features)).astype(np.int64)
+        signs = np.where((mixed >> np.uint64(61)) & np.uint64(1), -1.0, 1.0)
+        counts += np.bincount(
+            ngram_rows * num_features + columns,
+            weights=signs,
+            minlength=len(counts),
+        )
+    return counts.reshape(len(texts), num_features)
+
+
+class HashingEmbeddings(Embeddings):
+    """Embeddings computed locally from hashed character n-grams."""
+
+    def __init__(
+        self, num_features: int = 1024, ngram_range: Tuple[int, int] = (3, 5)
+    ) -> None:
+        self.num_features = num_features
+        self.ngram_range = ngram_range
+        self.model = f"hashing-{num_features}-{ngram_range[0]}-{ngram_range[1]}"
+
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        counts = hash_ngrams(
+            texts, num_features=self.num_features, ngram_range=self.ngram_range
+        )
+        vectors = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
@@ -0,0 +1,347 @@
+"""Extract the main text of HTML pages, without their boilerplate.
+
+Scraped pages carry navigation menus, cookie banners, share buttons and footers
+around their content, which are extracted as text by `BS4HTMLParser` and
+inflate the tokens of every chunk. This parser streams the HTML through the
+lxml (libxml2) parser without building a tree, and:
+
+* skips elements which never hold content (scripts, styles, forms, ...) or
+  which are marked as boilerplate by their tag, role, id or classes (``nav``,
+  ``footer``, ``cookie-banner``, ...),
+* drops list items and containers (``ul``, ``div``, ...) of several links
+  whose text is mostly made of links, e.g., menus,
+* keeps headings and paragraphs as separate blocks of text, headings being
+  prefixed with ``#`` as in markdown.
+"""
+from __future__ import annotations
+
+import codecs
+import re
+from typing import Dict, Iterator, List
+
+from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
+from langchain_core.documents import Document
+from lxml import etree
+
+# Elements whose text is never content.
+SKIPPED_TAGS = frozenset(
+    [
+        "button",
+        "canvas",
+        "dialog",
+        "form",
+        "head",
+        "iframe",
+        "input",
+        "select",
+        "math",
+        "noscript",
+        "object",
+        "script",
+        "style",
+        "svg",
+        "template",
+        "textarea",
+    ]
+)
+
+# Elements which are boilerplate by definition.
+BOILERPLATE_TAGS = frozenset(["aside", "footer", "nav"])
+
+BOILERPLATE_ROLES = frozenset(
+    ["banner", "complementary", "contentinfo", "dialog", "navigation", "search"]
+)
+
+# Elements with one of these ids or classes are boilerplate. Only whole names
+# match, e.g., "sidebar" but not "has-sidebar".
+BOILERPLATE_NAMES = frozenset(
+    [
+        "ad",
+        "ads",
+        "advert",
+        "advertisement",
+        "banner",
+        "breadcrumb",
+        "breadcrumbs",
+        "comments",
+        "consent",
+        "cookie",
+        "cookie-banner",
+        "cookie-consent",
+        "cookie-notice",
+        "cookies",
+        "footer",
+        "gdpr",
+        "menu",
+        "modal",
+        "nav",
+        "navbar",
+        "navigation",
+        "newsletter",
+        "popup",
+        "related",
+        "share",
+        "sharing",
+        "sidebar",
+        "site-footer",
+        "site-nav",
+        "social",
+        "social-share",
+        "sponsored",
+        "subscribe",
+        "toolbar",
+    ]
+)
+
+# Elements holding the content of a page, never considered boilerplate from
+# their ids or classes.
+CONTENT_TAGS = frozenset(["article", "body", "html", "main"])
+
+# Elements starting and ending a block of text.
+BLOCK_TAGS = frozenset(
+    [
+        "address",
+        "article",
+        "blockquote",
+        "body",
+        "caption",
+        "dd",
+        "div",
+        "dl",
+        "dt",
+        "figcaption",
+        "figure",
+        "h1",
+        "h2",
+        "h3",
+        "h4",
+        "h5",
+        "h6",
+        "header",
+        "hr",
+        "li",
+        "main",
+        "ol",
+        "p",
+        "pre",
+        "section",
+        "table",
+        "tr",
+        "ul",
+    ]
+)
+
+# Blocks containing other blocks, dropped as a whole when mostly made of links.
+CONTAINER_TAGS = frozenset(["div", "dl", "header", "ol", "section", "table", "ul"])
+
+# Containers are only dropped with at least this many links, so that a single
+# link (e.g., in a short paragraph) is never dropped.
+MIN_CONTAINER_LINKS = 3
+
+# Items of lists, dropped when mostly made of links.
+LIST_ITEM_TAGS = frozenset(["dd", "dt", "li"])
+
+HEADING_TAGS = {f"h{level}": level for level in range(1, 7)}
+
+_WHITESPACE = re.compile(r"\s+")
+
+# The charset declared by a page, looked up in its leading bytes.
+_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.I)
+_CHARSET_SNIFF_BYTES = 4096
+
+# Size of the blocks of bytes fed to the parser.
+_FEED_BLOCK_SIZE = 64 * 1024
+
+
+def _get_encoding(head: bytes, default: str) -> str:
+    """Get the encoding declared by the leading bytes of a page, or a default.
+
+    libxml2 falls back to latin-1 for pages not declaring their charset.
+    """
+    match = _CHARSET.search(head)
+    if match:
+        try:
+            return codecs.lookup(match.group(1).decode("ascii")).name
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return default
+
+
+def _is_boilerplate(tag: str, attrib: Dict[str, str]) -> bool:
+    """Whether an element holds no content, based on its tag and attributes."""
+    if tag in SKIPPED_TAGS or tag in BOILERPLATE_TAGS:
+        return True
+    if tag in CONTENT_TAGS:
+        return False
+    if "hidden" in attrib or attrib.get("aria-hidden") == "true":
+        return True
+    if attrib.get("role") in BOILERPLATE_ROLES:
+        return True
+    style = attrib.get("style", "").replace(" ", "").lower()
+    if "display:none" in style or "visibility:hidden" in style:
+        return True
+    names = f"{attrib.get('id', '')} {attrib.get('class', '')}".lower().split()
+    return any(name in BOILERPLATE_NAMES for name in names)
+
+
+class _Container:
+    """An open container element, and the size of its text so far."""
+
+    __slots__ = ("first_block", "num_chars", "num_link_chars", "num_links")
+
+    def __init__(self, first_block: int) -> None:
+        self.first_block = first_block
+        self.num_chars = 0
+        self.num_link_chars = 0
+        self.num_links = 0
+
+
+class _TextTarget:
+    """An lxml parser target collecting the blocks of text of a page."""
+
+    def __init__(self, max_link_density: float) -> None:
+        self.max_link_density = max_link_density
+        self.blocks: List[str] = []
+        self.title = ""
+        self._containers: List[_Container] = []
+        # Tags of the open blocks, the last one holding the current text
+        self._block_tags: List[str] = []
+        # Depth of the open skipped element, 0 outside skipped elements
+        self._skip_depth = 0
+        self._skipped_tag = ""
+        self._in_title = False
+        self._link_depth = 0
+        self._pre_depth = 0
+        self._heading_level = 0
+        # Text of the current block
+        self._parts: List[str] = []
+        self._num_link_chars = 0
+
+    def _flush(self) -> None:
+        """End the current block, keeping it unless it is a link of a list."""
+        text = "".join(self._parts)
+        num_link_chars = self._num_link_chars
+        self._parts = []
+        self._num_link_chars = 0
+        if not self._pre_depth:
+            text = _WHITESPACE.sub(" ", text)
+        text = text.strip()
+        if not text:
+            return
+        for container in self._containers:
+            container.num_chars += len(text)
+            container.num_link_chars += num_link_chars
+        if self._heading_level:
+            self.blocks.append("#" * self._heading_level + " " + text)
+        elif (
+            not self._block_tags
+            or self._block_tags[-1] not in LIST_ITEM_TAGS
+            or num_link_chars <= self.max_link_density * len(text)
+        ):
+            self.blocks.append(text)
+
+    def start(self, tag: str, attrib: Dict[str, str]) -> None:
+        if self._skip_depth:
+            # Only the title of the head of the page, e.g., not of an icon
+            if tag == "title" and self._skip_depth == 1 and self._skipped_tag == "head":
+                self._in_title = not self.title
+            self._skip_depth += 1
+            return
+        if _is_boilerplate(tag, attrib):
+            self._skip_depth = 1
+            self._skipped_tag = tag
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+            self._block_tags.append(tag)
+            if tag in CONTAINER_TAGS:
+                self._containers.append(_Container(len(self.blocks)))
+            if tag in HEADING_TAGS:
+                self._heading_level = HEADING_TAGS[tag]
+            elif tag == "pre":
+                self._pre_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+            for container in self._containers:
+                container.num_links += 1
+        elif tag in ("br", "td", "th"):
+            self._parts.append(" ")
+
+    def end(self, tag: str) -> None:
+        if self._skip_depth:
+            self._in_title = False
+            self._skip_depth -= 1
+            return
+        if tag in BLOCK_TAGS:
+            self._flush()
+            if self._block_tags:
+                self._block_tags.pop()
+            if tag in HEADING_TAGS:
+                self._heading_level = 0
+            elif tag == "pre":
+                self._pre_depth = max(self._pre_depth - 1, 0)
+            if tag in CONTAINER_TAGS and self._containers:
+                container = self._containers.pop()
+                if (
+                    container.num_links >= MIN_CONTAINER_LINKS
+                    and container.num_link_chars
+                    > self.max_link_density * container.num_chars
+                ):
+                    del self.blocks[container.first_block :]
+        elif tag == "a":
+            self._link_depth = max(self._link_depth - 1, 0)
+
+    def data(self, data: str) -> None:
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self._parts.append(data)
+            if self._link_depth:
+                self._num_link_chars += len(data.strip())
+
+    def comment(self, text: str) -> None:
+        pass
+
+    def close(self) -> None:
+        self._flush()
+
+
+class LxmlHTMLParser(BaseBlobParser):
+    """Parse the main text of HTML pages with lxml, dropping boilerplate.
+
+    Yields a single document per page, with the title of the page in metadata
+    as `BS4HTMLParser` does. Blocks of text are separated by blank lines.
+    """
+
+    def __init__(self, *, max_link_density: float = 0.5) -> None:
+        """Initialize the parser.
+
+        Args:
+            max_link_density: List items, and containers of several links,
+                with a larger share of their text in links are dropped, e.g.,
+                menus.
+        """
+        self.max_link_density = max_link_density
+
+    def lazy_parse(self, blob: Blob) -> Iterator[Document]:
+        """Parse an HTML blob, fed to the parser block by block."""
+        target = _TextTarget(self.max_link_density)
+        with blob.as_bytes_io() as file:
+            data = file.read(_FEED_BLOCK_SIZE)
+            encoding = _get_encoding(data[:_CHARSET_SNIFF_BYTES], blob.encoding)
+            parser = etree.HTMLParser(target=target, encoding=encoding)
+            # libxml2 fails to close a parser fed with nothing
+            is_empty = not data
+            while data:
+                parser.feed(data)
+                data = file.read(_FEED_BLOCK_SIZE)
+        if not is_empty:
+            parser.close()
+        yield Document(
+            page_content="\n\n".join(target.blocks),
+            metadata={
+                "source": blob.source,
+                "title": _WHITESPACE.sub(" ", target.title).strip(),
+            },
+        )
@@ -1,19 +1,41 @@
 """Convert binary input to blobs and parse them using the appropriate parser."""
 from __future__ import annotations
 
-from typing import BinaryIO, List
+import hashlib
+import os
+import tempfile
+import threading
+import zipfile
+from typing import Any, BinaryIO, List, Tuple
 
 from fastapi import HTTPException
 from langchain.document_loaders.parsers import BS4HTMLParser, PDFMinerParser
 from langchain.document_loaders.parsers.generic import MimeTypeBasedParser
 from langchain.document_loaders.parsers.txt import TextParser
 from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
 from langchain_core.documents import Document
 
+from extraction.html import LxmlHTMLParser
+
+# Parser of HTML files, one of "bs4" (text of the whole page, with Beautiful
+# Soup) or "lxml" (main text of the page, without boilerplate like menus).
+HTML_PARSER = os.environ.get("HTML_PARSER", "bs4")
+
+
+def _make_html_parser(name: str) -> BaseBlobParser:
+    if name == "bs4":
+        return BS4HTMLParser()
+    elif name == "lxml":
+        return LxmlHTMLParser()
+    else:
+        raise ValueError(f"Invalid HTML parser {name}. Expected one of 'bs4', 'lxml'.")
+
+
 HANDLERS = {
     "application/pdf": PDFMinerParser(),
     "text/plain": TextParser(),
-    "text/html": BS4HTMLParser(),
+    "text/html": _make_html_parser(HTML_PARSER),
     # Disable for now as they rely on unstructured and there's some install
     # issue with unstructured.
     # from langchain.document_loaders.parsers.msword import MsWordParser
@@ -25,21 +47,40 @@ HANDLERS = {
 
 SUPPORTED_MIMETYPES = sorted(HANDLERS.keys())
 
-MAX_FILE_SIZE_MB = 10  # in MB
+MAX_FILE_SIZE_MB = int(os.environ.get("MAX_FILE_SIZE_MB", 10))  # in MB
 
+# The mime-type of a file is guessed from its leading bytes only.
+MIMETYPE_SNIFF_BYTES = 64 * 1024
 
-def _guess_mimetype(file_bytes: bytes) -> str:
-    """Guess the mime-type of a file."""
-    try:
-        import magic
-    except ImportError as e:
-        raise ImportError(
-            "magic package not found, please install it with `pip install python-magic`"
-        ) from e
+# Version of the texts parsed from files. Bump it whenever a change of the
+# parsers (or of their dependencies) changes the parsed texts, so that parsed
+# documents cached by a previous version are not reused.
+PARSER_VERSION = "2"
 
-    mime = magic.Magic(mime=True)
-    mime_type = mime.from_buffer(file_bytes)
-    return mime_type
+# Size of the blocks uploaded files are copied by.
+_COPY_BLOCK_SIZE = 1024 * 1024
+
+# libmagic handles are costly to create and not thread safe, so each thread
+# reuses its own.
+_MAGIC = threading.local()
+
+
+def _get_magic() -> Any:
+    if not hasattr(_MAGIC, "handle"):
+        try:
+            import magic
+        except ImportError as e:
+            raise ImportError(
+                "magic package not found, please install it with "
+                "`pip install python-magic`"
+            ) from e
+        _MAGIC.handle = magic.Magic(mime=True)
+    return _MAGIC.handle
+
+
+def _guess_mimetype(file_bytes: bytes) -> str:
+    """Guess the mime-type of a file from its leading bytes."""
+    return _get_magic().from_buffer(file_bytes[:MIMETYPE_SNIFF_BYTES])
 
 
 def _get_file_size_in_mb(data: BinaryIO) -> float:
@@ -59,16 +100,18 @@ MIMETYPE_BASED_PARSER = MimeTypeBasedParser(
 )
 
 
-def convert_binary_input_to_blob(data: BinaryIO) -> Blob:
-    """Convert ingestion input to blob."""
-    file_size_in_mb = _get_file_size_in_mb(data)
-
+def _check_file_size(file_size_in_mb: float) -> None:
     if file_size_in_mb > MAX_FILE_SIZE_MB:
         raise HTTPException(
             status_code=413,
             detail=f"File size exceeds the maximum limit of {MAX_FILE_SIZE_MB} MB.",
         )
 
+
+def convert_binary_input_to_blob(data: BinaryIO) -> Blob:
+    """Convert ingestion input to blob."""
+    _check_file_size(_get_file_size_in_mb(data))
+
     file_data = data.read()
     mimetype = _guess_mimetype(file_data)
     file_name = data.name
@@ -80,7 +123,71 @@ def convert_binary_input_to_blob(data: BinaryIO) -> Blob:
     )
 
 
+def _copy_to_temporary_file(data: BinaryIO) -> Tuple[str, str, str]:
+    """Copy binary input block by block to a temporary file, checking its size.
+
+    Returns the path of the file, the mime-type guessed from the leading bytes
+    of the input and the SHA-256 digest of the input.
+    """
+    head = data.read(MIMETYPE_SNIFF_BYTES)
+    mimetype = _guess_mimetype(head)
+    digest = hashlib.sha256(head)
+    file = tempfile.NamedTemporaryFile(prefix="upload-", delete=False)
+    try:
+        with file:
+            file.write(head)
+            num_bytes = len(head)
+            while True:
+                block = data.read(_COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                num_bytes += len(block)
+                # The size of streams is only known once they are read
+                _check_file_size(num_bytes / (1024 * 1024))
+                digest.update(block)
+                file.write(block)
+    except BaseException:
+        os.remove(file.name)
+        raise
+    return file.name, mimetype, digest.hexdigest()
+
+
+def spool_binary_input(data: BinaryIO) -> Blob:
+    """Copy binary input to a temporary file, as a blob read from that file.
+
+    The input is copied block by block, so it is never held in memory, and its
+    mime-type is guessed from its leading bytes. Parsers read the blob from
+    the file on disk. The SHA-256 digest of the input is computed while it is
+    copied, and set as the "sha256" metadata of the blob.
+
+    The caller removes the file (at `blob.path`) once the blob is parsed.
+    """
+    _check_file_size(_get_file_size_in_mb(data))
+    path, mimetype, digest = _copy_to_temporary_file(data)
+    return Blob.from_path(path, mime_type=mimetype, metadata={"sha256": digest})
+
+
+def spool_archive_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> Blob:
+    """Decompress a file of a zip archive to a temporary file, as a blob.
+
+    The size declared by the archive is checked before the file is read, and
+    bounds the decompressed bytes (so a small archive cannot decompress to an
+    arbitrary size). The file is decompressed block by block, never held in
+    memory.
+
+    The caller removes the file (at `blob.path`) once the blob is parsed.
+    """
+    _check_file_size(info.file_size / (1024 * 1024))
+    with archive.open(info) as member:
+        path, mimetype, digest = _copy_to_temporary_file(member)
+    return Blob.from_path(path, mime_type=mimetype, metadata={"sha256": digest})
+
+
+def parse_blob(blob: Blob) -> List[Document]:
+    """Parse a blob with the parser of its mimetype."""
+    return MIMETYPE_BASED_PARSER.parse(blob)
+
+
 def parse_binary_input(data: BinaryIO) -> List[Document]:
     """Parse binary input."""
-    blob = convert_binary_input_to_blob(data)
-    return MIMETYPE_BASED_PARSER.parse(blob)
+    return parse_blob(convert_binary_input_to_blob(data))
@@ -0,0 +1,141 @@
+"""Extract the text of PDFs page by page, so pages can be parsed in parallel.
+
+A PDF is split into ranges of pages, each range is parsed independently (e.g.,
+in its own process) and the texts of the pages are reassembled in order into
+one document per page.
+
+PDFs are given either as bytes or as the path of a file, which is memory-mapped
+by every process parsing it rather than copied to them.
+"""
+from __future__ import annotations
+
+import io
+import math
+import mmap
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, List, Optional, Sequence, Union
+
+from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
+from langchain_core.documents import Document
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+
+@contextmanager
+def _open_pdf(source: Union[bytes, str]) -> Iterator[BinaryIO]:
+    """Open PDF bytes, or memory-map a PDF file."""
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+        return
+    with open(source, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        yield mapped  # type: ignore[misc]
+
+
+def count_pages(source: Union[bytes, str]) -> int:
+    """Count the pages of a PDF, without parsing their content."""
+    with _open_pdf(source) as file:
+        document = PDFDocument(PDFParser(file))
+        return sum(1 for _ in PDFPage.create_pages(document))
+
+
+def split_page_ranges(
+    num_pages: int, max_ranges: int, *, min_pages_per_range: int = 1
+) -> List[range]:
+    """Split the pages of a PDF into contiguous ranges of similar sizes.
+
+    Args:
+        num_pages: The number of pages of the PDF.
+        max_ranges: Max number of ranges, e.g., the number of workers.
+        min_pages_per_range: Ranges have at least this many pages (except
+            when the PDF is shorter), as each range re-reads the PDF structure.
+    """
+    if num_pages <= 0:
+        return []
+    num_ranges = max(
+        1, min(max_ranges, num_pages // max(min_pages_per_range, 1), num_pages)
+    )
+    size = math.ceil(num_pages / num_ranges)
+    return [
+        range(start, min(start + size, num_pages))
+        for start in range(0, num_pages, size)
+    ]
+
+
+def extract_page_texts(source: Union[bytes, str], pages: range) -> List[str]:
+    """Extract the text of a range of pages of a PDF (bytes or file path).
+
+    The text of each page is the same as `pdfminer.high_level.extract_text`
+    extracts, without the form feed ending each page.
+    """
+    output = io.StringIO()
+    manager = PDFResourceManager()
+    texts = []
+    with _open_pdf(source) as file, TextConverter(
+        manager, output, laparams=LAParams()
+    ) as device:
+        interpreter = PDFPageInterpreter(manager, device)
+        for page in PDFPage.get_pages(file, pagenos=pages):
+            interpreter.process_page(page)
+            texts.append(output.getvalue().rstrip("\f"))
+            output.seek(0)
+            output.truncate(0)
+    return texts
+
+
+def get_pdf_source(blob: Blob) -> Union[bytes, str]:
+    """Get the path of a PDF blob read from a file, or its bytes."""
+    if blob.data is None and blob.path is not None:
+        return str(blob.path)
+    return blob.as_bytes()
+
+
+def make_page_documents(
+    page_texts: Sequence[Sequence[str]], source: Optional[str]
+) -> List[Document]:
+    """Reassemble the texts of ranges of pages into one document per page."""
+    return [
+        Document(page_content=text, metadata={"source": source, "page": page})
+        for page, text in enumerate(text for texts in page_texts for text in texts)
+    ]
+
+
+class ParallelPDFParser(BaseBlobParser):
+    """Parse PDFs with ranges of pages parsed concurrently by an executor.
+
+    Yields one document per page, with the (0-based) page number in metadata.
+    """
+
+    def __init__(
+        self, executor: Executor, *, max_workers: int, min_pages_per_range: int = 8
+    ) -> None:
+        """Initialize the parser.
+
+        Args:
+            executor: Parses the ranges of pages, e.g., a `ProcessPoolExecutor`.
+            max_workers: Max number of ranges parsed concurrently.
+            min_pages_per_range: Min number of pages parsed by each worker.
+        """
+        self.executor = executor
+        self.max_workers = max_workers
+        self.min_pages_per_range = min_pages_per_range
+
+    def lazy_parse(self, blob: Blob) -> Iterator[Document]:
+        """Parse the pages of a PDF blob."""
+        source = get_pdf_source(blob)
+        page_ranges = split_page_ranges(
+            count_pages(source),
+            self.max_workers,
+            min_pages_per_range=self.min_pages_per_range,
+        )
+        page_texts = self.executor.map(
+            extract_page_texts, [source] * len(page_ranges), page_ranges
+        )
+        yield from make_page_documents(list(page_texts), blob.source)
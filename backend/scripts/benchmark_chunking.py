@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Benchmark the token chunker against langchain's TokenTextSplitter.
+
+Usage:
+    python -m scripts.benchmark_chunking --size 1 --size 10 --size 50
+"""
+import random
+import time
+import tracemalloc
+from typing import Callable, Sequence, Tuple
+
+import click
+from langchain.text_splitter import TokenTextSplitter
+
+from extraction.chunking import TokenChunker, get_encoding
+from scripts.synthetic_text import make_sentence
+
+
+def _make_document(size_in_mb: int, seed: int = 0) -> str:
+    """Make a synthetic document of about `size_in_mb` megabytes."""
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+    while size < size_in_mb * 1_000_000:
+        paragraph = make_sentence(rng, 40, 200).capitalize() + "."
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def _measure(split: Callable[[], Sequence[str]]) -> Tuple[float, float, int]:
+    """Measure the time (s) and peak memory (MB) of a split, and its chunk count."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = split()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, len(chunks)
+
+
+@click.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=int,
+    multiple=True,
+    default=(1, 10, 50),
+    help="Document size in MB, can be repeated.",
+)
+@click.option("--chunk-size", type=int, default=3_000, help="Chunk size in tokens.")
+@click.option("--encoding-name", default="cl100k_base", help="tiktoken encoding.")
+def main(sizes: Sequence[int], chunk_size: int, encoding_name: str) -> None:
+    """Compare splitting time and memory on synthetic documents."""
+    encoding = get_encoding(encoding_name)
+    splitter = TokenTextSplitter(
+        encoding_name=encoding_name, chunk_size=chunk_size, chunk_overlap=20
+    )
+    chunker = TokenChunker(encoding, chunk_size=chunk_size, chunk_overlap=20)
+    click.echo(f"{'size':>6} {'splitter':>24} {'chunker':>24} {'chunks':>8}")
+    for size in sizes:
+        document = _make_document(size)
+        splitter_time, splitter_memory, num_chunks = _measure(
+            lambda: splitter.split_text(document)
+        )
+        chunker_time, chunker_memory, _ = _measure(lambda: chunker.split_text(document))
+        click.echo(
+            f"{size:>4}MB "
+            f"{splitter_time:>10.2f}s {splitter_memory:>10.1f}MB "
+            f"{chunker_time:>10.2f}s {chunker_memory:>10.1f}MB "
+            f"{num_chunks:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
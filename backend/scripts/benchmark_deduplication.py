@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Benchmark the deduplicator against deduplicating with a set of JSON strings.
+
+Usage:
+    python -m scripts.benchmark_deduplication --num-items 100000 --num-items 500000
+"""
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import click
+
+from server.deduplication import Deduplicator
+
+
+def _make_responses(
+    num_items: int, duplicate_ratio: float, seed: int = 0
+) -> List[Dict[str, Any]]:
+    """Make chunk responses holding `num_items` items, some of them repeated."""
+    rng = random.Random(seed)
+    num_unique = max(1, int(num_items * (1 - duplicate_ratio)))
+    responses = []
+    for start in range(0, num_items, 100):
+        data = []
+        for _ in range(min(100, num_items - start)):
+            idx = rng.randrange(num_unique)
+            data.append(
+                {
+                    "name": f"Person {idx}",
+                    "role": "Director of something rather important",
+                    "company": f"Company {idx % 1000}",
+                    "description": f"A longer description of person {idx}. " * 3,
+                }
+            )
+        responses.append({"data": data})
+    return responses
+
+
+def _deduplicate_with_strings(responses: Sequence[Dict[str, Any]]) -> List[Any]:
+    """The previous implementation, keeping the serialized items in a set."""
+    unique_extracted = []
+    seen = set()
+    for response in responses:
+        for data_item in response["data"]:
+            serialized = json.dumps(data_item, sort_keys=True)
+            if serialized not in seen:
+                seen.add(serialized)
+                unique_extracted.append(data_item)
+    return unique_extracted
+
+
+def _deduplicate_with_digests(
+    responses: Sequence[Dict[str, Any]], max_memory_items: int
+) -> List[Any]:
+    unique_extracted = []
+    with Deduplicator(max_memory_items=max_memory_items) as deduplicator:
+        for response in responses:
+            unique_extracted.extend(deduplicator.filter(response["data"]))
+    return unique_extracted
+
+
+def _measure(deduplicate: Callable[[], List[Any]]) -> Tuple[float, float, int]:
+    """Measure the time (s) and peak memory (MB) of a run, and the unique items.
+
+    Memory is traced in a separate run, since tracing slows down the code.
+    """
+    start = time.perf_counter()
+    unique = deduplicate()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    deduplicate()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1e6, len(unique)
+
+
+@click.command()
+@click.option(
+    "--num-items",
+    "sizes",
+    type=int,
+    multiple=True,
+    default=(10_000, 100_000, 500_000),
+    help="Number of extracted items, can be repeated.",
+)
+@click.option("--duplicate-ratio", type=float, default=0.5)
+@click.option(
+    "--max-memory-items",
+    type=int,
+    default=100_000,
+    help="Digests kept in memory before spilling to disk.",
+)
+def main(sizes: Sequence[int], duplicate_ratio: float, max_memory_items: int) -> None:
+    """Compare deduplication time and memory on synthetic responses."""
+    header = f"{'items':>8} {'strings':>22} {'digests':>22} {'spilled':>22}"
+    click.echo(header)
+    for num_items in sizes:
+        responses = _make_responses(num_items, duplicate_ratio)
+        results = [
+            _measure(lambda: _deduplicate_with_strings(responses)),
+            _measure(lambda: _deduplicate_with_digests(responses, 0)),
+            _measure(lambda: _deduplicate_with_digests(responses, max_memory_items)),
+        ]
+        assert len({num_unique for _, _, num_unique in results}) == 1
+        click.echo(
+            f"{num_items:>8} "
+            + " ".join(
+                f"{elapsed:>10.2f}s {memory:>9.1f}MB" for elapsed, memory, _ in results
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
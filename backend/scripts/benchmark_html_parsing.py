@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+"""Benchmark parsing HTML pages with Beautiful Soup against lxml.
+
+The corpus is made of synthetic scraped pages: an article surrounded by a
+cookie banner, navigation menus, a sidebar of related links and a footer. The
+parsing time and the number of tokens of the parsed text are compared.
+
+Usage:
+    python -m scripts.benchmark_html_parsing --paragraphs 50 --paragraphs 500
+"""
+import random
+import time
+from typing import List, Sequence, Tuple
+
+import click
+from langchain.document_loaders.parsers import BS4HTMLParser
+from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
+
+from extraction.chunking import get_encoding
+from extraction.html import LxmlHTMLParser
+from scripts.synthetic_text import make_sentence
+
+
+def _links(rng: random.Random, count: int) -> str:
+    return "".join(
+        f'<li><a href="/{idx}">{make_sentence(rng, 1, 3).title()}</a></li>'
+        for idx in range(count)
+    )
+
+
+def make_html_page(num_paragraphs: int, seed: int = 0) -> bytes:
+    """Make a synthetic scraped page with an article of `num_paragraphs`."""
+    rng = random.Random(seed)
+    article: List[str] = [f"<h1>{make_sentence(rng, 4, 8).capitalize()}</h1>"]
+    for idx in range(num_paragraphs):
+        if idx % 10 == 0:
+            article.append(f"<h2>{make_sentence(rng, 3, 6).capitalize()}</h2>")
+        article.append(
+            f"<p>{make_sentence(rng, 30, 80).capitalize()} "
+            f'<a href="/ref/{idx}">{make_sentence(rng, 1, 3)}</a> '
+            f"{make_sentence(rng, 10, 30)}.</p>"
+        )
+    page = [
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+        f"<title>{make_sentence(rng, 3, 6).title()}</title>",
+        "<style>body { font-family: sans-serif; } .menu li { display: inline; }",
+        "</style><script>window.dataLayer = window.dataLayer || [];</script>",
+        "</head><body>",
+        '<div class="cookie-banner"><p>We use cookies to improve your experience. ',
+        "By continuing to browse the site you agree to our use of cookies.</p>",
+        "<button>Accept</button></div>",
+        f'<header><div class="logo">Site</div><ul class="menu">{_links(rng, 12)}',
+        "</ul></header>",
+        f'<div class="container"><ul>{_links(rng, 6)}</ul>',
+        f"<main><article>{''.join(article)}</article></main>",
+        f"<aside><h3>Related</h3><ul>{_links(rng, 20)}</ul></aside></div>",
+        f"<footer><ul>{_links(rng, 30)}</ul><p>Copyright 2024 Site.</p></footer>",
+        "<script>track('page_view');</script></body></html>",
+    ]
+    return "".join(page).encode("utf-8")
+
+
+def _measure(parser: BaseBlobParser, blob: Blob, repeat: int) -> Tuple[float, str]:
+    """Measure the mean parsing time of a blob, and get its parsed text."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        (document,) = parser.parse(blob)
+    return (time.perf_counter() - start) / repeat, document.page_content
+
+
+@click.command()
+@click.option(
+    "--paragraphs",
+    "paragraph_counts",
+    type=int,
+    multiple=True,
+    default=(10, 100, 1_000),
+    help="Number of paragraphs of the article of a page, can be repeated.",
+)
+@click.option("--repeat", type=int, default=5, help="Parses of each page.")
+@click.option("--encoding-name", default="cl100k_base", help="tiktoken encoding.")
+def main(paragraph_counts: Sequence[int], repeat: int, encoding_name: str) -> None:
+    """Compare the parsing time and the parsed tokens of synthetic pages."""
+    encoding = get_encoding(encoding_name)
+    parsers = {"bs4": BS4HTMLParser(), "lxml": LxmlHTMLParser()}
+    click.echo(
+        f"{'paragraphs':>10} {'size':>8} "
+        + " ".join(f"{f'{name} time':>10} {f'{name} tokens':>11}" for name in parsers)
+    )
+    for num_paragraphs in paragraph_counts:
+        data = make_html_page(num_paragraphs)
+        blob = Blob.from_data(data, path=f"{num_paragraphs}.html")
+        row = f"{num_paragraphs:>10} {len(data) / 1e3:>6.0f}KB"
+        for parser in parsers.values():
+            elapsed, text = _measure(parser, blob, repeat)
+            num_tokens = len(encoding.encode_ordinary(text))
+            row += f" {elapsed * 1e3:>8.1f}ms {num_tokens:>11}"
+        click.echo(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""Benchmark parsing PDFs serially against parsing ranges of pages in parallel.
+
+The corpus is made of synthetic text-only PDFs with hundreds of pages.
+
+Usage:
+    python -m scripts.benchmark_pdf_parsing --pages 100 --pages 300 --workers 4
+"""
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence
+
+import click
+from langchain.document_loaders.parsers import PDFMinerParser
+from langchain_community.document_loaders import Blob
+from langchain_community.document_loaders.base import BaseBlobParser
+
+from extraction.pdf import ParallelPDFParser
+from scripts.synthetic_text import make_sentence
+
+LINES_PER_PAGE = 60
+
+
+def _make_page_stream(rng: random.Random) -> bytes:
+    """Make the content stream of a page of random text lines."""
+    lines = []
+    for _ in range(LINES_PER_PAGE):
+        line = make_sentence(rng, 8, 14).capitalize()
+        lines.append(f"({line}) '")
+    return f"BT /F1 10 Tf 12 TL 50 790 Td {' '.join(lines)} ET".encode("ascii")
+
+
+def make_pdf(num_pages: int, seed: int = 0) -> bytes:
+    """Make a synthetic PDF with `num_pages` pages of text."""
+    rng = random.Random(seed)
+    # Objects 1 to 3 are the catalog, the page tree and the font, followed by
+    # a page and its content stream for every page.
+    page_ids = [4 + 2 * idx for idx in range(num_pages)]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            f"<< /Type /Pages /Count {num_pages} "
+            f"/Kids [{' '.join(f'{page_id} 0 R' for page_id in page_ids)}] >>"
+        ).encode("ascii"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id in page_ids:
+        stream = _make_page_stream(rng)
+        objects.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+            ).encode("ascii")
+        )
+        objects.append(
+            f"<< /Length {len(stream)} >>\nstream\n".encode("ascii")
+            + stream
+            + b"\nendstream"
+        )
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for object_id, content in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{object_id} 0 obj\n".encode("ascii") + content + b"\nendobj\n"
+    xref_offset = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        pdf += f"{offset:010d} 00000 n \n".encode("ascii")
+    pdf += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode("ascii")
+    return bytes(pdf)
+
+
+def _measure(parser: BaseBlobParser, blob: Blob) -> float:
+    start = time.perf_counter()
+    parser.parse(blob)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option(
+    "--pages",
+    "page_counts",
+    type=int,
+    multiple=True,
+    default=(100, 300, 600),
+    help="Number of pages of a PDF of the corpus, can be repeated.",
+)
+@click.option(
+    "--workers",
+    "worker_counts",
+    type=int,
+    multiple=True,
+    default=(2, 4),
+    help="Number of parsing processes, can be repeated.",
+)
+def main(page_counts: Sequence[int], worker_counts: Sequence[int]) -> None:
+    """Compare the parsing time of synthetic PDFs."""
+    blobs: List[Blob] = [
+        Blob.from_data(make_pdf(num_pages), path=f"{num_pages}.pdf")
+        for num_pages in page_counts
+    ]
+    header = f"{'pages':>6} {'size':>8} {'serial':>9}"
+    header += "".join(f" {f'{workers} workers':>11}" for workers in worker_counts)
+    click.echo(header)
+
+    # The pools are started (and their processes import pdfminer) beforehand
+    context = multiprocessing.get_context("spawn")
+    pools = [
+        ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        for workers in worker_counts
+    ]
+    parsers = [
+        ParallelPDFParser(pool, max_workers=workers)
+        for pool, workers in zip(pools, worker_counts)
+    ]
+    try:
+        for parser in parsers:
+            parser.parse(Blob.from_data(make_pdf(8 * parser.max_workers), path="w"))
+        for num_pages, blob in zip(page_counts, blobs):
+            row = f"{num_pages:>6} {len(blob.as_bytes()) / 1e6:>6.1f}MB"
+            row += f" {_measure(PDFMinerParser(), blob):>8.2f}s"
+            for parser in parsers:
+                row += f" {_measure(parser, blob):>10.2f}s"
+            click.echo(row)
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,7 @@
 # -o pipefail: fail if a command in a pipe has a nonzero exit code
 set -euxo pipefail
 
-# For now just create the db if it doesn't exist
-python -m scripts.run_migrations create
+# Create the tables, and the columns added to existing tables, if missing
+python -m scripts.run_migrations upgrade
 
 uvicorn server.main:app --host 0.0.0.0 --port 8000 --reload
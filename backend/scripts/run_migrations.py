@@ -1,10 +1,46 @@
 #!/usr/bin/env python
 """Run migrations."""
+from typing import List
+
 import click
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
 
 from db.models import ENGINE, Base
 
 
+def add_missing_columns(engine: Engine) -> List[str]:
+    """Add the columns of the models that are missing from existing tables.
+
+    `create_all` creates the missing tables but never alters existing ones.
+    The columns added to existing tables must be nullable or have a server
+    default, so that existing rows get a value.
+
+    Returns:
+        The added columns, as "table.column".
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    compiler = engine.dialect.ddl_compiler(engine.dialect, None)
+    added = []
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in columns:
+                    continue
+                connection.execute(
+                    text(
+                        f"ALTER TABLE {compiler.preparer.format_table(table)} "
+                        f"ADD COLUMN {compiler.get_column_specification(column)}"
+                    )
+                )
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
 @click.group()
 def cli():
     """Database migration commands."""
@@ -18,6 +54,15 @@ def create():
     click.echo("All tables created successfully.")
 
 
+@cli.command()
+def upgrade():
+    """Create the missing tables and add the missing columns of existing tables."""
+    Base.metadata.create_all(ENGINE)
+    for column in add_missing_columns(ENGINE):
+        click.echo(f"Added column {column}.")
+    click.echo("All tables upgraded successfully.")
+
+
 @cli.command()
 @click.confirmation_option(prompt="Are you sure you want to drop all tables?")
 def drop():
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Run a worker extracting the chunks of extraction jobs.
+
+Workers pull chunks from the database, so any number of them can run on any
+number of nodes next to (or instead of) the API processes. Set
+RUN_JOBS_IN_PROCESS=false on the API processes to leave every chunk to them.
+
+Usage:
+    python -m scripts.run_worker --concurrency 32
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import click
+
+from db.models import SessionClass
+from server import settings
+from server.jobs import Worker
+
+
+@click.command()
+@click.option(
+    "--concurrency",
+    type=int,
+    default=settings.JOB_WORKER_CONCURRENCY,
+    show_default=True,
+    help="Max number of chunks extracted at once.",
+)
+@click.option(
+    "--lease-seconds",
+    type=int,
+    default=settings.JOB_CHUNK_LEASE_SECONDS,
+    show_default=True,
+    help="Time after which the chunks of a dead worker are claimed again.",
+)
+@click.option(
+    "--poll-interval",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="Time in seconds between polls of the queue when idle.",
+)
+@click.option("--worker-id", default=None, help="Identifies the worker in leases.")
+def main(
+    concurrency: int, lease_seconds: int, poll_interval: float, worker_id: Optional[str]
+) -> None:
+    """Extract the chunks of extraction jobs until interrupted."""
+    logging.basicConfig(level=logging.INFO)
+    worker = Worker(
+        SessionClass,
+        worker_id=worker_id,
+        concurrency=concurrency,
+        lease_seconds=lease_seconds,
+        poll_interval=poll_interval,
+    )
+    click.echo(f"Starting worker {worker.worker_id}.")
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        click.echo("Worker stopped.")
+
+
+if __name__ == "__main__":
+    main()
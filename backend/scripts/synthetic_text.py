@@ -0,0 +1,18 @@
+"""Synthetic text shared by the benchmark scripts.
+
+The text is made of random common English words, so that it tokenizes and
+parses like real prose while being reproducible from a seed.
+"""
+import random
+
+WORDS = (
+    "the of and to in is was for on that with as by at from his an were are which "
+    "this be or had first one their its new after but who not they have her she "
+    "two been other when there all during into school time may years more most "
+    "only over city some world would where later up such used many can state about"
+).split()
+
+
+def make_sentence(rng: random.Random, min_words: int, max_words: int) -> str:
+    """Make a lowercase sentence of `min_words` to `max_words` random words."""
+    return " ".join(rng.choices(WORDS, k=rng.randint(min_words, max_words)))
@@ -1,11 +1,12 @@
 """Endpoint for listing available chat models for extraction."""
-from typing import List
+from typing import Dict, List
 
 from fastapi import APIRouter
 from typing_extensions import TypedDict
 
 from extraction.parsing import MAX_FILE_SIZE_MB, SUPPORTED_MIMETYPES
-from server.models import SUPPORTED_MODELS
+from server.concurrency import CONCURRENCY_LIMITERS
+from server.models import DEFAULT_EMBEDDINGS, SUPPORTED_EMBEDDINGS, SUPPORTED_MODELS
 from server.settings import MAX_CHUNKS, MAX_CONCURRENCY
 
 router = APIRouter(
@@ -22,8 +23,11 @@ class ConfigurationResponse(TypedDict):
     accepted_mimetypes: List[str]
     max_file_size_mb: int
     max_concurrency: int
+    concurrency_limits: Dict[str, int]
     max_chunks: int
     models: List[dict]
+    embeddings: List[dict]
+    default_embeddings: str
 
 
 @router.get("")
@@ -38,8 +42,19 @@ def get() -> ConfigurationResponse:
             }
             for model, data in SUPPORTED_MODELS.items()
         ],
+        "embeddings": [
+            {
+                "name": name,
+                "description": data["description"],
+            }
+            for name, data in SUPPORTED_EMBEDDINGS.items()
+        ],
+        "default_embeddings": DEFAULT_EMBEDDINGS,
         "accepted_mimetypes": SUPPORTED_MIMETYPES,
         "max_file_size_mb": MAX_FILE_SIZE_MB,
         "max_concurrency": MAX_CONCURRENCY,
+        "concurrency_limits": {
+            model: limiter.limit for model, limiter in CONCURRENCY_LIMITERS.items()
+        },
         "max_chunks": MAX_CHUNKS,
     }
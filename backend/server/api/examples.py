@@ -8,6 +8,7 @@ from typing_extensions import Annotated, TypedDict
 
 from db.models import Example, get_session, validate_extractor_owner
 from server.api.api_key import UserToken
+from server.example_selection import estimate_example_tokens
 
 router = APIRouter(
     prefix="/examples",
@@ -47,6 +48,10 @@ def create(
         extractor_id=create_request["extractor_id"],
         content=create_request["content"],
         output=create_request["output"],
+        # Used to select examples under a token budget without re-counting
+        token_count=estimate_example_tokens(
+            create_request["content"], create_request["output"]
+        ),
     )
     session.add(instance)
     session.commit()
@@ -1,15 +1,35 @@
-from typing import Literal, Optional
+import json
+import os
+import shutil
+import tempfile
+from typing import IO, Any, AsyncIterator, Dict, Literal, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sse_starlette import EventSourceResponse
 from typing_extensions import Annotated
 
 from db.models import Extractor, SharedExtractors, get_session
-from extraction.parsing import parse_binary_input
+from extraction.parsing import spool_binary_input
+from server import settings
 from server.api.api_key import UserToken
-from server.extraction_runnable import ExtractResponse, extract_entire_document
+from server.bulk import BulkResult, read_documents, stream_bulk_extraction
+from server.document_cache import DOCUMENT_CACHE, get_document_cache_key
+from server.executors import (
+    CPU_EXECUTOR,
+    DATABASE_EXECUTOR,
+    iter_pdf_pages,
+    parse_blob_in_executor,
+)
+from server.extraction_runnable import (
+    ExtractionEvent,
+    ExtractResponse,
+    stream_entire_document,
+)
 from server.models import DEFAULT_MODEL
+from server.pipeline import extract_entire_document
 from server.retrieval import extract_from_content
 
 router = APIRouter(
@@ -19,6 +39,87 @@ router = APIRouter(
 )
 
 
+async def iter_content(
+    text: Optional[str],
+    file: Optional[UploadFile],
+    metadata: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[str]:
+    """Iterate over the pages of the text or of the uploaded file.
+
+    The file is parsed in the parsing pools, off the event loop. The pages of
+    PDFs are yielded as soon as they are parsed. Files that were parsed before
+    are read from the document cache instead, and whether the cache was hit
+    is set as "document_cache" in `metadata`.
+
+    Files larger than `MAX_FILE_SIZE_MB` are rejected with a 413 error.
+    """
+    if text:
+        yield text
+        return
+    # The file is parsed from a temporary copy on disk, not from memory
+    blob = await CPU_EXECUTOR.run(spool_binary_input, file.file)
+    try:
+        key = get_document_cache_key(blob.metadata["sha256"])
+        cached_pages = await CPU_EXECUTOR.run(DOCUMENT_CACHE.lookup, key)
+        if metadata is not None:
+            metadata["document_cache"] = "miss" if cached_pages is None else "hit"
+        if cached_pages is not None:
+            for page in cached_pages:
+                yield page
+            return
+
+        pages = []
+        if blob.mimetype == "application/pdf" and settings.PDF_PARALLEL_PAGES:
+            async for page in iter_pdf_pages(blob):
+                pages.append(page)
+                yield page
+        else:
+            # TODO: Add metadata like location from original file where
+            # the text was extracted from
+            for document in await parse_blob_in_executor(blob):
+                pages.append(document.page_content)
+                yield document.page_content
+        # Only documents parsed entirely are cached
+        await CPU_EXECUTOR.run(DOCUMENT_CACHE.update, key, pages)
+    finally:
+        os.remove(blob.path)
+
+
+async def get_content(
+    text: Optional[str],
+    file: Optional[UploadFile],
+    metadata: Optional[Dict[str, Any]] = None,
+) -> str:
+    """Get the content to extract from either the text or the uploaded file."""
+    return "\n".join([page async for page in iter_content(text, file, metadata)])
+
+
+async def get_owned_extractor(
+    session: Session, extractor_id: UUID, user_id: UUID
+) -> Extractor:
+    """Get an extractor of an owner, querying the database off the event loop."""
+    extractor = await DATABASE_EXECUTOR.run(
+        lambda: session.query(Extractor)
+        .filter_by(uuid=extractor_id, owner_id=user_id)
+        .scalar()
+    )
+    if extractor is None:
+        raise HTTPException(status_code=404, detail="Extractor not found for owner.")
+    return extractor
+
+
+async def _to_ndjson(events: AsyncIterator[ExtractionEvent]) -> AsyncIterator[str]:
+    """Encode extraction events as newline delimited JSON."""
+    async for event in events:
+        yield json.dumps(event) + "\n"
+
+
+async def _to_sse(events: AsyncIterator[ExtractionEvent]) -> AsyncIterator[dict]:
+    """Encode extraction events as server sent events."""
+    async for event in events:
+        yield {"event": event["event"], "data": json.dumps(event["data"])}
+
+
 @router.post("", response_model=ExtractResponse)
 async def extract_using_existing_extractor(
     *,
@@ -27,6 +128,11 @@ async def extract_using_existing_extractor(
     mode: Literal["entire_document", "retrieval"] = Form("entire_document"),
     file: Optional[UploadFile] = File(None),
     model_name: Optional[str] = Form(DEFAULT_MODEL),
+    embeddings_name: Optional[str] = Form(None),
+    top_k: Optional[int] = Form(None),
+    min_bm25_score: float = Form(0.0),
+    min_similarity: Optional[float] = Form(None),
+    rerank: bool = Form(True),
     session: Session = Depends(get_session),
     user_id: UUID = Depends(UserToken),
 ) -> ExtractResponse:
@@ -38,28 +144,114 @@ async def extract_using_existing_extractor(
     if text is None and file is None:
         raise HTTPException(status_code=422, detail="No text or file provided.")
 
-    extractor = (
-        session.query(Extractor).filter_by(uuid=extractor_id, owner_id=user_id).scalar()
-    )
-    if extractor is None:
-        raise HTTPException(status_code=404, detail="Extractor not found for owner.")
-
-    if text:
-        text_ = text
-    else:
-        documents = parse_binary_input(file.file)
-        # TODO: Add metadata like location from original file where
-        # the text was extracted from
-        text_ = "\n".join([document.page_content for document in documents])
+    extractor = await get_owned_extractor(session, extractor_id, user_id)
 
+    metadata: Dict[str, Any] = {}
     if mode == "entire_document":
-        return await extract_entire_document(text_, extractor, model_name)
+        # Chunks are extracted while the rest of the file is parsed
+        response = await extract_entire_document(
+            iter_content(text, file, metadata), extractor, model_name
+        )
     elif mode == "retrieval":
-        return await extract_from_content(text_, extractor, model_name)
+        response = await extract_from_content(
+            await get_content(text, file, metadata),
+            extractor,
+            model_name,
+            embeddings_name=embeddings_name,
+            top_k=top_k,
+            min_bm25_score=min_bm25_score,
+            min_similarity=min_similarity,
+            rerank=rerank,
+        )
     else:
         raise ValueError(
             f"Invalid mode {mode}. Expected one of 'entire_document', 'retrieval'."
         )
+    if metadata:
+        response["metadata"] = metadata
+    return response
+
+
+@router.post("/stream")
+async def stream_using_existing_extractor(
+    *,
+    extractor_id: Annotated[UUID, Form()],
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    model_name: Optional[str] = Form(DEFAULT_MODEL),
+    response_format: Literal["sse", "ndjson"] = Form("sse"),
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(UserToken),
+):
+    """Endpoint that streams extraction results as each chunk completes.
+
+    Every chunk of the document is extracted in the "entire_document" mode.
+    A "data" event is emitted as soon as a chunk completes with the items that
+    were not extracted from previously completed chunks, followed by a single
+    "end" event with `content_too_long` and the status of each chunk.
+
+    Events are sent as server sent events or as newline delimited JSON
+    depending on `response_format`.
+    """
+    if text is None and file is None:
+        raise HTTPException(status_code=422, detail="No text or file provided.")
+
+    extractor = await get_owned_extractor(session, extractor_id, user_id)
+
+    text_ = await get_content(text, file)
+    events = await stream_entire_document(text_, extractor, model_name)
+    if response_format == "ndjson":
+        return StreamingResponse(_to_ndjson(events), media_type="application/x-ndjson")
+    return EventSourceResponse(_to_sse(events))
+
+
+async def _bulk_to_ndjson(
+    results: AsyncIterator[BulkResult], file: IO[bytes]
+) -> AsyncIterator[str]:
+    """Encode bulk results as newline delimited JSON, closing the file once done."""
+    try:
+        async for result in results:
+            yield json.dumps(result) + "\n"
+    finally:
+        file.close()
+
+
+@router.post("/bulk")
+async def bulk_extract_using_existing_extractor(
+    *,
+    extractor_id: Annotated[UUID, Form()],
+    file: UploadFile = File(...),
+    model_name: Optional[str] = Form(DEFAULT_MODEL),
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(UserToken),
+) -> StreamingResponse:
+    """Endpoint extracting from many documents with an existing extractor.
+
+    The file is either a zip archive, where each file is a document, or a JSONL
+    file, where each line is a document: a string or an object with a "text"
+    and an optional "id".
+
+    The result of each document is streamed as newline delimited JSON as soon
+    as the document completes, with the name of the document (its file name,
+    id or line number) and either its data or its error.
+    """
+    extractor = await get_owned_extractor(session, extractor_id, user_id)
+
+    # The uploaded file is closed once the endpoint returns, before the
+    # documents are streamed.
+    documents_file = tempfile.TemporaryFile()
+    try:
+        await CPU_EXECUTOR.run(shutil.copyfileobj, file.file, documents_file)
+        documents = await CPU_EXECUTOR.run(read_documents, documents_file)
+        results = await CPU_EXECUTOR.run(
+            stream_bulk_extraction, documents, extractor, model_name
+        )
+    except BaseException:
+        documents_file.close()
+        raise
+    return StreamingResponse(
+        _bulk_to_ndjson(results, documents_file), media_type="application/x-ndjson"
+    )
 
 
 @router.post("/shared", response_model=ExtractResponse)
@@ -70,6 +262,11 @@ async def extract_using_shared_extractor(
     mode: Literal["entire_document", "retrieval"] = Form("entire_document"),
     file: Optional[UploadFile] = File(None),
     model_name: Optional[str] = Form("default"),
+    embeddings_name: Optional[str] = Form(None),
+    top_k: Optional[int] = Form(None),
+    min_bm25_score: float = Form(0.0),
+    min_similarity: Optional[float] = Form(None),
+    rerank: bool = Form(True),
     session: Session = Depends(get_session),
 ) -> ExtractResponse:
     """Endpoint that is used with an existing extractor.
@@ -82,14 +279,23 @@ async def extract_using_shared_extractor(
         mode: The mode to use for extraction.
         file: The file to extract from.
         model_name: The model to use for extraction.
+        embeddings_name: The embeddings used to retrieve chunks in the
+            "retrieval" mode. Defaults to the default embeddings.
+        top_k: Max number of chunks extracted from in the "retrieval" mode.
+        min_bm25_score: In the "retrieval" mode, drop the chunks whose BM25
+            score is lower, relative to the best score (between 0 and 1).
+        min_similarity: In the "retrieval" mode, drop the chunks whose cosine
+            similarity with the description of the extractor is lower.
+        rerank: Whether to re-score the chunks ranked first by BM25 with
+            embeddings in the "retrieval" mode.
         session: The database session.
 
     """
     if text is None and file is None:
         raise HTTPException(status_code=422, detail="No text or file provided.")
 
-    extractor = (
-        session.query(Extractor)
+    extractor = await DATABASE_EXECUTOR.run(
+        lambda: session.query(Extractor)
         .join(SharedExtractors, Extractor.uuid == SharedExtractors.extractor_id)
         .filter(SharedExtractors.share_token == extractor_id)
         .scalar()
@@ -98,19 +304,27 @@ async def extract_using_shared_extractor(
     if not extractor:
         raise HTTPException(status_code=404, detail="Extractor not found.")
 
-    if text:
-        text_ = text
-    else:
-        documents = parse_binary_input(file.file)
-        # TODO: Add metadata like location from original file where
-        # the text was extracted from
-        text_ = "\n".join([document.page_content for document in documents])
-
+    metadata: Dict[str, Any] = {}
     if mode == "entire_document":
-        return await extract_entire_document(text_, extractor, model_name)
+        # Chunks are extracted while the rest of the file is parsed
+        response = await extract_entire_document(
+            iter_content(text, file, metadata), extractor, model_name
+        )
     elif mode == "retrieval":
-        return await extract_from_content(text_, extractor, model_name)
+        response = await extract_from_content(
+            await get_content(text, file, metadata),
+            extractor,
+            model_name,
+            embeddings_name=embeddings_name,
+            top_k=top_k,
+            min_bm25_score=min_bm25_score,
+            min_similarity=min_similarity,
+            rerank=rerank,
+        )
     else:
         raise ValueError(
             f"Invalid mode {mode}. Expected one of 'entire_document', 'retrieval'."
         )
+    if metadata:
+        response["metadata"] = metadata
+    return response
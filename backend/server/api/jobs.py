@@ -0,0 +1,183 @@
+"""Endpoints for extracting from documents in background jobs."""
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+from uuid import UUID
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Query,
+    UploadFile,
+)
+from sqlalchemy.orm import Session
+from typing_extensions import Annotated, TypedDict
+
+from db.models import (
+    ExtractionJob,
+    JobChunk,
+    get_session,
+    get_session_factory,
+)
+from server.api.api_key import UserToken
+from server.api.extract import get_content, get_owned_extractor
+from server.executors import CPU_EXECUTOR, DATABASE_EXECUTOR
+from server.jobs import create_job, split_job_document, start_job
+from server.models import DEFAULT_MODEL
+
+router = APIRouter(
+    prefix="/extract/jobs",
+    tags=["extract"],
+    responses={404: {"description": "Not found"}},
+)
+
+# Max number of chunk results returned in a page.
+MAX_RESULTS_PAGE_SIZE = 1000
+
+
+class CreateJobResponse(TypedDict):
+    """Response for creating an extraction job."""
+
+    uuid: UUID
+
+
+class JobResponse(TypedDict):
+    """The status and progress of an extraction job."""
+
+    uuid: UUID
+    extractor_id: UUID
+    model_name: str
+    status: str
+    total_chunks: int
+    completed_chunks: int
+    failed_chunks: int
+    skipped_chunks: int
+    tokens_used: int
+    content_too_long: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class JobChunkResult(TypedDict):
+    """The result of a chunk of an extraction job."""
+
+    chunk: int
+    status: str
+    data: Optional[List[Any]]
+    error: Optional[str]
+    duplicate_of: Optional[int]
+
+
+class JobResultsResponse(TypedDict):
+    """A page of the chunk results of an extraction job."""
+
+    chunks: List[JobChunkResult]
+    next_offset: Optional[int]
+
+
+def _get_job(session: Session, job_id: UUID, user_id: UUID) -> ExtractionJob:
+    job = session.query(ExtractionJob).filter_by(uuid=job_id, owner_id=user_id).scalar()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found for owner.")
+    return job
+
+
+@router.post("")
+async def create(
+    *,
+    extractor_id: Annotated[UUID, Form()],
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None),
+    model_name: Optional[str] = Form(DEFAULT_MODEL),
+    session: Session = Depends(get_session),
+    session_factory: Callable[[], Session] = Depends(get_session_factory),
+    user_id: UUID = Depends(UserToken),
+) -> CreateJobResponse:
+    """Create a job extracting from an entire document with an existing extractor.
+
+    The job id is returned immediately and the chunks of the document are
+    extracted in the background.
+    """
+    if text is None and file is None:
+        raise HTTPException(status_code=422, detail="No text or file provided.")
+
+    extractor = await get_owned_extractor(session, extractor_id, user_id)
+    content = await get_content(text, file)
+    chunks = await CPU_EXECUTOR.run(split_job_document, content, extractor, model_name)
+    job_id = await DATABASE_EXECUTOR.run(
+        lambda: create_job(session, chunks, extractor, model_name).uuid
+    )
+    start_job(job_id, session_factory)
+    return {"uuid": job_id}
+
+
+@router.get("/{job_id}")
+def get(
+    job_id: UUID,
+    *,
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(UserToken),
+) -> JobResponse:
+    """Get the status and progress of a job."""
+    job = _get_job(session, job_id, user_id)
+    return {
+        "uuid": job.uuid,
+        "extractor_id": job.extractor_id,
+        "model_name": job.model_name,
+        "status": job.status,
+        "total_chunks": job.total_chunks,
+        "completed_chunks": job.completed_chunks,
+        "failed_chunks": job.failed_chunks,
+        "skipped_chunks": job.skipped_chunks,
+        "tokens_used": job.tokens_used,
+        "content_too_long": job.content_too_long,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+@router.get("/{job_id}/results")
+def results(
+    job_id: UUID,
+    *,
+    limit: int = Query(100, ge=1, le=MAX_RESULTS_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    session: Session = Depends(get_session),
+    user_id: UUID = Depends(UserToken),
+) -> JobResultsResponse:
+    """Get a page of the results of the chunks of a job, in document order.
+
+    Results are available as soon as their chunk completes; the chunks that
+    are not extracted yet have a "pending" or "running" status.
+    """
+    job = _get_job(session, job_id, user_id)
+    chunks = (
+        session.query(
+            JobChunk.index,
+            JobChunk.status,
+            JobChunk.data,
+            JobChunk.error,
+            JobChunk.duplicate_of,
+        )
+        .filter(JobChunk.job_id == job.uuid)
+        .order_by(JobChunk.index)
+        .limit(limit)
+        .offset(offset)
+        .all()
+    )
+    next_offset = offset + len(chunks)
+    return {
+        "chunks": [
+            {
+                "chunk": chunk.index,
+                "status": chunk.status,
+                "data": chunk.data,
+                "error": chunk.error,
+                "duplicate_of": chunk.duplicate_of,
+            }
+            for chunk in chunks
+        ],
+        "next_offset": next_offset if next_offset < job.total_chunks else None,
+    }
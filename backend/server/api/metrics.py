@@ -0,0 +1,56 @@
+"""Endpoint for inspecting runtime metrics of the server."""
+from typing import Dict
+
+from fastapi import APIRouter
+from typing_extensions import TypedDict
+
+from server.caching import CacheStats
+from server.concurrency import CONCURRENCY_LIMITERS, ConcurrencyStats
+from server.document_cache import DOCUMENT_CACHE, DocumentCacheStats
+from server.embedding_cache import EMBEDDING_CACHE, EmbeddingCacheStats
+from server.executors import EXECUTORS, ExecutorStats
+from server.extraction_runnable import COMPILED_EXTRACTORS
+from server.packing import PACKED_EXTRACTORS
+from server.prompt_caching import PROMPT_CACHE_TRACKER, PromptCacheStats
+from server.rate_limiting import RATE_LIMITERS, RateLimiterStats
+from server.result_cache import RESULT_CACHE, ResultCacheStats
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["Metrics"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+class MetricsResponse(TypedDict):
+    """Response for metrics."""
+
+    compiled_extractors: CacheStats
+    packed_extractors: CacheStats
+    result_cache: ResultCacheStats
+    embedding_cache: EmbeddingCacheStats
+    document_cache: DocumentCacheStats
+    concurrency: Dict[str, ConcurrencyStats]
+    rate_limits: Dict[str, RateLimiterStats]
+    prompt_cache: Dict[str, PromptCacheStats]
+    executors: Dict[str, ExecutorStats]
+
+
+@router.get("")
+def get() -> MetricsResponse:
+    """Endpoint to show runtime metrics of this server process."""
+    return {
+        "compiled_extractors": COMPILED_EXTRACTORS.stats(),
+        "packed_extractors": PACKED_EXTRACTORS.stats(),
+        "result_cache": RESULT_CACHE.stats(),
+        "embedding_cache": EMBEDDING_CACHE.stats(),
+        "document_cache": DOCUMENT_CACHE.stats(),
+        "concurrency": {
+            model: limiter.stats() for model, limiter in CONCURRENCY_LIMITERS.items()
+        },
+        "rate_limits": {
+            model: limiter.stats() for model, limiter in RATE_LIMITERS.items()
+        },
+        "prompt_cache": PROMPT_CACHE_TRACKER.stats(),
+        "executors": {name: executor.stats() for name, executor in EXECUTORS.items()},
+    }
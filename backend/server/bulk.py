@@ -0,0 +1,270 @@
+"""Extract from many documents with a single extractor.
+
+Documents are read from a zip archive of files or from a JSONL file of texts.
+The extractor is loaded and compiled once for all the documents, files are
+parsed in the parsing pools (see `server.executors`), and the chunks of every
+document are scheduled by the shared concurrency limiter of the model. A
+bounded number of documents is processed at once, and the result of each
+document is yielded as soon as it completes.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import zipfile
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    BinaryIO,
+    Callable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from fastapi import HTTPException
+from langchain_core.runnables import RunnableConfig
+from typing_extensions import TypedDict
+
+from db.models import Extractor
+from extraction.chunking import TokenChunker
+from extraction.parsing import spool_archive_member
+from server import settings
+from server.executors import CPU_EXECUTOR, parse_blob_in_executor
+from server.extraction_runnable import (
+    DuplicateChunk,
+    ExtractRequest,
+    deduplicate,
+    extract_with_cache,
+    find_duplicate_chunks,
+    get_extractor_cache_key,
+    get_run_config,
+    make_chunk_splitter,
+    make_request_template,
+    split_document,
+)
+
+# Size of the batches of lines of JSONL files read at once.
+_JSONL_BATCH_SIZE = 1024 * 1024
+
+
+class BulkDocument(NamedTuple):
+    """A document of a bulk extraction."""
+
+    name: str
+    """The file name in the archive, or the id (or line number) in the JSONL."""
+    load: Callable[[], Awaitable[str]]
+    """Get the text of the document."""
+
+
+class BulkResult(TypedDict, total=False):
+    """The result of the extraction of a document of a bulk extraction."""
+
+    document: str
+    data: List[Any]
+    content_too_long: bool
+    skipped_chunks: int
+    duplicate_chunks: List[DuplicateChunk]
+    error: str
+
+
+async def _parse_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    blob = await CPU_EXECUTOR.run(spool_archive_member, archive, info)
+    try:
+        documents = await parse_blob_in_executor(blob)
+    finally:
+        os.remove(blob.path)
+    return "\n".join(document.page_content for document in documents)
+
+
+async def _loaded(text: str) -> str:
+    return text
+
+
+async def _failed(error: Exception) -> str:
+    raise error
+
+
+class _InvalidRecord(ValueError):
+    """A line of a JSONL file which is not a valid document."""
+
+    def __init__(self, record_id: Optional[str]) -> None:
+        super().__init__('Expected a string or an object with a "text" string.')
+        self.record_id = record_id
+
+
+def _parse_jsonl_line(line: bytes) -> Tuple[Optional[str], str]:
+    """Parse a line of a JSONL file into the id (if any) and text of a document."""
+    record = json.loads(line)
+    if isinstance(record, str):
+        return None, record
+    record_id = (
+        str(record["id"]) if isinstance(record, dict) and "id" in record else None
+    )
+    if isinstance(record, dict) and isinstance(record.get("text"), str):
+        return record_id, record["text"]
+    raise _InvalidRecord(record_id)
+
+
+def _read_jsonl_batch(file: BinaryIO) -> List[Tuple[Optional[str], Any]]:
+    """Read and parse the next lines of a JSONL file, up to about 1MB.
+
+    Returns the id and text of the document of each line, or the id (if any)
+    and the error of lines which are not valid documents. Blank lines are None.
+    """
+    documents: List[Tuple[Optional[str], Any]] = []
+    for line in file.readlines(_JSONL_BATCH_SIZE):
+        if not line.strip():
+            documents.append((None, None))
+            continue
+        try:
+            documents.append(_parse_jsonl_line(line))
+        except _InvalidRecord as e:
+            documents.append((e.record_id, e))
+        except ValueError as e:
+            documents.append((None, e))
+    return documents
+
+
+async def _iter_archive(
+    archive: zipfile.ZipFile, members: List[zipfile.ZipInfo]
+) -> AsyncIterator[BulkDocument]:
+    for info in members:
+        yield BulkDocument(
+            info.filename, lambda info=info: _parse_member(archive, info)
+        )
+
+
+async def _iter_jsonl(file: BinaryIO) -> AsyncIterator[BulkDocument]:
+    line_number = 0
+    while True:
+        # Lines are read and parsed (once) in batches, off the event loop
+        batch = await CPU_EXECUTOR.run(_read_jsonl_batch, file)
+        if not batch:
+            return
+        for record_id, text in batch:
+            line_number += 1
+            if text is None:
+                continue
+            name = record_id if record_id is not None else str(line_number)
+            if isinstance(text, Exception):
+                yield BulkDocument(name, lambda error=text: _failed(error))
+            else:
+                yield BulkDocument(name, lambda text=text: _loaded(text))
+
+
+def read_documents(file: BinaryIO) -> AsyncIterator[BulkDocument]:
+    """Read the documents of a zip archive or of a JSONL file.
+
+    Every file of an archive is a document. Every line of a JSONL file is a
+    document, either a string or an object with a "text" and an optional "id".
+    Documents are read lazily, so only the documents being extracted are held
+    in memory.
+
+    Archives whose files decompress to more than `BULK_MAX_UNCOMPRESSED_SIZE_MB`
+    in total are rejected with a 413 error, before any file is decompressed.
+    This function reads the directory of archives, so it runs off the event loop.
+    """
+    if zipfile.is_zipfile(file):
+        file.seek(0)
+        archive = zipfile.ZipFile(file)
+        members = [
+            info
+            for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+        ]
+        total_size = sum(info.file_size for info in members)
+        if total_size > settings.BULK_MAX_UNCOMPRESSED_SIZE_MB * 1024 * 1024:
+            raise HTTPException(
+                status_code=413,
+                detail=(
+                    "Archive files exceed the maximum total limit of "
+                    f"{settings.BULK_MAX_UNCOMPRESSED_SIZE_MB} MB."
+                ),
+            )
+        return _iter_archive(archive, members)
+
+    file.seek(0)
+    return _iter_jsonl(file)
+
+
+def stream_bulk_extraction(
+    documents: AsyncIterator[BulkDocument],
+    extractor: Extractor,
+    model_name: str,
+) -> AsyncIterator[BulkResult]:
+    """Extract from documents with an extractor, yielding results as they complete.
+
+    A document that fails to be parsed or extracted yields its error, without
+    aborting the other documents.
+
+    The extractor is compiled eagerly, so it is no longer accessed once this
+    function returns (e.g., after its database session was closed).
+    """
+    # Compiled once and shared by every document
+    template = make_request_template(extractor, model_name)
+    text_splitter = make_chunk_splitter(
+        template, cache_key=get_extractor_cache_key(extractor, model_name)
+    )
+    config = get_run_config(extractor, model_name, num_chunks=0)
+    # Every chunk is scheduled as bulk work, fairly with the other owners
+    config = {**config, "configurable": {**config["configurable"], "priority": "bulk"}}
+    return _stream_documents(documents, template, text_splitter, config)
+
+
+async def _stream_documents(
+    documents: AsyncIterator[BulkDocument],
+    template: ExtractRequest,
+    text_splitter: TokenChunker,
+    config: RunnableConfig,
+) -> AsyncIterator[BulkResult]:
+    """Extract from a bounded number of documents at once."""
+
+    async def _extract_document(document: BulkDocument) -> BulkResult:
+        try:
+            content = await document.load()
+            extraction_requests, content_too_long = await CPU_EXECUTOR.run(
+                split_document, content, template, text_splitter
+            )
+            duplicate_of = await CPU_EXECUTOR.run(
+                find_duplicate_chunks, extraction_requests
+            )
+            unique_requests = [
+                extraction_requests[idx]
+                for idx, original in enumerate(duplicate_of)
+                if original is None
+            ]
+            responses = await extract_with_cache(unique_requests, config)
+        except Exception as e:
+            return {"document": document.name, "error": repr(e)}
+        return {
+            "document": document.name,
+            "data": deduplicate(responses)["data"],
+            "content_too_long": content_too_long,
+            "skipped_chunks": len(extraction_requests) - len(unique_requests),
+            "duplicate_chunks": [
+                {"chunk": idx, "duplicate_of": original}
+                for idx, original in enumerate(duplicate_of)
+                if original is not None
+            ],
+        }
+
+    tasks: Set[asyncio.Task] = set()
+    try:
+        async for document in documents:
+            if len(tasks) >= settings.BULK_MAX_CONCURRENT_DOCUMENTS:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+            tasks.add(asyncio.create_task(_extract_document(document)))
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        for task in tasks:
+            task.cancel()
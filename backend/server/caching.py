@@ -0,0 +1,84 @@
+"""In-process caches shared across requests."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+from typing_extensions import TypedDict
+
+V = TypeVar("V")
+
+
+class CacheStats(TypedDict):
+    """Counters describing how a cache is performing."""
+
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+
+
+class LRUCache(Generic[V]):
+    """A thread-safe least-recently-used cache with hit / miss counters.
+
+    Set `maxsize` to 0 or a negative number to disable caching entirely.
+    If `ttl` is provided, entries expire `ttl` seconds after they were set.
+    """
+
+    def __init__(self, maxsize: int, *, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Maps keys to (expiry timestamp, value)
+        self._data: OrderedDict[Hashable, Tuple[Optional[float], V]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Get a value from the cache, marking it as recently used."""
+        with self._lock:
+            if key in self._data:
+                expires_at, value = self._data[key]
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Hashable, value: V) -> None:
+        """Add a value to the cache, evicting the least recently used entry."""
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all entries and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> CacheStats:
+        """Get the current cache counters."""
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._data
@@ -0,0 +1,89 @@
+"""Plan the size of the chunks a document is split into for an extractor.
+
+Every call to the model sends the prompt, the instructions, the examples and
+the tool schema on top of the chunk text. The planner counts those tokens with
+the tokenizer of the model and sizes the chunks to fill what is left of the
+context window after reserving room for the output, so that a document is
+extracted with as few calls as possible.
+"""
+from __future__ import annotations
+
+import json
+import math
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from langchain_core.prompts import ChatPromptTemplate
+
+from extraction.chunking import TokenChunker, get_encoding
+from server import settings
+from server.models import CHUNK_SIZES, get_context_window, get_tokenizer
+
+# Tokens added by the chat format around every message (role, separators).
+TOKENS_PER_MESSAGE = 4
+
+# Chunks smaller than this are not worth the overhead of a call.
+MIN_CHUNK_SIZE = 100
+
+
+def count_tokens(text: str, model_name: Optional[str]) -> int:
+    """Count the tokens of a text using the tokenizer of a model."""
+    tokenizer = get_tokenizer(model_name)
+    encoding = get_encoding(tokenizer["encoding_name"])
+    num_tokens = len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(num_tokens * tokenizer["token_ratio"])
+
+
+def count_prompt_overhead(
+    prompt: ChatPromptTemplate, schema: Dict[str, Any], model_name: Optional[str]
+) -> int:
+    """Count the tokens sent with every chunk: prompt, examples and tool schema."""
+    messages = prompt.format_messages(
+        **{variable: "" for variable in prompt.input_variables}
+    )
+    serialized = json.dumps(schema) + "".join(
+        f"{message.content}{json.dumps(getattr(message, 'tool_calls', []))}"
+        for message in messages
+    )
+    return count_tokens(serialized, model_name) + TOKENS_PER_MESSAGE * len(messages)
+
+
+def get_chunk_size(model_name: Optional[str], overhead_tokens: int) -> int:
+    """Get the largest chunk size that fits in the context window of a model.
+
+    Args:
+        model_name: The model the chunks are sent to.
+        overhead_tokens: Tokens used by everything but the chunk text,
+            see `count_prompt_overhead`.
+
+    Returns:
+        The chunk size in tokens of the encoding used to split the text.
+    """
+    available_tokens = (
+        get_context_window(model_name)
+        - overhead_tokens
+        - settings.OUTPUT_TOKEN_RESERVATION
+    )
+    if model_name in CHUNK_SIZES:
+        available_tokens = min(available_tokens, CHUNK_SIZES[model_name])
+    if available_tokens < MIN_CHUNK_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"The instructions, examples and schema of the extractor use "
+            f"{overhead_tokens} tokens, which leaves no room for text in the "
+            f"context window of {model_name}.",
+        )
+    # The splitter counts tokens of the tiktoken encoding, not of the model.
+    return int(available_tokens / get_tokenizer(model_name)["token_ratio"])
+
+
+def make_text_splitter(
+    prompt: ChatPromptTemplate, schema: Dict[str, Any], model_name: Optional[str]
+) -> TokenChunker:
+    """Make a text splitter sized for the given prompt, schema and model."""
+    overhead_tokens = count_prompt_overhead(prompt, schema, model_name)
+    return TokenChunker(
+        get_encoding(get_tokenizer(model_name)["encoding_name"]),
+        chunk_size=get_chunk_size(model_name, overhead_tokens),
+        chunk_overlap=20,
+    )
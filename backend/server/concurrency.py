@@ -0,0 +1,233 @@
+"""Adaptive limits on the number of concurrent calls made to each chat model.
+
+The limits are shared by all the requests handled by this process and are
+adjusted using additive-increase / multiplicative-decrease (AIMD): the limit
+grows by one for every `limit` fast successful calls and is cut by a constant
+factor when the provider signals that it is overloaded (429, 5xx, timeouts).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+
+from typing_extensions import TypedDict
+
+from server import settings
+from server.models import DEFAULT_MODEL, SUPPORTED_MODELS
+from server.scheduler import FairQueue, Priority
+
+
+class ConcurrencyStats(TypedDict):
+    """Counters describing the state of a concurrency limiter."""
+
+    limit: int
+    in_flight: int
+    queued: Dict[str, int]
+    successes: int
+    overloads: int
+    errors: int
+    latency_ewma: Optional[float]
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Check whether an error signals that the provider is overloaded."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    # Provider SDKs (openai, anthropic, groq, ...) name their timeout errors
+    # differently and do not share a common base class.
+    if "Timeout" in type(error).__name__:
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return isinstance(status_code, int) and (status_code == 429 or status_code >= 500)
+
+
+class ConcurrencySlot:
+    """A slot of a concurrency limiter, timing the call made in it."""
+
+    __slots__ = ("start_time",)
+
+    def __init__(self) -> None:
+        self.start_time = time.monotonic()
+
+    def start(self) -> None:
+        """Mark the start of the call, once the caller is done waiting.
+
+        Waits within the slot before the call (e.g., for rate limits) are not
+        latency of the provider, so they do not count toward the latency
+        target.
+        """
+        self.start_time = time.monotonic()
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit the number of concurrent calls, adapting the limit using AIMD.
+
+    Calls waiting for a slot are admitted in weighted fair queueing order
+    across owners and priorities (see `server.scheduler`).
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff_factor: float = 0.5,
+        latency_target: Optional[float] = None,
+    ) -> None:
+        """Initialize the limiter.
+
+        Args:
+            initial_limit: The concurrency limit to start with.
+            min_limit: The limit never goes below this value.
+            max_limit: The limit never goes above this value.
+            backoff_factor: Factor applied to the limit when the provider
+                is overloaded.
+            latency_target: Calls slower than this (in seconds) do not increase
+                the limit. If None, latency is not taken into account.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.backoff_factor = backoff_factor
+        self.latency_target = latency_target
+        self._limit = float(min(max(initial_limit, min_limit), self.max_limit))
+        self._in_flight = 0
+        self._queue: FairQueue[asyncio.Future] = FairQueue()
+        self._last_backoff = 0.0
+        self.successes = 0
+        self.overloads = 0
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+
+    @property
+    def limit(self) -> int:
+        """The current concurrency limit."""
+        return int(self._limit)
+
+    async def _acquire(self, owner: str, priority: Priority, cost: float) -> None:
+        if self._in_flight < self.limit and not self._queue:
+            self._in_flight += 1
+            return
+        # Futures are created on the running loop on demand rather than using
+        # asyncio primitives, since the limiter is shared at the process level.
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.push(waiter, owner=owner, priority=priority, cost=cost)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over right before the cancellation
+                self._release()
+            else:
+                self._queue.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._wake_up_waiters()
+
+    def _wake_up_waiters(self) -> None:
+        # Slots are handed over to the waiters, so they cannot be taken
+        # by calls that did not wait.
+        while self._in_flight < self.limit and self._queue:
+            waiter = self._queue.pop()
+            if not waiter.done():
+                self._in_flight += 1
+                waiter.set_result(None)
+
+    def _on_success(self, latency: float) -> None:
+        self.successes += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = 0.9 * self.latency_ewma + 0.1 * latency
+        if self.latency_target is None or latency <= self.latency_target:
+            # Grows by one after `limit` successful calls
+            self._limit = min(self._limit + 1 / self._limit, float(self.max_limit))
+            self._wake_up_waiters()
+
+    def _on_overload(self) -> None:
+        self.overloads += 1
+        now = time.monotonic()
+        # Calls that were in flight together tend to fail together, so back off
+        # at most once per round trip.
+        if now - self._last_backoff < (self.latency_ewma or 0):
+            return
+        self._last_backoff = now
+        self._limit = max(self._limit * self.backoff_factor, float(self.min_limit))
+
+    @asynccontextmanager
+    async def limit_concurrency(
+        self,
+        *,
+        owner: str = "anonymous",
+        priority: Priority = "interactive",
+        cost: float = 1.0,
+    ) -> AsyncIterator[ConcurrencySlot]:
+        """Wait for a free slot and record the outcome of the call made in it.
+
+        The latency of the call is measured from the time the slot is acquired,
+        or from the last call to `start` of the yielded slot.
+
+        Args:
+            owner: The owner of the call, calls are shared fairly between owners.
+            priority: The priority class of the call.
+            cost: The cost of the call (e.g., its estimated number of tokens).
+        """
+        await self._acquire(owner, priority, cost)
+        slot = ConcurrencySlot()
+        try:
+            yield slot
+        except BaseException as e:
+            if is_overload_error(e):
+                self._on_overload()
+            elif isinstance(e, Exception):
+                self.errors += 1
+            raise
+        else:
+            self._on_success(time.monotonic() - slot.start_time)
+        finally:
+            self._release()
+
+    def stats(self) -> ConcurrencyStats:
+        """Get the current state of the limiter."""
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queued": self._queue.sizes(),
+            "successes": self.successes,
+            "overloads": self.overloads,
+            "errors": self.errors,
+            "latency_ewma": self.latency_ewma,
+        }
+
+
+def _create_limiter() -> AdaptiveConcurrencyLimiter:
+    """Create a concurrency limiter using the configured settings."""
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=settings.MAX_CONCURRENCY,
+        min_limit=settings.MIN_CONCURRENCY_LIMIT,
+        max_limit=settings.MAX_CONCURRENCY_LIMIT,
+        latency_target=settings.CONCURRENCY_LATENCY_TARGET or None,
+    )
+
+
+# PUBLIC API
+
+CONCURRENCY_LIMITERS: Dict[str, AdaptiveConcurrencyLimiter] = {
+    model_name: _create_limiter() for model_name in SUPPORTED_MODELS
+}
+
+
+def get_concurrency_limiter(
+    model_name: Optional[str] = None,
+) -> AdaptiveConcurrencyLimiter:
+    """Get the concurrency limiter shared by all calls to the given model."""
+    model_name = model_name or DEFAULT_MODEL
+    if model_name not in CONCURRENCY_LIMITERS:
+        CONCURRENCY_LIMITERS[model_name] = _create_limiter()
+    return CONCURRENCY_LIMITERS[model_name]
@@ -0,0 +1,130 @@
+"""Incremental deduplication of extracted items.
+
+Items are identified by a fixed-size digest of their canonical JSON encoding,
+so memory use does not depend on the size of the items. Once more than a set
+number of digests are held in memory, they are spilled to a temporary sqlite
+database on disk.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from typing import Any, Iterable, List, Optional, Set
+
+from server import settings
+
+DIGEST_SIZE = 16  # in bytes
+
+# Re-used across calls, since `json.dumps` creates an encoder for every call
+# made with non-default arguments.
+_encode = json.JSONEncoder(
+    sort_keys=True, separators=(",", ":"), ensure_ascii=False
+).encode
+
+# Max number of digests looked up on disk in a single query.
+_MAX_LOOKUP_SIZE = 500
+
+
+def get_digest(item: Any) -> bytes:
+    """Get the digest of the canonical JSON encoding of an item."""
+    serialized = _encode(item)
+    return hashlib.blake2b(serialized.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+class Deduplicator:
+    """Keep track of the items seen so far and filter out repeated ones.
+
+    Not thread-safe: use one deduplicator per extraction.
+    """
+
+    def __init__(self, *, max_memory_items: Optional[int] = None) -> None:
+        """Initialize the deduplicator.
+
+        Args:
+            max_memory_items: Max number of digests kept in memory before they
+                are spilled to disk. Defaults to the configured setting.
+                If 0 or negative, digests are never spilled.
+        """
+        if max_memory_items is None:
+            max_memory_items = settings.DEDUPLICATION_MAX_MEMORY_ITEMS
+        self.max_memory_items = max_memory_items
+        self._seen: Set[bytes] = set()
+        self._num_spilled = 0
+        self._spill_path: Optional[str] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def __len__(self) -> int:
+        return len(self._seen) + self._num_spilled
+
+    def __enter__(self) -> Deduplicator:
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def _get_spilled(self, digests: List[bytes]) -> Set[bytes]:
+        """Get which of the digests were spilled to disk."""
+        if self._connection is None:
+            return set()
+        spilled = set()
+        for idx in range(0, len(digests), _MAX_LOOKUP_SIZE):
+            batch = digests[idx : idx + _MAX_LOOKUP_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._connection.execute(
+                f"SELECT digest FROM seen WHERE digest IN ({placeholders})", batch
+            )
+            spilled.update(digest for (digest,) in rows)
+        return spilled
+
+    def _spill(self) -> None:
+        """Move the in-memory digests to disk."""
+        if self._connection is None:
+            fd, self._spill_path = tempfile.mkstemp(suffix=".sqlite3")
+            os.close(fd)
+            self._connection = sqlite3.connect(self._spill_path)
+            self._connection.execute("PRAGMA journal_mode = OFF")
+            self._connection.execute("PRAGMA synchronous = OFF")
+            self._connection.execute(
+                "CREATE TABLE seen (digest BLOB PRIMARY KEY) WITHOUT ROWID"
+            )
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO seen (digest) VALUES (?)",
+                ((digest,) for digest in self._seen),
+            )
+        self._num_spilled += len(self._seen)
+        self._seen.clear()
+
+    def add(self, item: Any) -> bool:
+        """Add an item, returning whether it was not seen before."""
+        return bool(self.filter([item]))
+
+    def filter(self, items: Iterable[Any]) -> List[Any]:
+        """Add items, returning the ones that were not seen before in order."""
+        items = list(items)
+        digests = [get_digest(item) for item in items]
+        # Digests on disk are looked up together rather than one at a time
+        spilled = self._get_spilled(
+            [digest for digest in digests if digest not in self._seen]
+        )
+        new_items = []
+        for item, digest in zip(items, digests):
+            if digest in self._seen or digest in spilled:
+                continue
+            self._seen.add(digest)
+            new_items.append(item)
+        if 0 < self.max_memory_items <= len(self._seen):
+            self._spill()
+        return new_items
+
+    def close(self) -> None:
+        """Remove the digests spilled to disk, if any."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if self._spill_path is not None:
+            os.remove(self._spill_path)
+            self._spill_path = None
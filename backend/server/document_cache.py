@@ -0,0 +1,205 @@
+"""Cache of the documents parsed from uploaded files.
+
+The same files are often uploaded again, e.g., to retry, to extract in another
+mode, with another model or with another extractor. The texts of the pages
+parsed from a file are cached, keyed by the SHA-256 digest of the file and by
+the version of the parsers, so that such files are not parsed again.
+"""
+from __future__ import annotations
+
+import abc
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+from typing_extensions import TypedDict
+
+from extraction.parsing import HTML_PARSER, PARSER_VERSION
+from server import settings
+
+
+class DocumentCacheStats(TypedDict):
+    """Counters describing how the document cache is performing."""
+
+    backend: str
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+
+
+class DocumentCache(abc.ABC):
+    """Base class for document cache backends.
+
+    Backends only need to implement raw lookups and updates, this class keeps
+    track of the hit ratio.
+    """
+
+    name: str
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[List[str]]:
+        """Get the texts of the pages of a document, None if missing."""
+
+    @abc.abstractmethod
+    def _set(self, key: str, pages: List[str]) -> None:
+        """Store the texts of the pages of a document."""
+
+    def lookup(self, key: str) -> Optional[List[str]]:
+        """Look up the cached pages of a document."""
+        pages = self._get(key)
+        with self._lock:
+            if pages is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return pages
+
+    def update(self, key: str, pages: List[str]) -> None:
+        """Cache the pages of a document."""
+        self._set(key, pages)
+
+    def stats(self) -> DocumentCacheStats:
+        """Get the current cache counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+class NoopDocumentCache(DocumentCache):
+    """A document cache that never stores anything."""
+
+    name = "none"
+
+    def _get(self, key: str) -> Optional[List[str]]:
+        return None
+
+    def _set(self, key: str, pages: List[str]) -> None:
+        pass
+
+
+class DiskDocumentCache(DocumentCache):
+    """A document cache storing each document as a JSON file in a directory.
+
+    Once the files take more than `max_size` bytes, the least recently used
+    documents are evicted. Files are written atomically, so the directory can
+    be shared by the processes of a host.
+    """
+
+    name = "disk"
+
+    _SUFFIX = ".json"
+
+    def __init__(self, directory: str, *, max_size: int) -> None:
+        super().__init__()
+        self.directory = directory
+        self.max_size = max_size
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._scan())
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """List the (last use time, path, size) of the cached documents."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(self._SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        return entries
+
+    def _get(self, key: str) -> Optional[List[str]]:
+        path = self._get_path(key)
+        try:
+            with open(path, encoding="utf-8") as file:
+                pages = json.load(file)
+            # The modification time of a file is the time it was last used
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return pages
+
+    def _set(self, key: str, pages: List[str]) -> None:
+        data = json.dumps(pages).encode("utf-8")
+        if len(data) > self.max_size:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, self._get_path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        with self._lock:
+            self._size += len(data)
+            if self._size <= self.max_size:
+                return
+            self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used documents until the cache fits."""
+        entries = sorted(self._scan())
+        self._size = sum(size for _, _, size in entries)
+        for _, path, size in entries:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+
+def create_document_cache(backend: str) -> DocumentCache:
+    """Create a document cache using the configured settings."""
+    if backend == "disk":
+        return DiskDocumentCache(
+            settings.DOCUMENT_CACHE_DIR,
+            max_size=settings.DOCUMENT_CACHE_MAX_SIZE_MB * 1024 * 1024,
+        )
+    elif backend == "none":
+        return NoopDocumentCache()
+    else:
+        raise ValueError(
+            f"Invalid document cache backend {backend}. "
+            f"Expected one of 'disk', 'none'."
+        )
+
+
+DOCUMENT_CACHE = create_document_cache(settings.DOCUMENT_CACHE_BACKEND)
+
+
+def get_document_cache_key(digest: str) -> str:
+    """Get the cache key of the document parsed from a file, given its digest.
+
+    PDFs are parsed into different pages depending on whether ranges of pages
+    are parsed in parallel, and HTML pages into different texts depending on
+    the HTML parser, so these settings are part of the parser version.
+    """
+    pdf_parser = "pages" if settings.PDF_PARALLEL_PAGES else "pdfminer"
+    version = f"{PARSER_VERSION}\x00{pdf_parser}\x00{HTML_PARSER}"
+    data = f"{version}\x00{digest}".encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,293 @@
+"""Cache of the embeddings of chunks and queries.
+
+Embeddings are keyed by the embedding model and a hash of the embedded text,
+so a chunk that was embedded before (e.g., the same document extracted again)
+is not sent to the embedding model again. Only the cache misses of a batch of
+texts are embedded, in a single batch.
+"""
+from __future__ import annotations
+
+import abc
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from typing_extensions import TypedDict
+
+from server import settings
+from server.caching import LRUCache
+from server.executors import DATABASE_EXECUTOR
+
+
+class EmbeddingCacheStats(TypedDict):
+    """Counters describing how the embedding cache is performing."""
+
+    backend: str
+    hits: int
+    misses: int
+    hit_ratio: float
+    query_hits: int
+    query_misses: int
+
+
+class EmbeddingCache(abc.ABC):
+    """Base class for embedding cache backends.
+
+    Backends only need to implement raw lookups and updates of batches of keys,
+    this class keeps track of the hit ratios of documents and queries.
+    """
+
+    name: str
+    # Whether lookups and updates wait on I/O, so that async callers run them
+    # in the database pool rather than on the event loop
+    blocking = False
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.query_hits = 0
+        self.query_misses = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Get the vectors of keys, None for missing keys."""
+
+    @abc.abstractmethod
+    def _set_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        """Store the vectors of keys."""
+
+    def lookup(
+        self, keys: Sequence[str], *, query: bool = False
+    ) -> List[Optional[np.ndarray]]:
+        """Look up cached vectors."""
+        vectors = self._get_many(keys) if keys else []
+        num_hits = sum(vector is not None for vector in vectors)
+        with self._lock:
+            if query:
+                self.query_hits += num_hits
+                self.query_misses += len(vectors) - num_hits
+            else:
+                self.hits += num_hits
+                self.misses += len(vectors) - num_hits
+        return vectors
+
+    def update(self, vectors: Dict[str, np.ndarray]) -> None:
+        """Cache vectors."""
+        if vectors:
+            self._set_many(vectors)
+
+    async def alookup(
+        self, keys: Sequence[str], *, query: bool = False
+    ) -> List[Optional[np.ndarray]]:
+        """Look up cached vectors without blocking the event loop."""
+        if not self.blocking or not keys:
+            return self.lookup(keys, query=query)
+        return await DATABASE_EXECUTOR.run(self.lookup, keys, query=query)
+
+    async def aupdate(self, vectors: Dict[str, np.ndarray]) -> None:
+        """Cache vectors without blocking the event loop."""
+        if not self.blocking or not vectors:
+            return self.update(vectors)
+        await DATABASE_EXECUTOR.run(self.update, vectors)
+
+    def stats(self) -> EmbeddingCacheStats:
+        """Get the current cache counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "query_hits": self.query_hits,
+                "query_misses": self.query_misses,
+            }
+
+
+class NoopEmbeddingCache(EmbeddingCache):
+    """An embedding cache that never stores anything."""
+
+    name = "none"
+
+    def _get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        return [None] * len(keys)
+
+    def _set_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        pass
+
+
+class InMemoryEmbeddingCache(EmbeddingCache):
+    """An in-process LRU embedding cache."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int) -> None:
+        super().__init__()
+        self._cache: LRUCache[np.ndarray] = LRUCache(maxsize)
+
+    def _get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        return [self._cache.get(key) for key in keys]
+
+    def _set_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        for key, vector in vectors.items():
+            self._cache.set(key, vector)
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """An embedding cache stored in a local sqlite database file.
+
+    Vectors are stored as float32 blobs.
+    """
+
+    name = "sqlite"
+    blocking = True
+
+    # Max number of keys looked up with a single query.
+    _BATCH_SIZE = 500
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection_lock = threading.Lock()
+        with self._connection_lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def _get_many(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        found: Dict[str, np.ndarray] = {}
+        with self._connection_lock:
+            for start in range(0, len(keys), self._BATCH_SIZE):
+                batch = keys[start : start + self._BATCH_SIZE]
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return [found.get(key) for key in keys]
+
+    def _set_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        with self._connection_lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in vectors.items()
+                ],
+            )
+
+
+def create_embedding_cache(backend: str) -> EmbeddingCache:
+    """Create an embedding cache using the configured settings."""
+    if backend == "memory":
+        return InMemoryEmbeddingCache(settings.EMBEDDING_CACHE_SIZE)
+    elif backend == "sqlite":
+        return SQLiteEmbeddingCache(settings.EMBEDDING_CACHE_SQLITE_PATH)
+    elif backend == "none":
+        return NoopEmbeddingCache()
+    else:
+        raise ValueError(
+            f"Invalid embedding cache backend {backend}. "
+            f"Expected one of 'memory', 'sqlite', 'none'."
+        )
+
+
+EMBEDDING_CACHE = create_embedding_cache(settings.EMBEDDING_CACHE_BACKEND)
+
+
+def _get_model_name(embeddings: Embeddings) -> str:
+    """Identify the model of embeddings, so vectors of models are not mixed."""
+    model = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", "")
+    return f"{type(embeddings).__name__}:{model}"
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings served from the embedding cache when possible.
+
+    The texts of a batch that are not cached are embedded with a single call.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, cache: Optional[EmbeddingCache] = None
+    ) -> None:
+        self.embeddings = embeddings
+        self.cache = cache or EMBEDDING_CACHE
+        self.model_name = _get_model_name(embeddings)
+
+    def _get_key(self, text: str, *, query: bool = False) -> str:
+        # Some models embed queries differently than documents
+        kind = "query" if query else "document"
+        data = f"{self.model_name}\x00{kind}\x00{text}".encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _find_missing(
+        keys: List[str], texts: List[str], vectors: List[Optional[np.ndarray]]
+    ) -> Dict[str, str]:
+        """Find the texts to embed by key, given the cached vectors of texts."""
+        # Texts repeated in the batch are embedded once
+        missing: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        return missing
+
+    @staticmethod
+    def _merge(
+        keys: List[str],
+        vectors: List[Optional[np.ndarray]],
+        new_vectors: Dict[str, np.ndarray],
+    ) -> List[List[float]]:
+        """Merge the cached and the newly embedded vectors of texts."""
+        return [
+            (vector if vector is not None else new_vectors[key]).tolist()
+            for key, vector in zip(keys, vectors)
+        ]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._get_key(text) for text in texts]
+        vectors = self.cache.lookup(keys)
+        missing = self._find_missing(keys, texts, vectors)
+        embedded = (
+            self.embeddings.embed_documents(list(missing.values())) if missing else []
+        )
+        new_vectors = dict(zip(missing, np.asarray(embedded, dtype=np.float32)))
+        self.cache.update(new_vectors)
+        return self._merge(keys, vectors, new_vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._get_key(text) for text in texts]
+        vectors = await self.cache.alookup(keys)
+        missing = self._find_missing(keys, texts, vectors)
+        embedded = (
+            await self.embeddings.aembed_documents(list(missing.values()))
+            if missing
+            else []
+        )
+        new_vectors = dict(zip(missing, np.asarray(embedded, dtype=np.float32)))
+        await self.cache.aupdate(new_vectors)
+        return self._merge(keys, vectors, new_vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._get_key(text, query=True)
+        (vector,) = self.cache.lookup([key], query=True)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self.cache.update({key: vector})
+        return vector.tolist()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._get_key(text, query=True)
+        (vector,) = await self.cache.alookup([key], query=True)
+        if vector is None:
+            embedded = await self.embeddings.aembed_query(text)
+            vector = np.asarray(embedded, dtype=np.float32)
+            await self.cache.aupdate({key: vector})
+        return vector.tolist()
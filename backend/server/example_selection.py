@@ -0,0 +1,180 @@
+"""Select the few-shot examples sent with each chunk under a token budget.
+
+Examples are ranked by their similarity with the chunk text and the most
+similar ones are kept while they fit in the budget, so that the size of the
+prompt stays bounded as the example set of an extractor grows. The selected
+examples keep their original order.
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from typing import TYPE_CHECKING, Any, List, Literal, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+from server import settings
+from server.embedding_cache import CachedEmbeddings
+from server.models import estimate_num_tokens, get_embeddings
+
+if TYPE_CHECKING:
+    from server.extraction_runnable import ExtractionExample
+
+SelectionMethod = Literal["lexical", "embeddings", "all"]
+
+# Tokens used by the messages wrapping an example (tool call and tool message).
+EXAMPLE_MESSAGES_TOKENS = 30
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_example_tokens(text: str, output: Any) -> int:
+    """Estimate the number of tokens an example adds to the prompt."""
+    return (
+        estimate_num_tokens(text)
+        + estimate_num_tokens(json.dumps(output))
+        + EXAMPLE_MESSAGES_TOKENS
+    )
+
+
+def _get_example_tokens(example: ExtractionExample) -> int:
+    if example.token_count is None:
+        return estimate_example_tokens(example.text, example.output)
+    return example.token_count
+
+
+def _get_words(text: str) -> set:
+    return set(_WORD_PATTERN.findall(text.lower()))
+
+
+def _get_lexical_scores(
+    examples: Sequence[ExtractionExample], text: str
+) -> List[float]:
+    """Score examples by the cosine similarity of their word sets with the text."""
+    words = _get_words(text)
+    scores = []
+    for example in examples:
+        example_words = _get_words(example.text)
+        if not words or not example_words:
+            scores.append(0.0)
+            continue
+        overlap = len(words & example_words)
+        scores.append(overlap / math.sqrt(len(words) * len(example_words)))
+    return scores
+
+
+def _cosine_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    norm = math.sqrt(sum(x * x for x in a) * sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+
+async def _get_embedding_scores(
+    examples: Sequence[ExtractionExample], text: str, embeddings: Embeddings
+) -> List[float]:
+    """Score examples by the cosine similarity of their embeddings with the text.
+
+    Embeddings of the examples are served from the embedding cache, keyed by
+    the embedding model.
+    """
+    if not isinstance(embeddings, CachedEmbeddings):
+        embeddings = CachedEmbeddings(embeddings)
+    vectors = await embeddings.aembed_documents([example.text for example in examples])
+    query = await embeddings.aembed_query(text)
+    return [_cosine_similarity(query, vector) for vector in vectors]
+
+
+# PUBLIC API
+
+
+def select_examples_by_score(
+    examples: Sequence[ExtractionExample],
+    scores: Sequence[float],
+    *,
+    max_tokens: int,
+) -> List[ExtractionExample]:
+    """Keep the examples with the highest scores that fit in the token budget."""
+    selected = []
+    num_tokens = 0
+    for idx in sorted(range(len(examples)), key=lambda idx: (-scores[idx], idx)):
+        example_tokens = _get_example_tokens(examples[idx])
+        if num_tokens + example_tokens <= max_tokens:
+            selected.append(idx)
+            num_tokens += example_tokens
+    return [examples[idx] for idx in sorted(selected)]
+
+
+def select_largest_examples(
+    examples: Sequence[ExtractionExample], *, max_tokens: int
+) -> List[ExtractionExample]:
+    """Select the examples taking the most tokens that fit in the token budget.
+
+    Whatever the text, the examples selected for it never take more tokens, so
+    prompts sized with these examples fit the examples of any chunk.
+    """
+    num_tokens = [max(_get_example_tokens(example), 0) for example in examples]
+    # Bit i of reachable[k] is set when a subset of the first k examples takes
+    # i tokens
+    mask = (1 << (max_tokens + 1)) - 1
+    reachable = [1]
+    for example_tokens in num_tokens:
+        reachable.append((reachable[-1] | reachable[-1] << example_tokens) & mask)
+    total = reachable[-1].bit_length() - 1
+    selected = []
+    for idx in reversed(range(len(examples))):
+        if not reachable[idx] >> total & 1:
+            # The total is only reached with this example
+            selected.append(idx)
+            total -= num_tokens[idx]
+    return [examples[idx] for idx in reversed(selected)]
+
+
+def fits_budget(
+    examples: Sequence[ExtractionExample], max_tokens: Optional[int] = None
+) -> bool:
+    """Check whether all the examples fit in the token budget."""
+    if max_tokens is None:
+        max_tokens = settings.EXAMPLE_TOKEN_BUDGET
+    return sum(_get_example_tokens(example) for example in examples) <= max_tokens
+
+
+async def select_examples(
+    examples: Sequence[ExtractionExample],
+    text: str,
+    *,
+    max_tokens: Optional[int] = None,
+    method: Optional[SelectionMethod] = None,
+    embeddings: Optional[Embeddings] = None,
+) -> List[ExtractionExample]:
+    """Select the examples most relevant to a text under a token budget.
+
+    Args:
+        examples: The examples to select from.
+        text: The text the examples are selected for.
+        max_tokens: Max number of (estimated) tokens of the selected examples.
+            Defaults to the configured budget.
+        method: How examples are ranked, "lexical" (word overlap), "embeddings"
+            or "all" to keep every example. Defaults to the configured method.
+        embeddings: The embeddings used by the "embeddings" method.
+            Defaults to the default embeddings of the server.
+
+    Returns:
+        The selected examples, in their original order.
+    """
+    method = method or settings.EXAMPLE_SELECTION
+    if max_tokens is None:
+        max_tokens = settings.EXAMPLE_TOKEN_BUDGET
+    if method == "all" or fits_budget(examples, max_tokens):
+        return list(examples)
+    if method == "embeddings":
+        scores = await _get_embedding_scores(
+            examples, text, embeddings or get_embeddings()
+        )
+    elif method == "lexical":
+        scores = _get_lexical_scores(examples, text)
+    else:
+        raise ValueError(
+            f"Invalid example selection method {method}. "
+            f"Expected one of 'lexical', 'embeddings', 'all'."
+        )
+    return select_examples_by_score(examples, scores, max_tokens=max_tokens)
@@ -0,0 +1,245 @@
+"""Run the blocking stages of requests without blocking the event loop.
+
+Parsing files, splitting documents into chunks (tiktoken), validating schemas
+and querying the database with the sync SQLAlchemy session are CPU-bound or
+blocking, so a large document would stall every other request handled by the
+event loop. These stages run in bounded pools instead:
+
+* `CPU_EXECUTOR`: threads for chunking, validation and parsing.
+* `PDF_PARSING_EXECUTOR`: processes parsing PDFs (or ranges of their pages),
+  which hold the GIL for long.
+* `DATABASE_EXECUTOR`: threads running the queries of the async endpoints.
+
+At most `max_workers` functions are submitted to a pool at once. Other callers
+wait on the event loop, in order, so the work of a cancelled request never
+piles up in the pool, and the number of waiting callers is reported by the
+/metrics endpoint.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+)
+
+from langchain_community.document_loaders import Blob
+from langchain_core.documents import Document
+from typing_extensions import TypedDict
+
+from extraction.parsing import parse_blob
+from extraction.pdf import (
+    count_pages,
+    extract_page_texts,
+    get_pdf_source,
+    make_page_documents,
+    split_page_ranges,
+)
+from server import settings
+
+T = TypeVar("T")
+
+
+class ExecutorStats(TypedDict):
+    """Counters describing the state of an executor."""
+
+    kind: str
+    max_workers: int
+    running: int
+    queued: int
+    completed: int
+    errors: int
+
+
+class BoundedExecutor:
+    """A pool of threads or processes with a bounded number of submitted calls."""
+
+    def __init__(
+        self, name: str, *, kind: Literal["thread", "process"], max_workers: int
+    ) -> None:
+        """Initialize the executor. The pool is only started when first used.
+
+        Args:
+            name: Prefix of the names of the threads.
+            kind: Whether functions run in threads or in processes.
+            max_workers: The number of threads or processes.
+        """
+        self.name = name
+        self.kind = kind
+        self.max_workers = max(max_workers, 1)
+        self.completed = 0
+        self.errors = 0
+        self._running = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    # Forking a process running threads (e.g., the event loop and
+                    # other pools) is not safe.
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self.name
+                    )
+            return self._executor
+
+    async def _acquire(self) -> None:
+        if self._running < self.max_workers and not self._waiters:
+            self._running += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over right before the cancellation
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        # The slot is handed over to the first waiter, if any
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._running -= 1
+
+    async def run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a function in the pool, waiting for a free worker if needed.
+
+        Functions run in processes must be picklable, as well as their
+        arguments and results.
+        """
+        await self._acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_executor().submit(functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            self._release()
+            raise
+
+        def _on_done(future: Future) -> None:
+            # The slot is only released once the function returned, even if
+            # the caller was cancelled, so the pool never holds more work
+            if not future.cancelled() and future.exception() is not None:
+                self.errors += 1
+            elif not future.cancelled():
+                self.completed += 1
+            self._release()
+
+        future.add_done_callback(
+            lambda future: loop.call_soon_threadsafe(_on_done, future)
+        )
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+    def stats(self) -> ExecutorStats:
+        """Get the current executor counters."""
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "running": self._running,
+            "queued": len(self._waiters),
+            "completed": self.completed,
+            "errors": self.errors,
+        }
+
+
+CPU_EXECUTOR = BoundedExecutor(
+    "cpu", kind="thread", max_workers=settings.CPU_EXECUTOR_THREADS
+)
+
+DATABASE_EXECUTOR = BoundedExecutor(
+    "database", kind="thread", max_workers=settings.DATABASE_EXECUTOR_THREADS
+)
+
+# PDFs are parsed in threads if no process is configured
+PDF_PARSING_EXECUTOR = (
+    BoundedExecutor(
+        "pdf-parsing", kind="process", max_workers=settings.PDF_PARSING_PROCESSES
+    )
+    if settings.PDF_PARSING_PROCESSES > 0
+    else CPU_EXECUTOR
+)
+
+EXECUTORS: Dict[str, BoundedExecutor] = {
+    "cpu": CPU_EXECUTOR,
+    "database": DATABASE_EXECUTOR,
+    "pdf_parsing": PDF_PARSING_EXECUTOR,
+}
+
+
+async def iter_pdf_pages(blob: Blob) -> AsyncIterator[str]:
+    """Parse ranges of pages of a PDF concurrently in the PDF parsing pool.
+
+    The text of each page is yielded in order, as soon as its range is parsed.
+    Only as many ranges as there are parsing processes are parsed ahead of
+    the pages being consumed.
+    """
+    # Files are memory-mapped by the processes rather than copied to them
+    source = get_pdf_source(blob)
+    num_pages = await CPU_EXECUTOR.run(count_pages, source)
+    pages_per_task = max(settings.PDF_PAGES_PER_TASK, 1)
+    page_ranges = split_page_ranges(
+        num_pages,
+        -(-num_pages // pages_per_task),
+        min_pages_per_range=pages_per_task,
+    )
+    tasks: Deque[asyncio.Future] = deque()
+    try:
+        for pages in page_ranges:
+            if len(tasks) >= PDF_PARSING_EXECUTOR.max_workers:
+                for text in await tasks.popleft():
+                    yield text
+            tasks.append(
+                asyncio.ensure_future(
+                    PDF_PARSING_EXECUTOR.run(extract_page_texts, source, pages)
+                )
+            )
+        while tasks:
+            for text in await tasks.popleft():
+                yield text
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def parse_pdf_pages_in_executor(blob: Blob) -> List[Document]:
+    """Parse a PDF in the PDF parsing pool, into one document per page."""
+    page_texts = [text async for text in iter_pdf_pages(blob)]
+    return make_page_documents([page_texts], blob.source)
+
+
+async def parse_blob_in_executor(blob: Blob) -> List[Document]:
+    """Parse a blob in the parsing pool of its mimetype."""
+    if blob.mimetype == "application/pdf":
+        if settings.PDF_PARALLEL_PAGES:
+            return await parse_pdf_pages_in_executor(blob)
+        return await PDF_PARSING_EXECUTOR.run(parse_blob, blob)
+    return await CPU_EXECUTOR.run(parse_blob, blob)
@@ -1,23 +1,57 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
-import uuid
-from typing import Any, Dict, List, Optional, Sequence
+import time
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Literal,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
 
 from fastapi import HTTPException
 from jsonschema import Draft202012Validator, exceptions
-from langchain.text_splitter import TokenTextSplitter
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import chain
+from langchain_core.runnables import Runnable, RunnableConfig, chain
 from langserve import CustomUserType
 from pydantic import BaseModel, Field, validator
 from typing_extensions import TypedDict
 
 from db.models import Example, Extractor
+from extraction.chunking import TokenChunker
+from extraction.duplicates import find_duplicates
 from extraction.utils import update_json_schema
 from server import settings
-from server.models import DEFAULT_MODEL, get_chunk_size, get_model
+from server.caching import LRUCache
+from server.chunk_planner import count_prompt_overhead, make_text_splitter
+from server.concurrency import get_concurrency_limiter
+from server.deduplication import Deduplicator
+from server.example_selection import (
+    fits_budget,
+    select_examples,
+    select_largest_examples,
+)
+from server.executors import CPU_EXECUTOR
+from server.models import estimate_num_tokens, get_model
+from server.prompt_caching import (
+    ANONYMOUS_EXTRACTOR,
+    PROMPT_CACHE_TRACKER,
+    get_prompt_usage,
+)
+from server.rate_limiting import get_rate_limiter
+from server.result_cache import RESULT_CACHE
+from server.scheduler import get_priority, get_scheduling_info
 from server.validators import validate_json_schema
 
 
@@ -31,6 +65,16 @@ class ExtractionExample(BaseModel):
     output: List[Dict[str, Any]] = Field(
         ..., description="The expected output of the example. A list of objects."
     )
+    id: Optional[str] = Field(
+        None,
+        description="Identifier of the example. Used to render the prompt "
+        "identically across calls.",
+    )
+    token_count: Optional[int] = Field(
+        None,
+        description="Estimated number of tokens the example adds to the prompt. "
+        "Estimated from the text and output if not provided.",
+    )
 
 
 class ExtractRequest(CustomUserType):
@@ -58,6 +102,13 @@ class ExtractRequest(CustomUserType):
         return v
 
 
+class DuplicateChunk(TypedDict):
+    """A chunk that was not extracted because it duplicates an earlier chunk."""
+
+    chunk: int
+    duplicate_of: int
+
+
 class ExtractResponse(TypedDict, total=False):
     """Response body for the extract endpoint."""
 
@@ -65,32 +116,77 @@ class ExtractResponse(TypedDict, total=False):
     # content to long will be set to true if the content is too long
     # and had to be truncated
     content_too_long: Optional[bool]
+    # number of chunks that were not extracted because they duplicate
+    # another chunk of the document
+    skipped_chunks: Optional[int]
+    # the chunks that were skipped, and the chunks they duplicate
+    duplicate_chunks: Optional[List[DuplicateChunk]]
+    # information about how the content was obtained, e.g., "document_cache"
+    # is "hit" if the uploaded file was parsed before and "miss" otherwise
+    metadata: Optional[Dict[str, Any]]
+
+
+class ChunkStatus(TypedDict, total=False):
+    """Status of a single chunk of a streamed extraction."""
+
+    chunk: int
+    status: Literal["success", "error", "skipped"]
+    error: str
+    duplicate_of: int
+
+
+class ExtractionEvent(TypedDict):
+    """An event emitted while streaming an extraction.
+
+    "data" events hold the index of the chunk and the newly extracted items,
+    the final "end" event holds `content_too_long` and the status of each chunk.
+    """
+
+    event: Literal["data", "end"]
+    data: Dict[str, Any]
+
+
+SYSTEM_PROMPT_PREFIX = (
+    "You are a top-tier algorithm for extracting information from text. "
+    "Only extract information that is relevant to the provided text. "
+    "If no information is relevant, use the schema and output "
+    "an empty list where appropriate."
+)
 
 
 def _cast_example_to_dict(example: Example) -> Dict[str, Any]:
     """Cast example record to dictionary."""
     return {
+        "id": str(example.uuid),
         "text": example.content,
         "output": example.output,
+        "token_count": example.token_count,
     }
 
 
+def _get_example_tool_call_id(example: ExtractionExample) -> str:
+    """Get a tool call id that is the same every time an example is rendered.
+
+    Stable ids keep the prompt prefix identical across calls, so that it can be
+    served from the prompt cache of the provider.
+    """
+    if example.id:
+        key = example.id
+    else:
+        key = json.dumps([example.text, example.output], sort_keys=True)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
+
+
 def _make_prompt_template(
     instructions: Optional[str],
     examples: Optional[Sequence[ExtractionExample]],
     function_name: str,
 ) -> ChatPromptTemplate:
     """Make a system message from instructions and examples."""
-    prefix = (
-        "You are a top-tier algorithm for extracting information from text. "
-        "Only extract information that is relevant to the provided text. "
-        "If no information is relevant, use the schema and output "
-        "an empty list where appropriate."
-    )
     if instructions:
-        system_message = ("system", f"{prefix}\n\n{instructions}")
+        system_message = ("system", f"{SYSTEM_PROMPT_PREFIX}\n\n{instructions}")
     else:
-        system_message = ("system", prefix)
+        system_message = ("system", SYSTEM_PROMPT_PREFIX)
     prompt_components = [system_message]
     if examples is not None:
         few_shot_prompt = []
@@ -98,7 +194,7 @@ def _make_prompt_template(
             # TODO: We'll need to refactor this at some point to
             # support other encoding strategies. The function calling logic here
             # has some hard-coded assumptions (e.g., name of parameters like `data`).
-            _id = uuid.uuid4().hex[:]
+            _id = _get_example_tool_call_id(example)
             tool_call = {
                 "args": {"data": example.output},
                 "name": function_name,
@@ -125,41 +221,56 @@ def _make_prompt_template(
     return ChatPromptTemplate.from_messages(prompt_components)
 
 
-# PUBLIC API
+class DocumentRequests(Sequence[ExtractRequest]):
+    """The extraction requests of the chunks of a document.
 
+    Requests are created from the template when accessed, so the text of a
+    chunk is only materialized when the chunk is dispatched.
+    """
 
-def deduplicate(
-    extract_responses: Sequence[ExtractResponse],
-) -> ExtractResponse:
-    """Deduplicate the results.
+    def __init__(self, template: ExtractRequest, texts: Sequence[str]) -> None:
+        self.template = template
+        self.texts = texts
 
-    The deduplication is done by comparing the serialized JSON of each of the results
-    and only keeping the unique ones.
-    """
-    unique_extracted = []
-    seen = set()
-    for response in extract_responses:
-        for data_item in response["data"]:
-            # Serialize the data item for comparison purposes
-            serialized = json.dumps(data_item, sort_keys=True)
-            if serialized not in seen:
-                seen.add(serialized)
-                unique_extracted.append(data_item)
+    def __len__(self) -> int:
+        return len(self.texts)
 
-    return {
-        "data": unique_extracted,
-    }
+    @overload
+    def __getitem__(self, index: int) -> ExtractRequest:
+        ...
 
+    @overload
+    def __getitem__(self, index: slice) -> DocumentRequests:
+        ...
 
-def get_examples_from_extractor(extractor: Extractor) -> List[Dict[str, Any]]:
-    """Get examples from an extractor."""
-    return [_cast_example_to_dict(example) for example in extractor.examples]
+    def __getitem__(
+        self, index: Union[int, slice]
+    ) -> Union[ExtractRequest, DocumentRequests]:
+        if isinstance(index, slice):
+            return DocumentRequests(self.template, self.texts[index])
+        return self.template.copy(update={"text": self.texts[index]})
 
 
-@chain
-async def extraction_runnable(extraction_request: ExtractRequest) -> ExtractResponse:
-    """An end point to extract content from a given text object."""
-    # TODO: Add validation for model context window size
+class CompiledExtractor(NamedTuple):
+    """Artifacts derived from an extraction request that are reused across chunks."""
+
+    schema: Dict[str, Any]
+    """The dereferenced and validated JSON schema used for structured output."""
+    prompt: ChatPromptTemplate
+    """The prompt template including the system message and few-shot examples."""
+    runnable: Runnable
+    """The prompt bound to the structured output model."""
+    prompt_overhead_tokens: int
+    """Prompt tokens used in addition to the chunk text, see `count_prompt_overhead`."""
+
+
+COMPILED_EXTRACTORS: LRUCache[CompiledExtractor] = LRUCache(
+    settings.COMPILED_EXTRACTOR_CACHE_SIZE
+)
+
+
+def _compile(extraction_request: ExtractRequest) -> CompiledExtractor:
+    """Compile the schema, prompt and model of an extraction request."""
     schema = update_json_schema(extraction_request.json_schema)
     try:
         Draft202012Validator.check_schema(schema)
@@ -172,52 +283,444 @@ async def extraction_runnable(extraction_request: ExtractRequest) -> ExtractResp
         schema["title"],
     )
     model = get_model(extraction_request.model_name)
-    runnable = (prompt | model.with_structured_output(schema=schema)).with_config(
-        {"run_name": "extraction"}
+    # The raw message holds the usage metadata of the call
+    runnable = (
+        prompt | model.with_structured_output(schema=schema, include_raw=True)
+    ).with_config({"run_name": "extraction"})
+    return CompiledExtractor(
+        schema=schema,
+        prompt=prompt,
+        runnable=runnable,
+        prompt_overhead_tokens=count_prompt_overhead(
+            prompt, schema, extraction_request.model_name
+        ),
     )
 
-    return await runnable.ainvoke({"text": extraction_request.text})
 
+def _get_result_cache_key(
+    extraction_request: ExtractRequest, compiled: CompiledExtractor
+) -> str:
+    """Hash everything that determines the extraction result of a chunk."""
+    examples = extraction_request.examples or []
+    serialized = json.dumps(
+        {
+            "text": extraction_request.text,
+            "schema": compiled.schema,
+            "instructions": extraction_request.instructions,
+            "examples": [example.dict() for example in examples],
+            "model_name": extraction_request.model_name,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
 
-async def extract_entire_document(
-    content: str,
-    extractor: Extractor,
-    model_name: str,
+
+# PUBLIC API
+
+
+def get_request_cache_key(extraction_request: ExtractRequest) -> str:
+    """Hash everything that goes into compiling an extraction request."""
+    examples = extraction_request.examples or []
+    serialized = json.dumps(
+        {
+            "schema": extraction_request.json_schema,
+            "instructions": extraction_request.instructions,
+            "examples": [example.dict() for example in examples],
+            "model_name": extraction_request.model_name,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def get_extractor_cache_key(extractor: Extractor, model_name: Optional[str]) -> str:
+    """Get a key identifying the current version of a stored extractor.
+
+    Examples live in their own table, so their count and latest update time
+    are part of the key as well.
+    """
+    examples = extractor.examples
+    examples_updated_at = max(
+        (example.updated_at for example in examples if example.updated_at),
+        default=None,
+    )
+    return (
+        f"{extractor.uuid}:{extractor.updated_at}:"
+        f"{len(examples)}:{examples_updated_at}:{model_name}"
+    )
+
+
+def get_run_config(
+    extractor: Extractor, model_name: Optional[str], num_chunks: int
+) -> RunnableConfig:
+    """Get the config of the runs extracting chunks with a stored extractor.
+
+    The metadata identifies the compiled extractor to use, and the configurable
+    fields hold the owner and priority used to schedule the chunks.
+    """
+    return {
+        "metadata": {
+            "extractor_cache_key": get_extractor_cache_key(extractor, model_name),
+            "extractor_id": str(extractor.uuid),
+        },
+        "configurable": {
+            "owner_id": str(extractor.owner_id),
+            "priority": get_priority(num_chunks),
+        },
+    }
+
+
+def get_compiled_extractor(
+    extraction_request: ExtractRequest, *, cache_key: Optional[str] = None
+) -> CompiledExtractor:
+    """Get the compiled artifacts for an extraction request.
+
+    Args:
+        extraction_request: The request to compile.
+        cache_key: Key identifying the extractor the request was created from.
+            If not provided, a hash of the request schema, instructions,
+            examples and model name is used instead.
+
+    Returns:
+        The compiled extractor, served from the in-process cache when possible.
+    """
+    key = cache_key or get_request_cache_key(extraction_request)
+    compiled = COMPILED_EXTRACTORS.get(key)
+    if compiled is None:
+        compiled = _compile(extraction_request)
+        COMPILED_EXTRACTORS.set(key, compiled)
+    return compiled
+
+
+def _get_selected_examples_cache_key(
+    cache_key: Optional[str], examples: Sequence[ExtractionExample]
+) -> Optional[str]:
+    """Get the key of an extractor compiled with a subset of its examples.
+
+    The same subset is selected for many chunks, so its compiled extractor is
+    cached under the ids of the selected examples. Returns None when the key
+    cannot be derived, in which case the whole request is hashed instead.
+    """
+    if cache_key is None or any(example.id is None for example in examples):
+        return None
+    return f"{cache_key}:{','.join(example.id for example in examples)}"
+
+
+def deduplicate(
+    extract_responses: Sequence[ExtractResponse],
 ) -> ExtractResponse:
-    """Extract from entire document."""
+    """Deduplicate the results.
 
-    json_schema = extractor.schema
-    examples = get_examples_from_extractor(extractor)
-    text_splitter = TokenTextSplitter(
-        chunk_size=get_chunk_size(model_name),
-        chunk_overlap=20,
-        model_name=DEFAULT_MODEL,
+    The deduplication is done by comparing digests of the serialized JSON of each
+    of the results and only keeping the unique ones.
+    """
+    unique_extracted = []
+    with Deduplicator() as deduplicator:
+        for response in extract_responses:
+            unique_extracted.extend(deduplicator.filter(response["data"]))
+
+    return {
+        "data": unique_extracted,
+    }
+
+
+def get_examples_from_extractor(extractor: Extractor) -> List[Dict[str, Any]]:
+    """Get examples from an extractor, in a stable order."""
+    examples = sorted(
+        extractor.examples,
+        key=lambda example: (example.created_at or datetime.min, str(example.uuid)),
     )
-    texts = text_splitter.split_text(content)
-    extraction_requests = [
-        ExtractRequest(
-            text=text,
-            schema=json_schema,
-            instructions=extractor.instruction,  # TODO: consistent naming
-            examples=examples,
-            model_name=model_name,
+    return [_cast_example_to_dict(example) for example in examples]
+
+
+async def invoke_with_limits(
+    runnable: Runnable,
+    inputs: Dict[str, Any],
+    *,
+    model_name: Optional[str],
+    prompt_tokens: int,
+    config: Optional[RunnableConfig],
+) -> Dict[str, Any]:
+    """Invoke a compiled runnable within the concurrency and rate limits of a model.
+
+    The prompt usage of the call is recorded for the extractor of the run.
+
+    Args:
+        runnable: The runnable calling the model, returning the raw message and
+            the parsed output (see `include_raw` of `with_structured_output`).
+        inputs: The inputs of the runnable.
+        model_name: The model called by the runnable.
+        prompt_tokens: Estimated number of tokens sent to the model.
+        config: The config of the run, holding its owner, priority and extractor.
+
+    Returns:
+        The parsed output.
+    """
+    owner, priority = get_scheduling_info(config)
+    limiter = get_concurrency_limiter(model_name)
+    rate_limiter = get_rate_limiter(model_name)
+    # Chunks wait for a slot in fair order across owners first, so that
+    # the rate limit capacity is also shared fairly. Only the model call is
+    # timed, not the wait for rate limits.
+    async with limiter.limit_concurrency(
+        owner=owner, priority=priority, cost=prompt_tokens
+    ) as slot:
+        await rate_limiter.acquire(prompt_tokens + settings.OUTPUT_TOKEN_RESERVATION)
+        slot.start()
+        start_time = slot.start_time
+        try:
+            result = await runnable.ainvoke(inputs)
+        except Exception:
+            rate_limiter.refund(settings.OUTPUT_TOKEN_RESERVATION)
+            raise
+    latency = time.monotonic() - start_time
+    usage = get_prompt_usage(result["raw"])
+    if usage is not None:
+        extractor_id = (
+            (config or {}).get("metadata", {}).get("extractor_id", ANONYMOUS_EXTRACTOR)
         )
-        for text in texts
-    ]
+        PROMPT_CACHE_TRACKER.record(extractor_id, usage, latency)
+    if result.get("parsing_error"):
+        raise result["parsing_error"]
+    response = result["parsed"]
+    output_tokens = estimate_num_tokens(json.dumps(response))
+    rate_limiter.refund(settings.OUTPUT_TOKEN_RESERVATION - output_tokens)
+    return response
+
+
+@chain
+async def extraction_runnable(
+    extraction_request: ExtractRequest, config: RunnableConfig
+) -> ExtractResponse:
+    """An end point to extract content from a given text object."""
+    cache_key = config.get("metadata", {}).get("extractor_cache_key")
+    examples = extraction_request.examples or []
+    selected_examples = await select_examples(examples, extraction_request.text)
+    if len(selected_examples) < len(examples):
+        extraction_request = extraction_request.copy(
+            update={"examples": selected_examples}
+        )
+        cache_key = _get_selected_examples_cache_key(cache_key, selected_examples)
+    compiled = get_compiled_extractor(extraction_request, cache_key=cache_key)
+    prompt_tokens = compiled.prompt_overhead_tokens + estimate_num_tokens(
+        extraction_request.text
+    )
+    return await invoke_with_limits(
+        compiled.runnable,
+        {"text": extraction_request.text},
+        model_name=extraction_request.model_name,
+        prompt_tokens=prompt_tokens,
+        config=config,
+    )
+
+
+async def extract_with_cache(
+    extraction_requests: Sequence[ExtractRequest],
+    config: Optional[RunnableConfig] = None,
+) -> List[ExtractResponse]:
+    """Run extractions, serving chunks from the result cache when possible.
+
+    Only the chunks that are not in the result cache are sent to the model.
+    The responses are returned in the same order as the requests.
+    """
+    cache_key = (config or {}).get("metadata", {}).get("extractor_cache_key")
+    responses: List[Optional[ExtractResponse]] = []
+    misses = []
+    for extraction_request in extraction_requests:
+        compiled = get_compiled_extractor(extraction_request, cache_key=cache_key)
+        key = _get_result_cache_key(extraction_request, compiled)
+        cached = await RESULT_CACHE.alookup(key)
+        if cached is None:
+            misses.append((len(responses), key, compiled))
+        responses.append(cached)
+
+    if misses:
+        extracted = await extraction_runnable.abatch(
+            [extraction_requests[idx] for idx, _, _ in misses], config
+        )
+        for (idx, key, compiled), response in zip(misses, extracted):
+            num_tokens = (
+                compiled.prompt_overhead_tokens
+                + estimate_num_tokens(extraction_requests[idx].text)
+                + estimate_num_tokens(json.dumps(response))
+            )
+            await RESULT_CACHE.aupdate(key, response, num_tokens)
+            responses[idx] = response
+    return responses
+
+
+def make_request_template(extractor: Extractor, model_name: str) -> ExtractRequest:
+    """Make the extraction request of a stored extractor, without text."""
+    return ExtractRequest(
+        text="",
+        schema=extractor.schema,
+        instructions=extractor.instruction,  # TODO: consistent naming
+        examples=get_examples_from_extractor(extractor),
+        model_name=model_name,
+    )
+
+
+def make_chunk_splitter(
+    template: ExtractRequest, *, cache_key: Optional[str] = None
+) -> TokenChunker:
+    """Make the text splitter of the documents extracted with a request template.
+
+    The chunks are sized to fit next to the compiled prompt and schema.
+    """
+    if settings.EXAMPLE_SELECTION == "all" or fits_budget(template.examples):
+        compiled = get_compiled_extractor(template, cache_key=cache_key)
+    else:
+        # Chunks are sized for the largest examples that may be selected
+        examples = select_largest_examples(
+            template.examples, max_tokens=settings.EXAMPLE_TOKEN_BUDGET
+        )
+        compiled = get_compiled_extractor(template.copy(update={"examples": examples}))
+    return make_text_splitter(compiled.prompt, compiled.schema, template.model_name)
+
+
+def split_document(
+    content: str, template: ExtractRequest, text_splitter: TokenChunker
+) -> Tuple[DocumentRequests, bool]:
+    """Split a document into the extraction requests of its chunks.
+
+    Returns:
+        The extraction requests and whether the content was too long and
+        had to be truncated to the max number of chunks.
+    """
+    texts = text_splitter.split_text(content)
 
     # Limit the number of chunks to process
-    if len(extraction_requests) > settings.MAX_CHUNKS and settings.MAX_CHUNKS > 0:
+    if len(texts) > settings.MAX_CHUNKS and settings.MAX_CHUNKS > 0:
         content_too_long = True
-        extraction_requests = extraction_requests[: settings.MAX_CHUNKS]
+        texts = texts[: settings.MAX_CHUNKS]
     else:
         content_too_long = False
+    return DocumentRequests(template, texts), content_too_long
+
 
-    # Run extractions which may potentially yield duplicate results
-    extract_responses: List[ExtractResponse] = await extraction_runnable.abatch(
-        extraction_requests, {"max_concurrency": settings.MAX_CONCURRENCY}
+def make_document_requests(
+    content: str,
+    extractor: Extractor,
+    model_name: str,
+) -> Tuple[DocumentRequests, bool]:
+    """Split a document into extraction requests.
+
+    Returns:
+        The extraction requests and whether the content was too long and
+        had to be truncated to the max number of chunks.
+    """
+    template = make_request_template(extractor, model_name)
+    text_splitter = make_chunk_splitter(
+        template, cache_key=get_extractor_cache_key(extractor, model_name)
     )
-    # Deduplicate the results
-    return {
-        "data": deduplicate(extract_responses)["data"],
-        "content_too_long": content_too_long,
+    return split_document(content, template, text_splitter)
+
+
+def find_duplicate_chunks(
+    extraction_requests: DocumentRequests,
+) -> List[Optional[int]]:
+    """Find the chunks repeating an earlier chunk, which need not be extracted.
+
+    Returns:
+        For each chunk, the index of the earlier chunk it duplicates, or None.
+    """
+    if not settings.SKIP_DUPLICATE_CHUNKS:
+        return [None] * len(extraction_requests)
+    return find_duplicates(
+        extraction_requests.texts, threshold=settings.DUPLICATE_CHUNK_THRESHOLD
+    )
+
+
+def _prepare_document(
+    content: str, extractor: Extractor, model_name: str
+) -> Tuple[DocumentRequests, bool, List[Optional[int]]]:
+    """Split a document and find its duplicate chunks. Run in the CPU pool."""
+    extraction_requests, content_too_long = make_document_requests(
+        content, extractor, model_name
+    )
+    return (
+        extraction_requests,
+        content_too_long,
+        find_duplicate_chunks(extraction_requests),
+    )
+
+
+async def stream_entire_document(
+    content: str,
+    extractor: Extractor,
+    model_name: str,
+) -> AsyncIterator[ExtractionEvent]:
+    """Extract from entire document, yielding results as chunks complete.
+
+    Chunks are yielded in completion order rather than submission order.
+    Each "data" event only contains the items that were not seen in the
+    chunks that completed before it. A failed chunk does not abort the
+    stream; its error is reported in the final "end" event instead, as are
+    the chunks that were skipped as duplicates of another chunk.
+
+    The document is split eagerly, so the extractor is no longer accessed
+    once this function returns (e.g., after its database session was closed).
+    """
+    extraction_requests, content_too_long, duplicate_of = await CPU_EXECUTOR.run(
+        _prepare_document, content, extractor, model_name
+    )
+    num_unique = duplicate_of.count(None)
+    config = get_run_config(extractor, model_name, num_unique)
+    return _stream_extractions(
+        extraction_requests, duplicate_of, content_too_long, config
+    )
+
+
+async def _stream_extractions(
+    extraction_requests: Sequence[ExtractRequest],
+    duplicate_of: Sequence[Optional[int]],
+    content_too_long: bool,
+    config: RunnableConfig,
+) -> AsyncIterator[ExtractionEvent]:
+    """Run extraction requests concurrently and yield events as they complete.
+
+    The number of concurrent model calls is bounded by the model's concurrency
+    limiter rather than per request.
+    """
+
+    async def _extract_chunk(
+        idx: int,
+    ) -> Tuple[int, Optional[ExtractResponse], Optional[str]]:
+        try:
+            responses = await extract_with_cache([extraction_requests[idx]], config)
+        except Exception as e:
+            return idx, None, repr(e)
+        return idx, responses[0], None
+
+    tasks = [
+        asyncio.ensure_future(_extract_chunk(idx))
+        for idx, original in enumerate(duplicate_of)
+        if original is None
+    ]
+    chunks: List[ChunkStatus] = [
+        {"chunk": idx, "status": "skipped", "duplicate_of": original}
+        for idx, original in enumerate(duplicate_of)
+        if original is not None
+    ]
+    deduplicator = Deduplicator()
+    try:
+        for future in asyncio.as_completed(tasks):
+            idx, response, error = await future
+            if response is None:
+                chunks.append({"chunk": idx, "status": "error", "error": error})
+                continue
+            new_items = deduplicator.filter(response["data"])
+            chunks.append({"chunk": idx, "status": "success"})
+            yield {"event": "data", "data": {"chunk": idx, "data": new_items}}
+    finally:
+        for task in tasks:
+            task.cancel()
+        deduplicator.close()
+
+    yield {
+        "event": "end",
+        "data": {
+            "content_too_long": content_too_long,
+            "chunks": sorted(chunks, key=lambda chunk: chunk["chunk"]),
+        },
     }
@@ -0,0 +1,308 @@
+"""Extract from entire documents in background jobs.
+
+A job is created with the chunks of its document, then its chunks are
+extracted in the background. The progress and the result of each chunk are
+persisted as the chunks complete, so clients poll for the status of the job
+and page through the results instead of holding a connection open.
+
+The chunks are pulled from the work queue by workers, either running in the
+API process that created the job or in dedicated processes
+(see scripts/run_worker.py).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Callable, List, NamedTuple, Optional, Sequence, Set
+from uuid import UUID
+
+from langchain_core.runnables import RunnableConfig
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from db.models import ExtractionJob, Extractor, JobChunk
+from server import settings
+from server.caching import LRUCache
+from server.executors import DATABASE_EXECUTOR
+from server.extraction_runnable import (
+    ExtractRequest,
+    ExtractResponse,
+    extract_with_cache,
+    find_duplicate_chunks,
+    get_compiled_extractor,
+    get_extractor_cache_key,
+    get_run_config,
+    make_document_requests,
+    make_request_template,
+)
+from server.models import estimate_num_tokens
+from server.work_queue import (
+    ClaimedChunk,
+    claim_chunks,
+    complete_chunk,
+    extend_leases,
+    fail_chunk,
+    has_delayed_chunks,
+)
+
+logger = logging.getLogger(__name__)
+
+# Keeps a reference to the running jobs, so they are not garbage collected.
+RUNNING_JOBS: Set[asyncio.Task] = set()
+
+
+class JobChunks(NamedTuple):
+    """The chunks of the document of a job, before they are stored."""
+
+    texts: Sequence[str]
+    # For each chunk, the index of the earlier chunk it duplicates, or None
+    duplicate_of: List[Optional[int]]
+    content_too_long: bool
+
+
+def split_job_document(
+    content: str, extractor: Extractor, model_name: str
+) -> JobChunks:
+    """Split the document of a job into chunks and find the duplicate chunks.
+
+    This is CPU-bound, so it runs in the CPU pool rather than while holding a
+    database worker.
+    """
+    extraction_requests, content_too_long = make_document_requests(
+        content, extractor, model_name
+    )
+    return JobChunks(
+        texts=extraction_requests.texts,
+        duplicate_of=find_duplicate_chunks(extraction_requests),
+        content_too_long=content_too_long,
+    )
+
+
+def create_job(
+    session: Session, chunks: JobChunks, extractor: Extractor, model_name: str
+) -> ExtractionJob:
+    """Create a job extracting from a document, with the chunks of the document.
+
+    Chunks that duplicate an earlier chunk are stored as skipped.
+    """
+    duplicate_of = chunks.duplicate_of
+    job = ExtractionJob(
+        owner_id=extractor.owner_id,
+        extractor_id=extractor.uuid,
+        model_name=model_name,
+        # Jobs without chunks to extract are complete right away
+        status="pending" if None in duplicate_of else "succeeded",
+        total_chunks=len(chunks.texts),
+        skipped_chunks=len(duplicate_of) - duplicate_of.count(None),
+        content_too_long=chunks.content_too_long,
+    )
+    session.add(job)
+    session.flush()
+    if chunks.texts:
+        session.execute(
+            insert(JobChunk),
+            [
+                {
+                    "job_id": job.uuid,
+                    "index": idx,
+                    "text": text,
+                    "status": "pending" if original is None else "skipped",
+                    "duplicate_of": original,
+                }
+                for idx, (text, original) in enumerate(zip(chunks.texts, duplicate_of))
+            ],
+        )
+    session.commit()
+    return job
+
+
+def _estimate_tokens(
+    extraction_request: ExtractRequest,
+    response: ExtractResponse,
+    cache_key: Optional[str],
+) -> int:
+    """Estimate the tokens used to extract a chunk, prompt and output included."""
+    compiled = get_compiled_extractor(extraction_request, cache_key=cache_key)
+    return (
+        compiled.prompt_overhead_tokens
+        + estimate_num_tokens(extraction_request.text)
+        + estimate_num_tokens(json.dumps(response))
+    )
+
+
+class _JobContext(NamedTuple):
+    """What a worker needs to extract the chunks of a job."""
+
+    template: ExtractRequest
+    config: RunnableConfig
+    cache_key: str
+
+
+class Worker:
+    """Claim the chunks of extraction jobs from the work queue and extract them.
+
+    Up to `concurrency` chunks are extracted at once. The leases of the chunks
+    being extracted are extended periodically, so they are only claimed by
+    another worker if this worker dies.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        *,
+        worker_id: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        poll_interval: float = 1.0,
+        job_id: Optional[UUID] = None,
+    ) -> None:
+        """Create a worker.
+
+        Args:
+            session_factory: Creates the sessions used to access the database.
+            worker_id: Identifies the worker in the leases of its chunks.
+                Defaults to the host, the process and a random suffix.
+            concurrency: Max number of chunks extracted at once.
+                Defaults to the configured concurrency.
+            lease_seconds: The duration of the leases of the chunks.
+                Defaults to the configured duration.
+            poll_interval: Time in seconds between polls of the queue when idle.
+            job_id: Only extract the chunks of this job if provided.
+        """
+        self.session_factory = session_factory
+        self.worker_id = (
+            worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.concurrency = concurrency or settings.JOB_WORKER_CONCURRENCY
+        self.lease_seconds = lease_seconds or settings.JOB_CHUNK_LEASE_SECONDS
+        self.poll_interval = poll_interval
+        self.job_id = job_id
+        self._jobs: LRUCache[Optional[_JobContext]] = LRUCache(128)
+        self._running: Set[ClaimedChunk] = set()
+
+    def _get_job_context(self, job_id: UUID) -> Optional[_JobContext]:
+        """Get the context of a job, or None if the job was deleted."""
+        key = str(job_id)
+        if key in self._jobs:
+            return self._jobs.get(key)
+        with self.session_factory() as session:
+            job = session.get(ExtractionJob, job_id)
+            extractor = (
+                None if job is None else session.get(Extractor, job.extractor_id)
+            )
+            if extractor is None:
+                context = None
+            else:
+                num_chunks = job.total_chunks - job.skipped_chunks
+                context = _JobContext(
+                    template=make_request_template(extractor, job.model_name),
+                    config=get_run_config(extractor, job.model_name, num_chunks),
+                    cache_key=get_extractor_cache_key(extractor, job.model_name),
+                )
+        self._jobs.set(key, context)
+        return context
+
+    async def _extract_chunk(self, chunk: ClaimedChunk) -> None:
+        try:
+            context = await DATABASE_EXECUTOR.run(self._get_job_context, chunk.job_id)
+            if context is None:
+                # The job was deleted with its chunks
+                return
+            extraction_request = context.template.copy(update={"text": chunk.text})
+            responses = await extract_with_cache([extraction_request], context.config)
+            num_tokens = _estimate_tokens(
+                extraction_request, responses[0], context.cache_key
+            )
+        except Exception as e:
+            logger.warning(
+                "Chunk %s of job %s failed: %r", chunk.index, chunk.job_id, e
+            )
+            await DATABASE_EXECUTOR.run(
+                fail_chunk, self.session_factory, self.worker_id, chunk, repr(e)
+            )
+            return
+        finally:
+            self._running.discard(chunk)
+        await DATABASE_EXECUTOR.run(
+            complete_chunk,
+            self.session_factory,
+            self.worker_id,
+            chunk,
+            responses[0]["data"],
+            num_tokens,
+        )
+
+    async def _heartbeat(self) -> None:
+        """Extend the leases of the running chunks until cancelled."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await DATABASE_EXECUTOR.run(
+                extend_leases,
+                self.session_factory,
+                self.worker_id,
+                list(self._running),
+                lease_seconds=self.lease_seconds,
+            )
+
+    async def run(self, *, stop_when_idle: bool = False) -> None:
+        """Extract chunks from the queue until cancelled.
+
+        Args:
+            stop_when_idle: Return once no chunk is left to claim or to retry
+                instead of polling the queue.
+        """
+        heartbeat = asyncio.create_task(self._heartbeat())
+        tasks: Set[asyncio.Task] = set()
+        try:
+            while True:
+                claimed = await DATABASE_EXECUTOR.run(
+                    claim_chunks,
+                    self.session_factory,
+                    self.worker_id,
+                    limit=self.concurrency - len(tasks),
+                    lease_seconds=self.lease_seconds,
+                    job_id=self.job_id,
+                )
+                for chunk in claimed:
+                    self._running.add(chunk)
+                    tasks.add(asyncio.create_task(self._extract_chunk(chunk)))
+                if not tasks:
+                    if stop_when_idle and not await DATABASE_EXECUTOR.run(
+                        has_delayed_chunks, self.session_factory, job_id=self.job_id
+                    ):
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                _, tasks = await asyncio.wait(
+                    tasks,
+                    timeout=self.poll_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+        finally:
+            heartbeat.cancel()
+            for task in tasks:
+                task.cancel()
+
+
+async def run_job(job_id: UUID, session_factory: Callable[[], Session]) -> None:
+    """Extract the chunks of a job in this process.
+
+    Chunks already claimed by other workers are left to them.
+    """
+    try:
+        await Worker(session_factory, job_id=job_id).run(stop_when_idle=True)
+    except Exception:
+        logger.exception("Extraction job %s failed.", job_id)
+
+
+def start_job(job_id: UUID, session_factory: Callable[[], Session]) -> None:
+    """Run a job in the background of the event loop, unless workers run it."""
+    if not settings.RUN_JOBS_IN_PROCESS:
+        return
+    task = asyncio.create_task(run_job(job_id, session_factory))
+    RUNNING_JOBS.add(task)
+    task.add_done_callback(RUNNING_JOBS.discard)
@@ -2,18 +2,26 @@
 import logging
 import os
 from pathlib import Path
+from typing import Any, Dict
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from langserve import add_routes
 
-from server.api import configurables, examples, extract, extractors, shared, suggest
-from server.extraction_runnable import (
-    ExtractRequest,
-    ExtractResponse,
-    extraction_runnable,
+from server.api import (
+    configurables,
+    examples,
+    extract,
+    extractors,
+    jobs,
+    metrics,
+    shared,
+    suggest,
 )
+from server.extraction_runnable import ExtractRequest, ExtractResponse
+from server.packing import packing_extraction_runnable
+from server.upload_limits import MaxBodySizeMiddleware
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +52,10 @@ if ORIGINS:
     )
 
 
+# Oversized uploads are rejected before they are read
+app.add_middleware(MaxBodySizeMiddleware)
+
+
 @app.get("/ready")
 def ready() -> str:
     return "ok"
@@ -53,17 +65,38 @@ def ready() -> str:
 app.include_router(extractors.router)
 app.include_router(examples.router)
 app.include_router(extract.router)
+app.include_router(jobs.router)
 app.include_router(suggest.router)
 app.include_router(shared.router)
 app.include_router(configurables.router)
+app.include_router(metrics.router)
+
+
+def _add_scheduling_info(config: Dict[str, Any], request: Request) -> Dict[str, Any]:
+    """Schedule /extract_text chunks fairly by the user key of the caller.
+
+    Batches are extracted with bulk priority. Values sent by the client
+    are overwritten.
+    """
+    scheduling_info = {
+        "owner_id": request.headers.get("x-key"),
+        "priority": "bulk" if request.url.path.endswith("/batch") else "interactive",
+    }
+    return {
+        **config,
+        "configurable": {**config.get("configurable", {}), **scheduling_info},
+    }
+
 
 add_routes(
     app,
-    extraction_runnable.with_types(
+    # Short texts sent to the batch endpoint are packed into shared calls
+    packing_extraction_runnable.with_types(
         input_type=ExtractRequest, output_type=ExtractResponse
     ),
     path="/extract_text",
     enabled_endpoints=["invoke", "batch"],
+    per_req_config_modifier=_add_scheduling_info,
 )
 
 
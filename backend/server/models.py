@@ -2,10 +2,47 @@ import os
 from typing import Optional
 
 from langchain_anthropic import ChatAnthropic
+from langchain_core.embeddings import Embeddings
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_fireworks import ChatFireworks
 from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from typing_extensions import TypedDict
+
+from extraction.embeddings import HashingEmbeddings
+
+
+class RateLimits(TypedDict):
+    """Rate limits of a provider."""
+
+    requests_per_minute: Optional[int]
+    tokens_per_minute: Optional[int]
+
+
+def get_rate_limits(provider: str) -> RateLimits:
+    """Get the rate limits of a provider from environment variables.
+
+    For example, the limits for OpenAI are read from `OPENAI_REQUESTS_PER_MINUTE`
+    and `OPENAI_TOKENS_PER_MINUTE`. Unset or 0 means no limit.
+    """
+    requests_per_minute = int(os.environ.get(f"{provider}_REQUESTS_PER_MINUTE", 0))
+    tokens_per_minute = int(os.environ.get(f"{provider}_TOKENS_PER_MINUTE", 0))
+    return {
+        "requests_per_minute": requests_per_minute or None,
+        "tokens_per_minute": tokens_per_minute or None,
+    }
+
+
+class Tokenizer(TypedDict):
+    """Tokenizer used to count the tokens sent to a model.
+
+    Only tiktoken encodings are available locally, so the token counts of models
+    using another tokenizer are approximated by scaling the counts of a tiktoken
+    encoding by `token_ratio`.
+    """
+
+    encoding_name: str
+    token_ratio: float
 
 
 def get_supported_models():
@@ -15,11 +52,17 @@ def get_supported_models():
         models["gpt-3.5-turbo"] = {
             "chat_model": ChatOpenAI(model="gpt-3.5-turbo", temperature=0),
             "description": "GPT-3.5 Turbo",
+            "rate_limits": get_rate_limits("OPENAI"),
+            "context_window": 16_385,
+            "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.0},
         }
         if os.environ.get("DISABLE_GPT4", "").lower() != "true":
             models["gpt-4-0125-preview"] = {
                 "chat_model": ChatOpenAI(model="gpt-4-0125-preview", temperature=0),
                 "description": "GPT-4 0125 Preview",
+                "rate_limits": get_rate_limits("OPENAI"),
+                "context_window": 128_000,
+                "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.0},
             }
     if "FIREWORKS_API_KEY" in os.environ:
         models["fireworks"] = {
@@ -28,6 +71,9 @@ def get_supported_models():
                 temperature=0,
             ),
             "description": "Fireworks Firefunction-v1",
+            "rate_limits": get_rate_limits("FIREWORKS"),
+            "context_window": 32_768,
+            "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.25},
         }
     if "TOGETHER_API_KEY" in os.environ:
         models["together-ai-mistral-8x7b-instruct-v0.1"] = {
@@ -38,6 +84,9 @@ def get_supported_models():
                 temperature=0,
             ),
             "description": "Mixtral 8x7B Instruct v0.1 (Together AI)",
+            "rate_limits": get_rate_limits("TOGETHER"),
+            "context_window": 32_768,
+            "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.25},
         }
     if "ANTHROPIC_API_KEY" in os.environ:
         models["claude-3-sonnet-20240229"] = {
@@ -45,6 +94,9 @@ def get_supported_models():
                 model="claude-3-sonnet-20240229", temperature=0
             ),
             "description": "Claude 3 Sonnet",
+            "rate_limits": get_rate_limits("ANTHROPIC"),
+            "context_window": 200_000,
+            "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.2},
         }
     if "GROQ_API_KEY" in os.environ:
         models["groq-llama3-8b-8192"] = {
@@ -53,6 +105,9 @@ def get_supported_models():
                 temperature=0,
             ),
             "description": "GROQ Llama 3 8B",
+            "rate_limits": get_rate_limits("GROQ"),
+            "context_window": 8_192,
+            "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.0},
         }
 
     return models
@@ -62,14 +117,32 @@ SUPPORTED_MODELS = get_supported_models()
 DEFAULT_MODEL = "gpt-3.5-turbo"
 
 
-CHUNK_SIZES = {  # in tokens, defaults to int(4_096 * 0.8). Override here.
+# Used for models without a known context window or tokenizer.
+DEFAULT_CONTEXT_WINDOW = 4_096
+DEFAULT_TOKENIZER: Tokenizer = {"encoding_name": "cl100k_base", "token_ratio": 1.0}
+
+
+# Caps on the size of the chunks sent to a model (in tokens). Override here.
+CHUNK_SIZES = {
     "gpt-4-0125-preview": int(128_000 * 0.8),
 }
 
 
-def get_chunk_size(model_name: str) -> int:
-    """Get the chunk size."""
-    return CHUNK_SIZES.get(model_name, int(4_096 * 0.8))
+def get_context_window(model_name: Optional[str]) -> int:
+    """Get the size of the context window of a model in tokens."""
+    model = SUPPORTED_MODELS.get(model_name or DEFAULT_MODEL, {})
+    return model.get("context_window", DEFAULT_CONTEXT_WINDOW)
+
+
+def get_tokenizer(model_name: Optional[str]) -> Tokenizer:
+    """Get the tokenizer used to count the tokens sent to a model."""
+    model = SUPPORTED_MODELS.get(model_name or DEFAULT_MODEL, {})
+    return model.get("tokenizer", DEFAULT_TOKENIZER)
+
+
+def estimate_num_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a text (~4 characters per token)."""
+    return len(text) // 4 + 1
 
 
 def get_model(model_name: Optional[str] = None) -> BaseChatModel:
@@ -85,3 +158,38 @@ def get_model(model_name: Optional[str] = None) -> BaseChatModel:
             )
         else:
             return SUPPORTED_MODELS[model_name]["chat_model"]
+
+
+def get_supported_embeddings():
+    """Get the embeddings used by retrieval according to environment secrets."""
+    embeddings = {
+        # Runs on the CPU of the server, without network calls
+        "local-hashing": {
+            "embeddings": HashingEmbeddings(num_features=1024),
+            "description": "Hashed character n-grams (local)",
+        },
+    }
+    if "OPENAI_API_KEY" in os.environ:
+        embeddings["openai"] = {
+            "embeddings": OpenAIEmbeddings(),
+            "description": "OpenAI text-embedding-ada-002",
+        }
+    return embeddings
+
+
+SUPPORTED_EMBEDDINGS = get_supported_embeddings()
+DEFAULT_EMBEDDINGS = os.environ.get(
+    "DEFAULT_EMBEDDINGS",
+    "openai" if "openai" in SUPPORTED_EMBEDDINGS else "local-hashing",
+)
+
+
+def get_embeddings(embeddings_name: Optional[str] = None) -> Embeddings:
+    """Get the embeddings."""
+    embeddings_name = embeddings_name or DEFAULT_EMBEDDINGS
+    if embeddings_name not in SUPPORTED_EMBEDDINGS:
+        raise ValueError(
+            f"Embeddings {embeddings_name} not found. "
+            f"Supported embeddings: {list(SUPPORTED_EMBEDDINGS)}"
+        )
+    return SUPPORTED_EMBEDDINGS[embeddings_name]["embeddings"]
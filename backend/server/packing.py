@@ -0,0 +1,332 @@
+"""Pack many short texts into a single extraction call.
+
+Short texts of a batch that share the same schema, instructions, examples and
+model are grouped into one prompt, up to a token budget. The model is asked
+for one result per text id, and the results are split back into one response
+per text. The system prompt, the examples and the tool schema are therefore
+sent once per group rather than once per text.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableConfig
+
+from server import settings
+from server.caching import LRUCache
+from server.chunk_planner import count_prompt_overhead
+from server.example_selection import select_examples
+from server.extraction_runnable import (
+    SYSTEM_PROMPT_PREFIX,
+    CompiledExtractor,
+    ExtractionExample,
+    ExtractRequest,
+    ExtractResponse,
+    extraction_runnable,
+    get_compiled_extractor,
+    get_request_cache_key,
+    invoke_with_limits,
+)
+from server.models import estimate_num_tokens, get_context_window, get_model
+
+PACKED_EXTRACTORS: LRUCache[CompiledExtractor] = LRUCache(
+    settings.COMPILED_EXTRACTOR_CACHE_SIZE
+)
+
+PACKING_INSTRUCTIONS = (
+    "You will be given several texts, each with an id. Extract information from "
+    "each text independently and return one result per text id, with an empty "
+    "list for texts without relevant information."
+)
+
+
+def _format_texts(texts: Sequence[str]) -> str:
+    """Format texts with their ids (their position) for the packed prompt."""
+    return "\n".join(
+        f'<text id="{idx}">\n{text}\n</text>' for idx, text in enumerate(texts)
+    )
+
+
+def _make_packed_schema(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Make the schema of packed results from the schema of a single result."""
+    return {
+        "type": "object",
+        "title": schema["title"],
+        "description": "Extract information matching the given schema "
+        "from each of the texts.",
+        "properties": {
+            "results": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "id": {"type": "integer", "description": "The text id."},
+                        "data": schema["properties"]["data"],
+                    },
+                    "required": ["id", "data"],
+                },
+            },
+        },
+        "required": ["results"],
+    }
+
+
+def _make_packed_prompt_template(
+    instructions: Optional[str],
+    examples: Optional[Sequence[ExtractionExample]],
+    function_name: str,
+) -> ChatPromptTemplate:
+    """Make a prompt extracting from several texts at once.
+
+    The examples are shown as a single packed example.
+    """
+    system_prompt = f"{SYSTEM_PROMPT_PREFIX}\n\n{PACKING_INSTRUCTIONS}"
+    if instructions:
+        system_prompt = f"{system_prompt}\n\n{instructions}"
+    prompt_components: List[Any] = [("system", system_prompt)]
+    if examples:
+        tool_call = {
+            "args": {
+                "results": [
+                    {"id": idx, "data": example.output}
+                    for idx, example in enumerate(examples)
+                ]
+            },
+            "name": function_name,
+            "id": "packed-examples",
+        }
+        prompt_components.extend(
+            [
+                HumanMessage(
+                    content=_format_texts([example.text for example in examples])
+                ),
+                AIMessage(content="", tool_calls=[tool_call]),
+                ToolMessage(
+                    content="You have correctly called this tool.",
+                    tool_call_id="packed-examples",
+                ),
+            ]
+        )
+    prompt_components.append(
+        ("human", "I need to extract information from the following texts:\n{texts}\n")
+    )
+    return ChatPromptTemplate.from_messages(prompt_components)
+
+
+def _compile_packed(extraction_request: ExtractRequest) -> CompiledExtractor:
+    """Compile the packed prompt and model of an extraction request."""
+    compiled = get_compiled_extractor(extraction_request)
+    schema = _make_packed_schema(compiled.schema)
+    prompt = _make_packed_prompt_template(
+        extraction_request.instructions,
+        extraction_request.examples,
+        schema["title"],
+    )
+    model = get_model(extraction_request.model_name)
+    runnable = (
+        prompt | model.with_structured_output(schema=schema, include_raw=True)
+    ).with_config({"run_name": "packed_extraction"})
+    return CompiledExtractor(
+        schema=schema,
+        prompt=prompt,
+        runnable=runnable,
+        prompt_overhead_tokens=count_prompt_overhead(
+            prompt, schema, extraction_request.model_name
+        ),
+    )
+
+
+def _split_results(response: Any, num_texts: int) -> Dict[int, List[Any]]:
+    """Split the packed results of a model by text id.
+
+    Malformed results (e.g., with an unknown id or data that is not a list)
+    are dropped. Texts without a result have nothing to extract.
+    """
+    results: Dict[int, List[Any]] = {idx: [] for idx in range(num_texts)}
+    items = response.get("results") if isinstance(response, dict) else None
+    for result in items if isinstance(items, list) else []:
+        if not isinstance(result, dict):
+            continue
+        idx = result.get("id")
+        data = result.get("data", [])
+        if isinstance(idx, int) and 0 <= idx < num_texts and isinstance(data, list):
+            results[idx].extend(data)
+    return results
+
+
+def _get_text_tokens(text: str) -> int:
+    """Estimate the tokens used by a text in a packed prompt, including its tags."""
+    return estimate_num_tokens(text) + 10
+
+
+# PUBLIC API
+
+
+def get_packed_extractor(extraction_request: ExtractRequest) -> CompiledExtractor:
+    """Get the compiled packed extractor for an extraction request."""
+    key = get_request_cache_key(extraction_request)
+    packed = PACKED_EXTRACTORS.get(key)
+    if packed is None:
+        packed = _compile_packed(extraction_request)
+        PACKED_EXTRACTORS.set(key, packed)
+    return packed
+
+
+def pack_texts(
+    texts: Sequence[str], *, max_tokens: int, max_inputs: int
+) -> List[List[int]]:
+    """Group texts into packs, keeping their order.
+
+    Args:
+        texts: The texts to pack.
+        max_tokens: Max number of (estimated) tokens of the texts of a pack.
+        max_inputs: Max number of texts in a pack.
+
+    Returns:
+        The indexes of the texts in each pack.
+    """
+    packs: List[List[int]] = []
+    pack_tokens = 0
+    for idx, text in enumerate(texts):
+        num_tokens = _get_text_tokens(text)
+        if (
+            not packs
+            or len(packs[-1]) >= max_inputs
+            or pack_tokens + num_tokens > max_tokens
+        ):
+            packs.append([])
+            pack_tokens = 0
+        packs[-1].append(idx)
+        pack_tokens += num_tokens
+    return packs
+
+
+async def extract_packed(
+    extraction_requests: Sequence[ExtractRequest],
+    config: Optional[RunnableConfig] = None,
+) -> List[ExtractResponse]:
+    """Extract from several texts sharing an extractor with a single model call.
+
+    The prompt asks for one result per text, so texts left out by the model
+    have nothing to extract. If the packed output cannot be parsed, the texts
+    are extracted on their own instead.
+    """
+    texts = [extraction_request.text for extraction_request in extraction_requests]
+    first = extraction_requests[0]
+    examples = first.examples or []
+    # The examples are shared by the texts, so they are selected for all of them
+    selected_examples = await select_examples(examples, "\n".join(texts))
+    if len(selected_examples) < len(examples):
+        first = first.copy(update={"examples": selected_examples})
+    packed = get_packed_extractor(first)
+    prompt_tokens = packed.prompt_overhead_tokens + sum(
+        _get_text_tokens(text) for text in texts
+    )
+    try:
+        response = await invoke_with_limits(
+            packed.runnable,
+            {"texts": _format_texts(texts)},
+            model_name=first.model_name,
+            prompt_tokens=prompt_tokens,
+            config=config,
+        )
+    except OutputParserException:
+        return await extraction_runnable.abatch(list(extraction_requests), config)
+    results = _split_results(response, len(texts))
+    return [{"data": results[idx]} for idx in range(len(texts))]
+
+
+class PackingExtractionRunnable(Runnable[ExtractRequest, ExtractResponse]):
+    """Extract from texts, packing the short texts of a batch into shared calls.
+
+    Single invocations are delegated to the extraction runnable.
+    """
+
+    def invoke(
+        self, input: ExtractRequest, config: Optional[RunnableConfig] = None
+    ) -> ExtractResponse:
+        return extraction_runnable.invoke(input, config)
+
+    async def ainvoke(
+        self,
+        input: ExtractRequest,
+        config: Optional[RunnableConfig] = None,
+        **kwargs: Any,
+    ) -> ExtractResponse:
+        return await extraction_runnable.ainvoke(input, config, **kwargs)
+
+    def _make_packs(self, inputs: Sequence[ExtractRequest]) -> List[List[int]]:
+        """Group the inputs into packs of texts sharing an extractor."""
+        groups: Dict[str, List[int]] = {}
+        packs: List[List[int]] = []
+        for idx, extraction_request in enumerate(inputs):
+            num_tokens = estimate_num_tokens(extraction_request.text)
+            if num_tokens <= settings.PACKING_MAX_TEXT_TOKENS:
+                key = get_request_cache_key(extraction_request)
+                groups.setdefault(key, []).append(idx)
+            else:
+                packs.append([idx])
+        for indexes in groups.values():
+            first = inputs[indexes[0]]
+            # The texts, the packed prompt and the output must fit in the model
+            max_tokens = min(
+                settings.PACKING_MAX_TOKENS,
+                get_context_window(first.model_name)
+                - get_packed_extractor(first).prompt_overhead_tokens
+                - settings.OUTPUT_TOKEN_RESERVATION,
+            )
+            for pack in pack_texts(
+                [inputs[idx].text for idx in indexes],
+                max_tokens=max_tokens,
+                max_inputs=settings.PACKING_MAX_INPUTS,
+            ):
+                packs.append([indexes[idx] for idx in pack])
+        return packs
+
+    async def _abatch(
+        self, inputs: List[ExtractRequest], config: List[RunnableConfig]
+    ) -> List[Union[Exception, ExtractResponse]]:
+        packs = self._make_packs(inputs)
+
+        async def _extract_pack(pack: List[int]) -> List[ExtractResponse]:
+            # The texts of a batch share the same owner and priority
+            first = pack[0]
+            if len(pack) == 1:
+                return [await extraction_runnable.ainvoke(inputs[first], config[first])]
+            return await extract_packed([inputs[idx] for idx in pack], config[first])
+
+        results = await asyncio.gather(
+            *(_extract_pack(pack) for pack in packs), return_exceptions=True
+        )
+        outputs: List[Union[Exception, ExtractResponse]] = [None] * len(inputs)
+        for pack, result in zip(packs, results):
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+            for position, idx in enumerate(pack):
+                outputs[idx] = (
+                    result if isinstance(result, Exception) else result[position]
+                )
+        return outputs
+
+    async def abatch(
+        self,
+        inputs: List[ExtractRequest],
+        config: Optional[Union[RunnableConfig, List[RunnableConfig]]] = None,
+        *,
+        return_exceptions: bool = False,
+        **kwargs: Any,
+    ) -> List[ExtractResponse]:
+        if settings.PACKING_MAX_INPUTS <= 1 or len(inputs) <= 1:
+            return await extraction_runnable.abatch(
+                inputs, config, return_exceptions=return_exceptions, **kwargs
+            )
+        return await self._abatch_with_config(
+            self._abatch, inputs, config, return_exceptions=return_exceptions
+        )
+
+
+packing_extraction_runnable = PackingExtractionRunnable()
@@ -0,0 +1,158 @@
+"""Extract from an entire document with pipelined stages.
+
+The pages of a document are parsed, split into chunks and extracted by stages
+running concurrently, connected by bounded buffers: the first chunks are sent
+to the model while later pages are still being parsed. Only a bounded number
+of pages and chunks is held in memory whatever the size of the document, and
+once the model falls behind, the full buffers pause chunking and parsing.
+"""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, TypeVar
+
+from db.models import Extractor
+from extraction.chunking import IncrementalChunker, TokenChunker
+from extraction.duplicates import DuplicateFinder
+from server import settings
+from server.executors import CPU_EXECUTOR
+from server.extraction_runnable import (
+    DuplicateChunk,
+    ExtractResponse,
+    deduplicate,
+    extract_with_cache,
+    get_extractor_cache_key,
+    get_run_config,
+    make_chunk_splitter,
+    make_request_template,
+)
+
+T = TypeVar("T")
+
+_DONE: Any = object()
+
+
+async def buffered(source: AsyncIterator[T], maxsize: int) -> AsyncIterator[T]:
+    """Consume an async iterator ahead, buffering at most `maxsize` items.
+
+    The source runs in its own task, concurrently with the consumer, and
+    pauses while the buffer is full. Errors of the source are raised to the
+    consumer, and the source is closed once the consumer stops.
+    """
+    queue: asyncio.Queue[Tuple[Any, Optional[BaseException]]] = asyncio.Queue(maxsize)
+
+    async def _produce() -> None:
+        try:
+            async for item in source:
+                await queue.put((item, None))
+            await queue.put((_DONE, None))
+        except Exception as e:
+            await queue.put((_DONE, e))
+        finally:
+            if hasattr(source, "aclose"):
+                await source.aclose()
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def chunk_pages(
+    pages: AsyncIterator[str], text_splitter: TokenChunker
+) -> AsyncIterator[str]:
+    """Split the pages of a document into chunks, as pages are parsed.
+
+    Pages are joined with newlines, as when the whole content is extracted.
+    """
+    chunker = IncrementalChunker(text_splitter)
+    separator = ""
+    async for page in pages:
+        for chunk in await CPU_EXECUTOR.run(chunker.feed, separator + page):
+            yield chunk
+        separator = "\n"
+    for chunk in chunker.finish():
+        yield chunk
+
+
+async def extract_entire_document(
+    pages: AsyncIterator[str],
+    extractor: Extractor,
+    model_name: str,
+) -> ExtractResponse:
+    """Extract from an entire document, given as an iterator of its pages.
+
+    Chunks are extracted as soon as they are made, up to
+    `settings.PIPELINE_MAX_IN_FLIGHT_CHUNKS` at once. Chunks duplicating an
+    earlier chunk are skipped, and reported in `duplicate_chunks`.
+    """
+    template = await CPU_EXECUTOR.run(make_request_template, extractor, model_name)
+    text_splitter = await CPU_EXECUTOR.run(
+        make_chunk_splitter,
+        template,
+        cache_key=get_extractor_cache_key(extractor, model_name),
+    )
+    finder = (
+        DuplicateFinder(threshold=settings.DUPLICATE_CHUNK_THRESHOLD)
+        if settings.SKIP_DUPLICATE_CHUNKS
+        else None
+    )
+    chunks = buffered(
+        chunk_pages(buffered(pages, settings.PIPELINE_BUFFER_SIZE), text_splitter),
+        settings.PIPELINE_BUFFER_SIZE,
+    )
+
+    tasks: Dict[asyncio.Task, int] = {}
+    responses: Dict[int, ExtractResponse] = {}
+
+    async def _wait(max_tasks: int) -> None:
+        while len(tasks) > max_tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                responses[tasks.pop(task)] = task.result()[0]
+
+    num_chunks = 0
+    duplicate_chunks: List[DuplicateChunk] = []
+    content_too_long = False
+    try:
+        async for text in chunks:
+            if 0 < settings.MAX_CHUNKS <= num_chunks:
+                content_too_long = True
+                break
+            idx = num_chunks
+            num_chunks += 1
+            original = finder.add(text) if finder is not None else None
+            if original is not None:
+                duplicate_chunks.append({"chunk": idx, "duplicate_of": original})
+                continue
+            await _wait(settings.PIPELINE_MAX_IN_FLIGHT_CHUNKS - 1)
+            # Documents turn from interactive to batch work as chunks are made
+            config = get_run_config(
+                extractor, model_name, num_chunks - len(duplicate_chunks)
+            )
+            extraction_request = template.copy(update={"text": text})
+            tasks[
+                asyncio.create_task(extract_with_cache([extraction_request], config))
+            ] = idx
+        await _wait(0)
+    finally:
+        await chunks.aclose()
+        for task in tasks:
+            task.cancel()
+
+    extract_responses: List[ExtractResponse] = [
+        responses[idx] for idx in sorted(responses)
+    ]
+    return {
+        "data": deduplicate(extract_responses)["data"],
+        "content_too_long": content_too_long,
+        "skipped_chunks": len(duplicate_chunks),
+        "duplicate_chunks": duplicate_chunks,
+    }
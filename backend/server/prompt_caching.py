@@ -0,0 +1,134 @@
+"""Measure how often prompts are served from the prompt caches of providers.
+
+Providers (e.g., OpenAI, Anthropic) cache long prompt prefixes they received
+recently. Prompts are rendered deterministically, with the static system
+prompt and examples first and the chunk text last, so that consecutive calls
+for the same extractor share a prefix. The cached prompt tokens reported in the
+usage metadata of each response are recorded per extractor.
+"""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional
+
+from typing_extensions import TypedDict
+
+# Used for runs that are not made with a stored extractor.
+ANONYMOUS_EXTRACTOR = "anonymous"
+
+
+class PromptUsage(NamedTuple):
+    """Prompt tokens of a call to a model."""
+
+    prompt_tokens: int
+    cached_prompt_tokens: int
+
+
+class PromptCacheStats(TypedDict):
+    """Counters describing how much of the prompts of an extractor were cached."""
+
+    calls: int
+    cached_calls: int
+    prompt_tokens: int
+    cached_prompt_tokens: int
+    cached_ratio: float
+    average_latency: Optional[float]
+    average_cached_latency: Optional[float]
+
+
+def get_prompt_usage(message: Any) -> Optional[PromptUsage]:
+    """Get the prompt tokens from the response metadata of a chat model message.
+
+    Returns None if the provider did not report its usage.
+    """
+    metadata = getattr(message, "response_metadata", None) or {}
+    # OpenAI compatible APIs (OpenAI, Fireworks, Together, Groq)
+    token_usage = metadata.get("token_usage")
+    if token_usage:
+        details = token_usage.get("prompt_tokens_details") or {}
+        return PromptUsage(
+            prompt_tokens=token_usage.get("prompt_tokens") or 0,
+            cached_prompt_tokens=details.get("cached_tokens") or 0,
+        )
+    # Anthropic reports cached tokens separately from the other input tokens
+    usage = metadata.get("usage")
+    if usage:
+        cached_prompt_tokens = usage.get("cache_read_input_tokens") or 0
+        return PromptUsage(
+            prompt_tokens=(usage.get("input_tokens") or 0)
+            + (usage.get("cache_creation_input_tokens") or 0)
+            + cached_prompt_tokens,
+            cached_prompt_tokens=cached_prompt_tokens,
+        )
+    return None
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.cached_calls = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.total_latency = 0.0
+        self.total_cached_latency = 0.0
+
+
+class PromptCacheTracker:
+    """Record the prompt usage of calls, per extractor.
+
+    Only the `maxsize` most recently used extractors are tracked.
+    """
+
+    def __init__(self, maxsize: int = 1_000) -> None:
+        self.maxsize = maxsize
+        self._counters: OrderedDict[str, _Counters] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, extractor_id: str, usage: PromptUsage, latency: float) -> None:
+        """Record the prompt usage and latency of a call."""
+        with self._lock:
+            counters = self._counters.get(extractor_id)
+            if counters is None:
+                counters = self._counters[extractor_id] = _Counters()
+            self._counters.move_to_end(extractor_id)
+            while len(self._counters) > self.maxsize:
+                self._counters.popitem(last=False)
+            counters.calls += 1
+            counters.prompt_tokens += usage.prompt_tokens
+            counters.cached_prompt_tokens += usage.cached_prompt_tokens
+            counters.total_latency += latency
+            if usage.cached_prompt_tokens:
+                counters.cached_calls += 1
+                counters.total_cached_latency += latency
+
+    def stats(self) -> Dict[str, PromptCacheStats]:
+        """Get the counters of each extractor."""
+        with self._lock:
+            return {
+                extractor_id: {
+                    "calls": counters.calls,
+                    "cached_calls": counters.cached_calls,
+                    "prompt_tokens": counters.prompt_tokens,
+                    "cached_prompt_tokens": counters.cached_prompt_tokens,
+                    "cached_ratio": (
+                        counters.cached_prompt_tokens / counters.prompt_tokens
+                        if counters.prompt_tokens
+                        else 0.0
+                    ),
+                    "average_latency": (
+                        counters.total_latency / counters.calls
+                        if counters.calls
+                        else None
+                    ),
+                    "average_cached_latency": (
+                        counters.total_cached_latency / counters.cached_calls
+                        if counters.cached_calls
+                        else None
+                    ),
+                }
+                for extractor_id, counters in self._counters.items()
+            }
+
+
+PROMPT_CACHE_TRACKER = PromptCacheTracker()
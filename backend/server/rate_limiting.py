@@ -0,0 +1,150 @@
+"""Rate limits on the requests and tokens sent to each chat model.
+
+The limiters are shared by all the requests handled by this process, so
+concurrent users cannot multiply the load on a provider. Callers that exceed
+the limits wait until enough capacity is available instead of failing.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+from typing_extensions import TypedDict
+
+from server.models import DEFAULT_MODEL, SUPPORTED_MODELS
+
+
+class RateLimiterStats(TypedDict):
+    """Counters describing the state of a rate limiter."""
+
+    requests_per_minute: Optional[int]
+    tokens_per_minute: Optional[int]
+    available_requests: Optional[float]
+    available_tokens: Optional[float]
+    waiting: int
+    total_wait_time: float
+
+
+class TokenBucket:
+    """A token bucket that refills continuously up to one minute of capacity.
+
+    Capacity is reserved up-front and the bucket may go into debt: the caller
+    then waits until the debt is paid back by the refill. Since reservations
+    happen synchronously, callers are served in the order they arrived.
+    """
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    @property
+    def available(self) -> float:
+        """The capacity currently available, negative if in debt."""
+        self._refill()
+        return self._tokens
+
+    def reserve(self, amount: float) -> float:
+        """Reserve capacity, returning how long to wait (in seconds) to use it."""
+        self._refill()
+        self._tokens -= amount
+        return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Give back capacity that was reserved but not used."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Limit requests per minute and tokens per minute sent to a model."""
+
+    def __init__(
+        self,
+        *,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ) -> None:
+        """Initialize the rate limiter.
+
+        Args:
+            requests_per_minute: Max number of requests per minute.
+                If None, the number of requests is not limited.
+            tokens_per_minute: Max number of (estimated) tokens per minute.
+                If None, the number of tokens is not limited.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.waiting = 0
+        self.total_wait_time = 0.0
+
+    async def acquire(self, num_tokens: int) -> None:
+        """Wait until a request using `num_tokens` tokens can be sent.
+
+        The tokens should include the prompt and a reservation for the output.
+        Unused tokens can be given back afterwards using `refund`.
+        """
+        delay = 0.0
+        if self._requests:
+            delay = max(delay, self._requests.reserve(1))
+        if self._tokens:
+            delay = max(delay, self._tokens.reserve(num_tokens))
+        if delay <= 0:
+            return
+        self.waiting += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # The request will not be sent, so its capacity can be re-used.
+            if self._requests:
+                self._requests.refund(1)
+            self.refund(num_tokens)
+            raise
+        finally:
+            self.waiting -= 1
+            self.total_wait_time += delay
+
+    def refund(self, num_tokens: int) -> None:
+        """Give back tokens that were acquired but not used."""
+        if self._tokens and num_tokens > 0:
+            self._tokens.refund(num_tokens)
+
+    def stats(self) -> RateLimiterStats:
+        """Get the current state of the rate limiter."""
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "available_requests": self._requests.available if self._requests else None,
+            "available_tokens": self._tokens.available if self._tokens else None,
+            "waiting": self.waiting,
+            "total_wait_time": self.total_wait_time,
+        }
+
+
+# PUBLIC API
+
+RATE_LIMITERS: Dict[str, RateLimiter] = {
+    model_name: RateLimiter(**model["rate_limits"])
+    for model_name, model in SUPPORTED_MODELS.items()
+}
+
+
+def get_rate_limiter(model_name: Optional[str] = None) -> RateLimiter:
+    """Get the rate limiter shared by all calls to the given model."""
+    model_name = model_name or DEFAULT_MODEL
+    if model_name not in RATE_LIMITERS:
+        RATE_LIMITERS[model_name] = RateLimiter()
+    return RATE_LIMITERS[model_name]
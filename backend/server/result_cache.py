@@ -0,0 +1,248 @@
+"""Content addressed cache of chunk extraction results.
+
+Results are keyed by a hash of everything that determines the output of the
+model for a chunk: the chunk text, the dereferenced schema, the instructions,
+the examples and the model name.
+"""
+from __future__ import annotations
+
+import abc
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from typing_extensions import TypedDict
+
+from db.models import CachedResult, SessionClass
+from server import settings
+from server.caching import LRUCache
+from server.executors import DATABASE_EXECUTOR
+
+
+class ResultCacheStats(TypedDict):
+    """Counters describing how the result cache is performing."""
+
+    backend: str
+    hits: int
+    misses: int
+    hit_ratio: float
+    saved_tokens: int
+
+
+class ResultCache(abc.ABC):
+    """Base class for result cache backends.
+
+    Backends only need to implement raw lookups and updates, this class keeps
+    track of the hit ratio and of the number of tokens that were saved.
+    """
+
+    name: str
+    # Whether lookups and updates wait on I/O, so that async callers run them
+    # in the database pool rather than on the event loop
+    blocking = False
+
+    def __init__(self, *, ttl: Optional[float] = None) -> None:
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.saved_tokens = 0
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _get(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Get the response and number of tokens for a key."""
+
+    @abc.abstractmethod
+    def _set(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        """Store the response and number of tokens for a key."""
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response."""
+        cached = self._get(key)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            response, num_tokens = cached
+            self.hits += 1
+            self.saved_tokens += num_tokens
+            return response
+
+    def update(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        """Cache a response together with the tokens it took to compute it."""
+        self._set(key, response, num_tokens)
+
+    async def alookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response without blocking the event loop."""
+        if not self.blocking:
+            return self.lookup(key)
+        return await DATABASE_EXECUTOR.run(self.lookup, key)
+
+    async def aupdate(
+        self, key: str, response: Dict[str, Any], num_tokens: int
+    ) -> None:
+        """Cache a response without blocking the event loop."""
+        if not self.blocking:
+            return self.update(key, response, num_tokens)
+        await DATABASE_EXECUTOR.run(self.update, key, response, num_tokens)
+
+    def stats(self) -> ResultCacheStats:
+        """Get the current cache counters."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "saved_tokens": self.saved_tokens,
+            }
+
+
+class NoopResultCache(ResultCache):
+    """A result cache that never stores anything."""
+
+    name = "none"
+
+    def _get(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        return None
+
+    def _set(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        pass
+
+
+class InMemoryResultCache(ResultCache):
+    """An in-process LRU result cache."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, *, ttl: Optional[float] = None) -> None:
+        super().__init__(ttl=ttl)
+        self._cache: LRUCache[Tuple[Dict[str, Any], int]] = LRUCache(
+            maxsize, ttl=self.ttl
+        )
+
+    def _get(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        return self._cache.get(key)
+
+    def _set(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        self._cache.set(key, (response, num_tokens))
+
+
+class SQLiteResultCache(ResultCache):
+    """A result cache stored in a local sqlite database file."""
+
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, *, ttl: Optional[float] = None) -> None:
+        super().__init__(ttl=ttl)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection_lock = threading.Lock()
+        with self._connection_lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cached_results ("
+                "key TEXT PRIMARY KEY, "
+                "response TEXT NOT NULL, "
+                "num_tokens INTEGER NOT NULL, "
+                "created_at REAL NOT NULL)"
+            )
+
+    def _get(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._connection_lock:
+            row = self._connection.execute(
+                "SELECT response, num_tokens, created_at FROM cached_results "
+                "WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        response, num_tokens, created_at = row
+        if self.ttl and created_at + self.ttl < time.time():
+            return None
+        return json.loads(response), num_tokens
+
+    def _set(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        with self._connection_lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cached_results "
+                "(key, response, num_tokens, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(response), num_tokens, time.time()),
+            )
+
+
+class PostgresResultCache(ResultCache):
+    """A result cache stored in the `cached_results` postgres table."""
+
+    name = "postgres"
+    blocking = True
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionClass,
+        *,
+        ttl: Optional[float] = None,
+    ) -> None:
+        super().__init__(ttl=ttl)
+        self._session_factory = session_factory
+
+    def _get(self, key: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        with self._session_factory() as session:
+            query = session.query(CachedResult).filter(CachedResult.key == key)
+            if self.ttl:
+                oldest = datetime.utcnow() - timedelta(seconds=self.ttl)
+                query = query.filter(CachedResult.updated_at >= oldest)
+            record = query.first()
+            if record is None:
+                return None
+            return record.response, record.num_tokens
+
+    def _set(self, key: str, response: Dict[str, Any], num_tokens: int) -> None:
+        now = datetime.utcnow()
+        statement = (
+            insert(CachedResult)
+            .values(
+                key=key,
+                response=response,
+                num_tokens=num_tokens,
+                created_at=now,
+                updated_at=now,
+            )
+            .on_conflict_do_update(
+                index_elements=[CachedResult.key],
+                set_={
+                    "response": response,
+                    "num_tokens": num_tokens,
+                    "updated_at": now,
+                },
+            )
+        )
+        with self._session_factory() as session:
+            session.execute(statement)
+            session.commit()
+
+
+def create_result_cache(backend: str) -> ResultCache:
+    """Create a result cache using the configured settings."""
+    ttl = settings.RESULT_CACHE_TTL
+    if backend == "memory":
+        return InMemoryResultCache(settings.RESULT_CACHE_SIZE, ttl=ttl)
+    elif backend == "sqlite":
+        return SQLiteResultCache(settings.RESULT_CACHE_SQLITE_PATH, ttl=ttl)
+    elif backend == "postgres":
+        return PostgresResultCache(ttl=ttl)
+    elif backend == "none":
+        return NoopResultCache()
+    else:
+        raise ValueError(
+            f"Invalid result cache backend {backend}. "
+            f"Expected one of 'memory', 'sqlite', 'postgres', 'none'."
+        )
+
+
+RESULT_CACHE = create_result_cache(settings.RESULT_CACHE_BACKEND)
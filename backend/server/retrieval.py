@@ -1,24 +1,93 @@
-from operator import itemgetter
+"""Retrieve the chunks of a document most relevant to an extractor.
+
+Chunks are first ranked with BM25 against the description of the extractor,
+which is cheap and needs no embeddings. The best candidates are then
+optionally re-scored with the cosine similarity of their embeddings, and only
+the top chunks are extracted from.
+"""
 from typing import Any, Dict, List, Optional
 
+import numpy as np
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_core.runnables import RunnableLambda
-from langchain_openai import OpenAIEmbeddings
 
 from db.models import Extractor
+from extraction.bm25 import BM25Index
+from server import settings
+from server.embedding_cache import CachedEmbeddings
+from server.executors import CPU_EXECUTOR
 from server.extraction_runnable import (
-    ExtractRequest,
     ExtractResponse,
     deduplicate,
-    extraction_runnable,
-    get_examples_from_extractor,
+    extract_with_cache,
+    get_run_config,
+    make_request_template,
 )
+from server.models import get_embeddings
+
+
+async def _similarities(
+    query: str, texts: List[str], embeddings_name: Optional[str]
+) -> np.ndarray:
+    """Get the cosine similarity of texts with a query."""
+    # Chunks and queries embedded before are served from the embedding cache
+    embeddings = CachedEmbeddings(get_embeddings(embeddings_name))
+    vectors = np.array(await embeddings.aembed_documents(texts))
+    query_vector = np.array(await embeddings.aembed_query(query))
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+    return (vectors @ query_vector) / np.where(norms > 0, norms, 1.0)
+
+
+async def retrieve_chunks(
+    query: str,
+    chunks: List[str],
+    *,
+    top_k: int,
+    min_bm25_score: float = 0.0,
+    min_similarity: Optional[float] = None,
+    rerank: bool = True,
+    embeddings_name: Optional[str] = None,
+) -> List[int]:
+    """Retrieve the chunks most relevant to a query.
+
+    Args:
+        query: The query to rank the chunks against.
+        chunks: The chunks to retrieve from.
+        top_k: Max number of chunks to retrieve.
+        min_bm25_score: Drop the chunks whose BM25 score is lower, relative to
+            the best score (between 0 and 1).
+        min_similarity: Drop the re-scored chunks whose cosine similarity with
+            the query is lower.
+        rerank: Whether to re-score the best BM25 candidates with embeddings.
+        embeddings_name: The embeddings used to re-score the candidates.
+
+    Returns:
+        The indexes of the retrieved chunks, in document order.
+    """
+    if top_k <= 0 or not chunks:
+        return []
+    scores = await CPU_EXECUTOR.run(lambda: BM25Index(chunks).score(query))
+    best_score = scores.max()
+    if best_score > 0:
+        # A stable sort keeps ties in document order
+        candidates = np.argsort(-scores, kind="stable")
+        candidates = candidates[scores[candidates] >= min_bm25_score * best_score]
+    elif rerank:
+        # No chunk shares a term with the query, only embeddings can rank them
+        candidates = np.arange(len(chunks))
+    else:
+        candidates = np.arange(min(top_k, len(chunks)))
 
+    if rerank and len(candidates):
+        candidates = candidates[: top_k * settings.RETRIEVAL_CANDIDATES_MULTIPLIER]
+        similarities = await _similarities(
+            query, [chunks[idx] for idx in candidates], embeddings_name
+        )
+        order = np.argsort(-similarities, kind="stable")
+        if min_similarity is not None:
+            order = order[similarities[order] >= min_similarity]
+        candidates = candidates[order]
 
-def _make_extract_requests(input_dict: Dict[str, Any]) -> List[ExtractRequest]:
-    docs = input_dict.pop("text")
-    return [ExtractRequest(text=doc.page_content, **input_dict) for doc in docs]
+    return sorted(int(idx) for idx in candidates[:top_k])
 
 
 async def extract_from_content(
@@ -27,42 +96,48 @@ async def extract_from_content(
     model_name: str,
     *,
     text_splitter_kwargs: Optional[Dict[str, Any]] = None,
+    embeddings_name: Optional[str] = None,
+    top_k: Optional[int] = None,
+    min_bm25_score: float = 0.0,
+    min_similarity: Optional[float] = None,
+    rerank: bool = True,
 ) -> ExtractResponse:
-    """Extract from potentially long-form content."""
+    """Extract from potentially long-form content.
+
+    Only the chunks most relevant to the extractor are extracted from (see
+    `retrieve_chunks`), so the number of calls to the model is bounded by
+    `top_k`, which defaults to `settings.RETRIEVAL_TOP_K`. The candidates are
+    re-scored with the given embeddings (see `SUPPORTED_EMBEDDINGS`), or the
+    default ones.
+    """
     if text_splitter_kwargs is None:
         text_splitter_kwargs = {
             "separator": "\n\n",
             "chunk_size": 1000,
             "chunk_overlap": 50,
         }
+    if top_k is None:
+        top_k = settings.RETRIEVAL_TOP_K
     text_splitter = CharacterTextSplitter(**text_splitter_kwargs)
-    docs = text_splitter.create_documents([content])
-    doc_contents = [doc.page_content for doc in docs]
-
-    vectorstore = FAISS.from_texts(doc_contents, embedding=OpenAIEmbeddings())
-    retriever = vectorstore.as_retriever()
-
-    runnable = (
-        {
-            "text": itemgetter("query") | retriever,
-            "schema": itemgetter("schema"),
-            "instructions": lambda x: x.get("instructions"),
-            "examples": lambda x: x.get("examples"),
-            "model_name": lambda x: x.get("model_name"),
-        }
-        | RunnableLambda(_make_extract_requests)
-        | extraction_runnable.abatch
-    )
-    schema = extractor.schema
-    examples = get_examples_from_extractor(extractor)
+    chunks = await CPU_EXECUTOR.run(text_splitter.split_text, content)
+
     description = extractor.description  # TODO: improve this
-    result = await runnable.ainvoke(
-        {
-            "query": description,
-            "schema": schema,
-            "examples": examples,
-            "instructions": extractor.instruction,
-            "model_name": model_name,
-        }
+    retrieved = await retrieve_chunks(
+        description,
+        chunks,
+        top_k=top_k,
+        min_bm25_score=min_bm25_score,
+        min_similarity=min_similarity,
+        rerank=rerank,
+        embeddings_name=embeddings_name,
+    )
+
+    # The schema is validated once, in the CPU pool
+    template = await CPU_EXECUTOR.run(make_request_template, extractor, model_name)
+    requests = [template.copy(update={"text": chunks[idx]}) for idx in retrieved]
+    result = await extract_with_cache(
+        requests,
+        # Only a handful of chunks are retrieved, so they are always interactive.
+        get_run_config(extractor, model_name, num_chunks=1),
     )
     return deduplicate(result)
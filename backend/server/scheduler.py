@@ -0,0 +1,115 @@
+"""Fair scheduling of chunk extractions across users.
+
+Chunks from all requests wait in a single queue per model and are admitted in
+weighted fair queueing order: each (owner, priority) pair is a flow and chunks
+are served by increasing virtual finish time, where the cost of a chunk is its
+estimated number of tokens. A user submitting a very large document therefore
+cannot starve other users, and interactive chunks, whose flows are weighted
+more heavily, keep a low latency under bulk load without starving bulk work.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import Dict, Generic, List, Literal, Optional, Tuple, TypeVar
+
+from langchain_core.runnables import RunnableConfig
+
+from server import settings
+
+T = TypeVar("T")
+
+Priority = Literal["interactive", "bulk"]
+
+PRIORITY_WEIGHTS: Dict[str, float] = {
+    "interactive": settings.INTERACTIVE_PRIORITY_WEIGHT,
+    "bulk": 1.0,
+}
+
+ANONYMOUS_OWNER = "anonymous"
+
+
+class FairQueue(Generic[T]):
+    """A weighted fair queue (self-clocked variant).
+
+    The virtual time is the finish time of the last item popped, so a flow that
+    was idle does not accumulate credit it could use to burst later.
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, T]] = []
+        self._finish_times: Dict[Tuple[str, str], float] = {}
+        self._virtual_time = 0.0
+        self._counter = itertools.count()
+        self._sizes: Dict[str, int] = {priority: 0 for priority in PRIORITY_WEIGHTS}
+        self._priorities: Dict[int, str] = {}
+
+    def push(self, item: T, *, owner: str, priority: Priority, cost: float) -> None:
+        """Add an item to the queue."""
+        flow = (owner, priority)
+        start = max(self._virtual_time, self._finish_times.get(flow, 0.0))
+        finish = start + max(cost, 1.0) / PRIORITY_WEIGHTS[priority]
+        self._finish_times[flow] = finish
+        seq = next(self._counter)
+        self._priorities[seq] = priority
+        self._sizes[priority] += 1
+        heapq.heappush(self._heap, (finish, seq, item))
+
+    def _reset_if_idle(self) -> None:
+        if not self._heap:
+            # All flows are idle, so their finish times no longer matter
+            self._finish_times.clear()
+            self._virtual_time = 0.0
+
+    def pop(self) -> T:
+        """Remove and return the item with the smallest virtual finish time."""
+        finish, seq, item = heapq.heappop(self._heap)
+        self._sizes[self._priorities.pop(seq)] -= 1
+        self._virtual_time = finish
+        self._reset_if_idle()
+        return item
+
+    def remove(self, item: T) -> bool:
+        """Remove a queued item (e.g., a cancelled waiter), in linear time.
+
+        Returns:
+            False if the item is not queued.
+        """
+        for idx, (_, seq, queued) in enumerate(self._heap):
+            if queued is item:
+                break
+        else:
+            return False
+        self._heap[idx] = self._heap[-1]
+        self._heap.pop()
+        heapq.heapify(self._heap)
+        self._sizes[self._priorities.pop(seq)] -= 1
+        self._reset_if_idle()
+        return True
+
+    def sizes(self) -> Dict[str, int]:
+        """Get the number of queued items per priority."""
+        return dict(self._sizes)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+
+# PUBLIC API
+
+
+def get_priority(num_chunks: int) -> Priority:
+    """Get the priority of a document based on the number of chunks it has."""
+    if num_chunks <= settings.INTERACTIVE_MAX_CHUNKS:
+        return "interactive"
+    return "bulk"
+
+
+def get_scheduling_info(config: Optional[RunnableConfig]) -> Tuple[str, Priority]:
+    """Get the owner and priority of a run from its configurable fields."""
+    configurable = (config or {}).get("configurable", {})
+    owner = str(configurable.get("owner_id") or ANONYMOUS_OWNER)
+    priority = configurable.get("priority")
+    if priority not in PRIORITY_WEIGHTS:
+        priority = "interactive"
+    return owner, priority
@@ -28,13 +28,201 @@ def get_postgres_url() -> URL:
     return url
 
 
-# Max concurrency used for extracting content from documents.
-# A long document is broken into smaller chunks this controls
-# how many chunks are processed concurrently.
+# Initial concurrency used for extracting content from documents.
+# A long document is broken into smaller chunks, which are sent to the model
+# concurrently. The number of concurrent calls to each model is shared by all
+# requests and adapts to the provider: it grows while calls succeed quickly and
+# backs off when the provider is overloaded (429s, 5xx, timeouts).
 MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", 1))
 
+# Bounds of the adaptive per model concurrency limit.
+MIN_CONCURRENCY_LIMIT = int(os.environ.get("MIN_CONCURRENCY_LIMIT", 1))
+MAX_CONCURRENCY_LIMIT = int(os.environ.get("MAX_CONCURRENCY_LIMIT", 32))
+
+# Model calls slower than this (in seconds) do not increase the concurrency limit.
+# Set to 0 to ignore latency.
+CONCURRENCY_LATENCY_TARGET = float(os.environ.get("CONCURRENCY_LATENCY_TARGET", 30))
+
 # Max number of chunks to process per documents
 # When a long document is split into chunks, this controls
 # how many of those chunks will be processed.
 # Set to 0 or negative to disable the max chunks limit.
 MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", -1))
+
+# Whether chunks repeating an earlier chunk of the same document (e.g., headers,
+# footers or disclaimers) are skipped instead of being sent to the model.
+SKIP_DUPLICATE_CHUNKS = (
+    os.environ.get("SKIP_DUPLICATE_CHUNKS", "true").lower() == "true"
+)
+
+# Chunks at least this similar to an earlier chunk are skipped as near-duplicates.
+# The similarity is estimated from SimHash signatures of the chunks. Only exact
+# duplicates (up to case and whitespace) are skipped by default: near-duplicates
+# may differ in the data to extract, e.g., tables with the same layout but other
+# figures. Set lower (e.g., 0.95) to also skip near-duplicates.
+DUPLICATE_CHUNK_THRESHOLD = float(os.environ.get("DUPLICATE_CHUNK_THRESHOLD", 1.0))
+
+# Max number of distinct extracted items whose digests are kept in memory while
+# deduplicating the results of a document. Beyond this, digests are spilled to
+# a temporary file on disk. Set to 0 or negative to never spill.
+DEDUPLICATION_MAX_MEMORY_ITEMS = int(
+    os.environ.get("DEDUPLICATION_MAX_MEMORY_ITEMS", 1_000_000)
+)
+
+# Max number of compiled extractors (dereferenced schema, prompt template and
+# structured output runnable) kept in memory.
+# Set to 0 or negative to disable the cache.
+COMPILED_EXTRACTOR_CACHE_SIZE = int(
+    os.environ.get("COMPILED_EXTRACTOR_CACHE_SIZE", 128)
+)
+
+# Backend used to cache extraction results of individual chunks.
+# One of "memory", "sqlite", "postgres" or "none" to disable the cache.
+RESULT_CACHE_BACKEND = os.environ.get("RESULT_CACHE_BACKEND", "memory")
+
+# Max number of chunk results kept by the in-memory result cache.
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 10_000))
+
+# Time in seconds after which a cached chunk result is ignored.
+# Set to 0 or negative to keep results forever.
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 24 * 60 * 60))
+
+# Location of the database file used by the sqlite result cache.
+RESULT_CACHE_SQLITE_PATH = os.environ.get(
+    "RESULT_CACHE_SQLITE_PATH", "result_cache.sqlite3"
+)
+
+# Backend used to cache the embeddings of chunks and queries in retrieval mode.
+# One of "sqlite", "memory" or "none" to disable the cache. The sqlite cache
+# keeps the embeddings across restarts, so examples are not embedded again.
+EMBEDDING_CACHE_BACKEND = os.environ.get("EMBEDDING_CACHE_BACKEND", "sqlite")
+
+# Max number of vectors kept by the in-memory embedding cache.
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", 100_000))
+
+# Location of the database file used by the sqlite embedding cache.
+EMBEDDING_CACHE_SQLITE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_SQLITE_PATH", "embedding_cache.sqlite3"
+)
+
+# Backend used to cache the documents parsed from uploaded files.
+# One of "disk" or "none" to disable the cache.
+DOCUMENT_CACHE_BACKEND = os.environ.get("DOCUMENT_CACHE_BACKEND", "disk")
+
+# Directory of the files of the disk document cache.
+DOCUMENT_CACHE_DIR = os.environ.get("DOCUMENT_CACHE_DIR", "document_cache")
+
+# Max size in MB of the files of the disk document cache. The least recently
+# used documents are evicted beyond this.
+DOCUMENT_CACHE_MAX_SIZE_MB = int(os.environ.get("DOCUMENT_CACHE_MAX_SIZE_MB", 1024))
+
+# Number of output tokens reserved against the tokens per minute rate limit
+# of a model when a chunk is sent. Unused tokens are given back once the
+# response is received.
+OUTPUT_TOKEN_RESERVATION = int(os.environ.get("OUTPUT_TOKEN_RESERVATION", 1024))
+
+# Documents with at most this many chunks are extracted with interactive
+# priority, larger documents with bulk priority.
+INTERACTIVE_MAX_CHUNKS = int(os.environ.get("INTERACTIVE_MAX_CHUNKS", 5))
+
+# Share of model capacity given to interactive chunks relative to bulk chunks
+# when both are waiting.
+INTERACTIVE_PRIORITY_WEIGHT = float(os.environ.get("INTERACTIVE_PRIORITY_WEIGHT", 8))
+
+# Max number of short texts of an /extract_text batch that are packed into a
+# single call to the model. Set to 1 to extract every text with its own call.
+PACKING_MAX_INPUTS = int(os.environ.get("PACKING_MAX_INPUTS", 20))
+
+# Texts with more (estimated) tokens than this are never packed with others.
+PACKING_MAX_TEXT_TOKENS = int(os.environ.get("PACKING_MAX_TEXT_TOKENS", 500))
+
+# Max number of (estimated) text tokens packed into a single call to the model.
+PACKING_MAX_TOKENS = int(os.environ.get("PACKING_MAX_TOKENS", 4_000))
+
+# How the few-shot examples sent with each chunk are selected when they do not
+# all fit in the example token budget. One of "lexical" (word overlap with the
+# chunk), "embeddings" (embedding similarity with the chunk) or "all" to always
+# send every example.
+EXAMPLE_SELECTION = os.environ.get("EXAMPLE_SELECTION", "lexical")
+
+# Max number of (estimated) tokens of the examples sent with each chunk.
+EXAMPLE_TOKEN_BUDGET = int(os.environ.get("EXAMPLE_TOKEN_BUDGET", 2_000))
+
+# Whether the chunks of extraction jobs are extracted by the API process that
+# created the job. Disable when dedicated workers (scripts/run_worker.py) pull
+# the chunks from the database instead.
+RUN_JOBS_IN_PROCESS = os.environ.get("RUN_JOBS_IN_PROCESS", "true").lower() == "true"
+
+# Max number of chunks of extraction jobs a worker extracts concurrently.
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", 16))
+
+# Time in seconds a worker holds a chunk before other workers may claim it.
+# Workers extend the leases of their chunks while extracting them, so a chunk is
+# only claimed again if its worker died.
+JOB_CHUNK_LEASE_SECONDS = int(os.environ.get("JOB_CHUNK_LEASE_SECONDS", 300))
+
+# Number of times the extraction of a chunk is attempted before it is failed.
+JOB_CHUNK_MAX_ATTEMPTS = int(os.environ.get("JOB_CHUNK_MAX_ATTEMPTS", 3))
+
+# Time in seconds before a failed chunk is retried, doubled after each attempt,
+# so that chunks failing on rate limits or outages do not retry in a hot loop.
+JOB_CHUNK_RETRY_DELAY_SECONDS = float(
+    os.environ.get("JOB_CHUNK_RETRY_DELAY_SECONDS", 5)
+)
+
+# Max number of documents of a bulk extraction that are parsed and extracted
+# at once. The chunks of these documents share the concurrency limit of the model.
+BULK_MAX_CONCURRENT_DOCUMENTS = int(os.environ.get("BULK_MAX_CONCURRENT_DOCUMENTS", 8))
+
+# Default number of chunks retrieved in the "retrieval" extraction mode.
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", 4))
+
+# Number of chunks ranked first by BM25 that are re-scored with embeddings in
+# the "retrieval" mode, as a multiple of the number of chunks retrieved.
+RETRIEVAL_CANDIDATES_MULTIPLIER = int(
+    os.environ.get("RETRIEVAL_CANDIDATES_MULTIPLIER", 5)
+)
+
+# Number of threads running the CPU-bound stages of requests (parsing files,
+# splitting documents into chunks, validating schemas) off the event loop.
+CPU_EXECUTOR_THREADS = int(os.environ.get("CPU_EXECUTOR_THREADS", 4))
+
+# Number of processes parsing PDFs. PDFs are parsed by the CPU threads if 0.
+PDF_PARSING_PROCESSES = int(os.environ.get("PDF_PARSING_PROCESSES", 2))
+
+# Whether the pages of a PDF are split into ranges parsed concurrently by the
+# PDF parsing processes, rather than parsing the whole PDF in one process.
+PDF_PARALLEL_PAGES = os.environ.get("PDF_PARALLEL_PAGES", "true").lower() == "true"
+
+# Number of pages of a PDF parsed at once by a process. Smaller ranges yield
+# the first pages sooner, but each range re-reads the structure of the PDF.
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 16))
+
+# Number of threads running the database queries of the async endpoints.
+DATABASE_EXECUTOR_THREADS = int(os.environ.get("DATABASE_EXECUTOR_THREADS", 8))
+
+# Max number of pages and of chunks of a document buffered between the stages
+# of the extraction pipeline (parsing, chunking, extraction). A slow stage
+# pauses the stages before it once its buffer is full.
+PIPELINE_BUFFER_SIZE = int(os.environ.get("PIPELINE_BUFFER_SIZE", 8))
+
+# Max number of chunks of a document being extracted at once by the pipeline.
+PIPELINE_MAX_IN_FLIGHT_CHUNKS = int(os.environ.get("PIPELINE_MAX_IN_FLIGHT_CHUNKS", 32))
+
+# Max size of the request bodies of the extract endpoints, i.e., the uploaded
+# file (at most MAX_FILE_SIZE_MB, see extraction/parsing.py) and the other form
+# fields. Larger requests are rejected before being read.
+MAX_REQUEST_SIZE_MB = int(
+    os.environ.get(
+        "MAX_REQUEST_SIZE_MB", int(os.environ.get("MAX_FILE_SIZE_MB", 10)) + 1
+    )
+)
+
+# Max size of the request bodies of bulk extractions.
+BULK_MAX_REQUEST_SIZE_MB = int(os.environ.get("BULK_MAX_REQUEST_SIZE_MB", 200))
+
+# Max total size in MB of the files of a bulk archive, once decompressed.
+# Checked against the sizes declared by the archive before any file is read.
+BULK_MAX_UNCOMPRESSED_SIZE_MB = int(
+    os.environ.get("BULK_MAX_UNCOMPRESSED_SIZE_MB", 1024)
+)
@@ -0,0 +1,73 @@
+"""Reject oversized request bodies of the extract endpoints before reading them.
+
+Uploaded files are only checked against `MAX_FILE_SIZE_MB` once the whole
+form was received. Bodies whose Content-Length exceeds the limit are rejected
+right away instead, and bodies without a Content-Length (chunked uploads) are
+rejected as soon as the streamed byte count exceeds it.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server import settings
+
+
+def get_max_body_size(path: str) -> Optional[int]:
+    """Get the max body size (in bytes) of the requests to a path, if limited."""
+    if path == "/extract/bulk":
+        return settings.BULK_MAX_REQUEST_SIZE_MB * 1024 * 1024
+    if path == "/extract" or path.startswith("/extract/"):
+        return settings.MAX_REQUEST_SIZE_MB * 1024 * 1024
+    return None
+
+
+def _too_large(max_body_size: int) -> str:
+    return (
+        f"Request body exceeds the maximum limit of "
+        f"{max_body_size // (1024 * 1024)} MB."
+    )
+
+
+class MaxBodySizeMiddleware:
+    """Limit the size of the request bodies of the extract endpoints."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        max_body_size = get_max_body_size(scope["path"])
+        if max_body_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None and int(content_length) > max_body_size:
+            response = JSONResponse(
+                {"detail": _too_large(max_body_size)}, status_code=413
+            )
+            await response(scope, receive, send)
+            return
+
+        num_bytes = 0
+
+        async def _receive() -> Message:
+            nonlocal num_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                num_bytes += len(message.get("body", b""))
+                if num_bytes > max_body_size:
+                    # Raised while the endpoint reads its form
+                    raise HTTPException(
+                        status_code=413, detail=_too_large(max_body_size)
+                    )
+            return message
+
+        await self.app(scope, _receive, send)
@@ -0,0 +1,314 @@
+"""A work queue of the chunks of extraction jobs, backed by postgres.
+
+Workers claim pending chunks with `SELECT ... FOR UPDATE SKIP LOCKED`, so any
+number of workers on any number of nodes pull from the same table without
+claiming the same chunk twice. A claimed chunk is leased to its worker, which
+extends the lease while it extracts the chunk. Chunks whose lease expired
+(e.g., their worker died) are claimed again, and failed chunks are retried
+after an exponential backoff. Chunks are failed once claimed a max number of
+attempts.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import and_, exists, func, or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from db.models import ExtractionJob, JobChunk
+from server import settings
+
+
+class ClaimedChunk(NamedTuple):
+    """A chunk leased to a worker."""
+
+    job_id: UUID
+    index: int
+    text: str
+    attempts: int
+
+
+def _now() -> Any:
+    # Leases are set and compared with the clock of the database, which is
+    # shared by the workers of every node.
+    return func.timezone("UTC", func.now())
+
+
+def _fail_exhausted_chunks(
+    session: Session, max_attempts: int, job_id: Optional[UUID]
+) -> None:
+    """Fail the chunks whose lease expired on their last attempt."""
+    exhausted = select(JobChunk.job_id, JobChunk.index).where(
+        JobChunk.status == "running",
+        JobChunk.lease_expires_at < _now(),
+        JobChunk.attempts >= max_attempts,
+    )
+    if job_id is not None:
+        exhausted = exhausted.where(JobChunk.job_id == job_id)
+    rows = session.execute(
+        update(JobChunk)
+        .where(
+            tuple_(JobChunk.job_id, JobChunk.index).in_(
+                exhausted.with_for_update(skip_locked=True)
+            )
+        )
+        .values(
+            status="error",
+            error=f"The lease of the chunk expired after {max_attempts} attempts.",
+            worker_id=None,
+            lease_expires_at=None,
+        )
+        .returning(JobChunk.job_id)
+    ).all()
+    for failed_job_id, num_failed in Counter(row.job_id for row in rows).items():
+        _update_job(
+            session,
+            failed_job_id,
+            failed_chunks=ExtractionJob.failed_chunks + num_failed,
+        )
+
+
+def claim_chunks(
+    session_factory: Callable[[], Session],
+    worker_id: str,
+    *,
+    limit: int,
+    lease_seconds: Optional[int] = None,
+    max_attempts: Optional[int] = None,
+    job_id: Optional[UUID] = None,
+) -> List[ClaimedChunk]:
+    """Claim pending chunks (or chunks whose lease expired) for a worker.
+
+    Chunks are claimed in the order their jobs were created. Chunks whose lease
+    expired on their last attempt are failed instead of being claimed again.
+
+    Args:
+        session_factory: Creates the sessions used to access the queue.
+        worker_id: The worker claiming the chunks.
+        limit: Max number of chunks to claim.
+        lease_seconds: The duration of the leases. Defaults to the configured one.
+        max_attempts: The max number of times a chunk is claimed.
+            Defaults to the configured one.
+        job_id: Only claim the chunks of this job if provided.
+    """
+    if limit <= 0:
+        return []
+    if lease_seconds is None:
+        lease_seconds = settings.JOB_CHUNK_LEASE_SECONDS
+    if max_attempts is None:
+        max_attempts = settings.JOB_CHUNK_MAX_ATTEMPTS
+    claimable = select(JobChunk.job_id, JobChunk.index).where(
+        JobChunk.attempts < max_attempts,
+        or_(
+            and_(
+                JobChunk.status == "pending",
+                or_(JobChunk.not_before.is_(None), JobChunk.not_before <= _now()),
+            ),
+            and_(JobChunk.status == "running", JobChunk.lease_expires_at < _now()),
+        ),
+    )
+    if job_id is not None:
+        claimable = claimable.where(JobChunk.job_id == job_id)
+    claimable = (
+        claimable.order_by(JobChunk.created_at, JobChunk.index)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    with session_factory() as session:
+        _fail_exhausted_chunks(session, max_attempts, job_id)
+        rows = session.execute(
+            update(JobChunk)
+            .where(tuple_(JobChunk.job_id, JobChunk.index).in_(claimable))
+            .values(
+                status="running",
+                worker_id=worker_id,
+                lease_expires_at=_now() + timedelta(seconds=lease_seconds),
+                not_before=None,
+                attempts=JobChunk.attempts + 1,
+            )
+            .returning(
+                JobChunk.job_id, JobChunk.index, JobChunk.text, JobChunk.attempts
+            )
+        ).all()
+        job_ids = {row.job_id for row in rows}
+        if job_ids:
+            session.execute(
+                update(ExtractionJob)
+                .where(
+                    ExtractionJob.uuid.in_(job_ids), ExtractionJob.status == "pending"
+                )
+                .values(status="running")
+            )
+        session.commit()
+    return sorted((ClaimedChunk(*row) for row in rows), key=lambda chunk: chunk.index)
+
+
+def has_delayed_chunks(
+    session_factory: Callable[[], Session], *, job_id: Optional[UUID] = None
+) -> bool:
+    """Whether failed chunks are waiting for their retry."""
+    query = select(JobChunk.index).where(
+        JobChunk.status == "pending", JobChunk.not_before > _now()
+    )
+    if job_id is not None:
+        query = query.where(JobChunk.job_id == job_id)
+    with session_factory() as session:
+        return session.execute(query.limit(1)).first() is not None
+
+
+def extend_leases(
+    session_factory: Callable[[], Session],
+    worker_id: str,
+    chunks: Sequence[ClaimedChunk],
+    *,
+    lease_seconds: Optional[int] = None,
+) -> int:
+    """Extend the leases of the chunks still held by a worker.
+
+    Returns:
+        The number of leases extended.
+    """
+    if not chunks:
+        return 0
+    if lease_seconds is None:
+        lease_seconds = settings.JOB_CHUNK_LEASE_SECONDS
+    with session_factory() as session:
+        result = session.execute(
+            update(JobChunk)
+            .where(
+                tuple_(JobChunk.job_id, JobChunk.index).in_(
+                    [(chunk.job_id, chunk.index) for chunk in chunks]
+                ),
+                JobChunk.worker_id == worker_id,
+                JobChunk.status == "running",
+            )
+            .values(lease_expires_at=_now() + timedelta(seconds=lease_seconds))
+        )
+        session.commit()
+    return result.rowcount
+
+
+def _release_chunk(
+    session: Session, worker_id: str, chunk: ClaimedChunk, **values: Any
+) -> bool:
+    """Update a chunk held by a worker. Returns False if the lease was lost."""
+    result = session.execute(
+        update(JobChunk)
+        .where(
+            JobChunk.job_id == chunk.job_id,
+            JobChunk.index == chunk.index,
+            JobChunk.worker_id == worker_id,
+            JobChunk.status == "running",
+        )
+        .values(worker_id=None, lease_expires_at=None, **values)
+    )
+    return result.rowcount > 0
+
+
+def _update_job(session: Session, job_id: UUID, **counters: Any) -> None:
+    """Update the counters of a job and complete it if no chunk is left.
+
+    The counters are updated first: this locks the row of the job until the
+    transaction commits, so when the last chunks of a job complete concurrently,
+    the last transaction to commit sees every other chunk completed.
+    """
+    session.execute(
+        update(ExtractionJob).where(ExtractionJob.uuid == job_id).values(**counters)
+    )
+    session.execute(
+        update(ExtractionJob)
+        .where(
+            ExtractionJob.uuid == job_id,
+            ExtractionJob.status.in_(["pending", "running"]),
+            ~exists().where(
+                JobChunk.job_id == job_id,
+                JobChunk.status.in_(["pending", "running"]),
+            ),
+        )
+        .values(status="succeeded")
+    )
+
+
+def complete_chunk(
+    session_factory: Callable[[], Session],
+    worker_id: str,
+    chunk: ClaimedChunk,
+    data: List[Any],
+    num_tokens: int,
+) -> bool:
+    """Store the result of a chunk and update the progress of its job.
+
+    Returns:
+        False if the lease of the chunk was lost (e.g., it expired and the chunk
+        was claimed by another worker), in which case the result is dropped.
+    """
+    with session_factory() as session:
+        if not _release_chunk(session, worker_id, chunk, status="success", data=data):
+            session.rollback()
+            return False
+        _update_job(
+            session,
+            chunk.job_id,
+            completed_chunks=ExtractionJob.completed_chunks + 1,
+            tokens_used=ExtractionJob.tokens_used + num_tokens,
+        )
+        session.commit()
+    return True
+
+
+def fail_chunk(
+    session_factory: Callable[[], Session],
+    worker_id: str,
+    chunk: ClaimedChunk,
+    error: str,
+    *,
+    max_attempts: Optional[int] = None,
+    retry_delay_seconds: Optional[float] = None,
+) -> bool:
+    """Record the failure of a chunk, which is retried unless out of attempts.
+
+    The delay before the retry doubles after each attempt.
+
+    Args:
+        session_factory: Creates the sessions used to access the queue.
+        worker_id: The worker holding the chunk.
+        chunk: The failed chunk.
+        error: The error of the extraction of the chunk.
+        max_attempts: The max number of times a chunk is claimed.
+            Defaults to the configured one.
+        retry_delay_seconds: The delay before the first retry.
+            Defaults to the configured one.
+
+    Returns:
+        False if the lease of the chunk was lost.
+    """
+    if max_attempts is None:
+        max_attempts = settings.JOB_CHUNK_MAX_ATTEMPTS
+    if retry_delay_seconds is None:
+        retry_delay_seconds = settings.JOB_CHUNK_RETRY_DELAY_SECONDS
+    with session_factory() as session:
+        if chunk.attempts < max_attempts:
+            delay = retry_delay_seconds * 2 ** (chunk.attempts - 1)
+            released = _release_chunk(
+                session,
+                worker_id,
+                chunk,
+                status="pending",
+                error=error,
+                not_before=_now() + timedelta(seconds=delay),
+            )
+        else:
+            released = _release_chunk(
+                session, worker_id, chunk, status="error", error=error
+            )
+            if released:
+                _update_job(
+                    session,
+                    chunk.job_id,
+                    failed_chunks=ExtractionJob.failed_chunks + 1,
+                )
+        session.commit()
+    return released
@@ -6,7 +6,7 @@ from httpx import AsyncClient
 from sqlalchemy import URL, create_engine
 from sqlalchemy.orm import sessionmaker
 
-from db.models import Base, get_session
+from db.models import Base, get_session, get_session_factory
 from server.main import app
 
 url = URL.create(
@@ -35,6 +35,8 @@ def override_get_session() -> Generator[TestingSession, None, None]:
 
 
 app.dependency_overrides[get_session] = override_get_session
+# Used by the jobs running in the background of the requests
+app.dependency_overrides[get_session_factory] = lambda: TestingSession
 
 
 @asynccontextmanager
@@ -11,6 +11,9 @@ async def test_configuration_api() -> None:
         assert sorted(result) == [
             "accepted_mimetypes",
             "available_models",
+            "concurrency_limits",
+            "default_embeddings",
+            "embeddings",
             "max_chunks",
             "max_concurrency",
             "max_file_size_mb",
@@ -20,3 +23,7 @@ async def test_configuration_api() -> None:
         assert all(isinstance(model_name, str) for model_name in models)
         assert "gpt-3.5-turbo" in models
         assert len(models) >= 2
+        assert sorted(result["concurrency_limits"]) == sorted(models)
+        embeddings = [embeddings["name"] for embeddings in result["embeddings"]]
+        assert "local-hashing" in embeddings
+        assert result["default_embeddings"] in embeddings
@@ -81,6 +81,8 @@ async def test_examples_api() -> None:
             ],
             "uuid": example_id,
         }
+        # The token count is computed when the example is created
+        assert response.json()[0]["token_count"] > 0
 
         # Check headers
         response = await client.get(
@@ -1,13 +1,18 @@
 """Code to test API endpoints."""
+import io
+import json
 import tempfile
+import zipfile
+from functools import partial
 from unittest.mock import patch
 from uuid import UUID, uuid4
 
-from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.embeddings import FakeEmbeddings
 from langchain_core.runnables import RunnableLambda
 
+from extraction.chunking import TokenChunker
 from tests.db import get_async_client
+from tests.unit_tests.test_chunking import BYTE_ENCODING
 
 
 def mock_extraction_runnable(*args, **kwargs):
@@ -20,8 +25,9 @@ def mock_extraction_runnable(*args, **kwargs):
     }
 
 
-def mock_text_splitter(*args, **kwargs):
-    return CharacterTextSplitter()
+def mock_text_splitter(*args, chunk_size: int = 1_000, **kwargs):
+    """Mock the text splitter, splitting texts into chunks of `chunk_size` bytes."""
+    return TokenChunker(BYTE_ENCODING, chunk_size=chunk_size, chunk_overlap=0)
 
 
 def mock_embeddings(*args, **kwargs):
@@ -32,12 +38,8 @@ def mock_embeddings(*args, **kwargs):
     "server.extraction_runnable.extraction_runnable",
     new=RunnableLambda(mock_extraction_runnable),
 )
-@patch(
-    "server.retrieval.extraction_runnable",
-    new=RunnableLambda(mock_extraction_runnable),
-)
-@patch("server.extraction_runnable.TokenTextSplitter", mock_text_splitter)
-@patch("server.retrieval.OpenAIEmbeddings", mock_embeddings)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
+@patch("server.retrieval.get_embeddings", mock_embeddings)
 async def test_extract_from_file() -> None:
     """Test extract from file API."""
     async with get_async_client() as client:
@@ -86,6 +88,8 @@ async def test_extract_from_file() -> None:
         assert response.json() == {
             "data": ["Test Conte"],
             "content_too_long": False,
+            "skipped_chunks": 0,
+            "duplicate_chunks": [],
         }
 
         # Vary chat model
@@ -103,6 +107,8 @@ async def test_extract_from_file() -> None:
         assert response.json() == {
             "data": ["Test Conte"],
             "content_too_long": False,
+            "skipped_chunks": 0,
+            "duplicate_chunks": [],
         }
 
         # Test retrieval
@@ -123,7 +129,7 @@ async def test_extract_from_file() -> None:
         # We'll use multi-form data here.
         # Create a named temporary file
         with tempfile.NamedTemporaryFile(mode="w+t", delete=True) as f:
-            f.write("This is a named temporary file.")
+            f.write(f"This is a named temporary file {uuid4()}.")
             f.seek(0)
             f.flush()
             response = await client.post(
@@ -136,15 +142,38 @@ async def test_extract_from_file() -> None:
                 headers=headers,
             )
 
-        assert response.status_code == 200, response.text
-        assert response.json() == {"data": ["This is a "], "content_too_long": False}
+            assert response.status_code == 200, response.text
+            assert response.json() == {
+                "data": ["This is a "],
+                "content_too_long": False,
+                "skipped_chunks": 0,
+                "duplicate_chunks": [],
+                "metadata": {"document_cache": "miss"},
+            }
+
+            # The same file is not parsed again
+            f.seek(0)
+            response = await client.post(
+                "/extract",
+                data={
+                    "extractor_id": extractor_id,
+                    "mode": "retrieval",
+                },
+                files={"file": f},
+                headers=headers,
+            )
+            assert response.status_code == 200, response.text
+            assert response.json() == {
+                "data": ["This is a "],
+                "metadata": {"document_cache": "hit"},
+            }
 
 
 @patch(
     "server.extraction_runnable.extraction_runnable",
     new=RunnableLambda(mock_extraction_runnable),
 )
-@patch("server.extraction_runnable.TokenTextSplitter", mock_text_splitter)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
 async def test_extract_from_large_file() -> None:
     user_id = str(uuid4())
     headers = {"x-key": user_id}
@@ -186,8 +215,9 @@ async def test_extract_from_large_file() -> None:
             f.seek(0)
             f.flush()
             with patch("server.extraction_runnable.settings.MAX_CHUNKS", 1):
-                with patch.object(
-                    CharacterTextSplitter, "split_text", return_value=["a", "b"]
+                with patch(
+                    "server.extraction_runnable.make_text_splitter",
+                    partial(mock_text_splitter, chunk_size=4),
                 ):
                     response = await client.post(
                         "/extract",
@@ -200,6 +230,283 @@ async def test_extract_from_large_file() -> None:
                     )
         assert response.status_code == 200
         assert response.json() == {
-            "data": ["a"],
+            "data": ["This"],
             "content_too_long": True,
+            "skipped_chunks": 0,
+            "duplicate_chunks": [],
+            "metadata": {"document_cache": "miss"},
+        }
+
+
+@patch(
+    "server.extraction_runnable.extraction_runnable",
+    new=RunnableLambda(mock_extraction_runnable),
+)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
+async def test_extract_duplicate_chunks() -> None:
+    """Only exact duplicate chunks are skipped by default, and are reported."""
+    headers = {"x-key": str(uuid4())}
+    async with get_async_client() as client:
+        create_request = {
+            "name": "Test Name",
+            "description": "Test Description",
+            "schema": {"type": "object"},
+            "instruction": "Test Instruction",
+        }
+        response = await client.post(
+            "/extractors", json=create_request, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        extractor_id = response.json()["uuid"]
+
+        # Chunks of 17 bytes, the last one only differing in case from the first
+        text = "Revenue 2023: 100Revenue 2024: 120revenue 2023: 100"
+        with patch(
+            "server.extraction_runnable.make_text_splitter",
+            partial(mock_text_splitter, chunk_size=17),
+        ):
+            response = await client.post(
+                "/extract",
+                data={"extractor_id": extractor_id, "text": text},
+                headers=headers,
+            )
+        assert response.status_code == 200, response.text
+        assert response.json() == {
+            "data": ["Revenue 20"],
+            "content_too_long": False,
+            "skipped_chunks": 1,
+            "duplicate_chunks": [{"chunk": 2, "duplicate_of": 0}],
+        }
+
+
+async def test_extract_request_too_large() -> None:
+    """Request bodies larger than the limit are rejected before being read."""
+    headers = {"x-key": str(uuid4())}
+    async with get_async_client() as client:
+        with patch("server.upload_limits.settings.MAX_REQUEST_SIZE_MB", 1):
+            data = {"extractor_id": str(uuid4()), "text": "a" * 2 * 1024 * 1024}
+            response = await client.post("/extract", data=data, headers=headers)
+            assert response.status_code == 413
+            assert response.json() == {
+                "detail": "Request body exceeds the maximum limit of 1 MB."
+            }
+
+            # Without a Content-Length, the streamed bytes are counted
+            async def _stream_body():
+                yield b"text="
+                for _ in range(3):
+                    yield b"a" * 1024 * 1024
+
+            response = await client.post(
+                "/extract",
+                content=_stream_body(),
+                headers={
+                    **headers,
+                    "content-type": "application/x-www-form-urlencoded",
+                },
+            )
+            assert response.status_code == 413
+
+            # Other endpoints are not limited
+            response = await client.post(
+                "/extractors",
+                json={
+                    "name": "Test Name",
+                    "description": "Test Description",
+                    "schema": {"type": "object", "description": "a" * 2 * 1024 * 1024},
+                    "instruction": "Test Instruction",
+                },
+                headers=headers,
+            )
+            assert response.status_code == 200
+
+
+def mock_failing_extraction_runnable(*args, **kwargs):
+    """Mock the extraction_runnable function failing on some chunks."""
+    extract_request = args[0]
+    if extract_request.text == "fail":
+        raise ValueError("Failed to extract.")
+    return {"data": [extract_request.text, "shared"]}
+
+
+@patch(
+    "server.extraction_runnable.extraction_runnable",
+    new=RunnableLambda(mock_failing_extraction_runnable),
+)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
+async def test_stream_extraction() -> None:
+    """Test streaming extraction results as chunks complete."""
+    user_id = str(uuid4())
+    headers = {"x-key": user_id}
+    async with get_async_client() as client:
+        create_request = {
+            "name": "Test Name",
+            "description": "Test Description",
+            "schema": {"type": "object"},
+            "instruction": "Test Instruction",
+        }
+        response = await client.post(
+            "/extractors", json=create_request, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        extractor_id = response.json()["uuid"]
+
+        with patch.object(
+            TokenChunker, "split_text", return_value=["a", "fail", "b", "A"]
+        ):
+            response = await client.post(
+                "/extract/stream",
+                data={
+                    "extractor_id": extractor_id,
+                    "text": "Test Content",
+                    "response_format": "ndjson",
+                },
+                headers=headers,
+            )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        events = [json.loads(line) for line in response.text.splitlines()]
+        data_events = sorted(
+            (event["data"] for event in events[:-1]), key=lambda e: e["chunk"]
+        )
+        # "shared" is only emitted by whichever chunk completed first
+        assert sorted(item for e in data_events for item in e["data"]) == [
+            "a",
+            "b",
+            "shared",
+        ]
+        assert [e["chunk"] for e in data_events] == [0, 2]
+        assert events[-1] == {
+            "event": "end",
+            "data": {
+                "content_too_long": False,
+                "chunks": [
+                    {"chunk": 0, "status": "success"},
+                    {
+                        "chunk": 1,
+                        "status": "error",
+                        "error": "ValueError('Failed to extract.')",
+                    },
+                    {"chunk": 2, "status": "success"},
+                    # Chunks repeating an earlier chunk are not extracted
+                    {"chunk": 3, "status": "skipped", "duplicate_of": 0},
+                ],
+            },
+        }
+
+        # Server sent events
+        response = await client.post(
+            "/extract/stream",
+            data={"extractor_id": extractor_id, "text": "Test Content"},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "event: data" in response.text
+        assert "event: end" in response.text
+
+
+@patch(
+    "server.extraction_runnable.extraction_runnable",
+    new=RunnableLambda(mock_failing_extraction_runnable),
+)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
+async def test_bulk_extraction() -> None:
+    """Test extracting from the documents of a JSONL file and of a zip archive."""
+    user_id = str(uuid4())
+    headers = {"x-key": user_id}
+    async with get_async_client() as client:
+        create_request = {
+            "name": "Test Name",
+            "description": "Test Description",
+            "schema": {"type": "object"},
+            "instruction": "Test Instruction",
+        }
+        response = await client.post(
+            "/extractors", json=create_request, headers=headers
+        )
+        assert response.status_code == 200, response.text
+        extractor_id = response.json()["uuid"]
+
+        lines = [
+            json.dumps({"id": "first", "text": "one"}),
+            json.dumps("two"),
+            json.dumps({"id": "failing", "text": "fail"}),
+            "not json",
+        ]
+        response = await client.post(
+            "/extract/bulk",
+            data={"extractor_id": extractor_id},
+            files={"file": ("texts.jsonl", "\n".join(lines).encode("utf-8"))},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        assert response.headers["content-type"] == "application/x-ndjson"
+        results = {
+            result["document"]: result
+            for result in map(json.loads, response.text.splitlines())
+        }
+        assert sorted(results) == ["2", "4", "failing", "first"]
+        assert results["first"] == {
+            "document": "first",
+            "data": ["one", "shared"],
+            "content_too_long": False,
+            "skipped_chunks": 0,
+            "duplicate_chunks": [],
+        }
+        assert results["2"]["data"] == ["two", "shared"]
+        assert results["failing"]["error"] == "ValueError('Failed to extract.')"
+        assert "error" in results["4"]
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            zip_file.writestr("a.txt", "Content of a")
+            zip_file.writestr("docs/b.txt", "Content of b")
+        response = await client.post(
+            "/extract/bulk",
+            data={"extractor_id": extractor_id},
+            files={"file": ("docs.zip", archive.getvalue())},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        results = map(json.loads, response.text.splitlines())
+        assert sorted(
+            (result["document"], result["data"][0]) for result in results
+        ) == [("a.txt", "Content of a"), ("docs/b.txt", "Content of b")]
+
+        # Files are rejected from their declared size, before being decompressed
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("small.txt", "Small content")
+            zip_file.writestr("bomb.txt", b"\0" * 2 * 1024 * 1024)
+        with patch("extraction.parsing.MAX_FILE_SIZE_MB", 1), patch(
+            "zipfile.ZipFile.open", side_effect=zipfile.ZipFile.open, autospec=True
+        ) as open_member:
+            response = await client.post(
+                "/extract/bulk",
+                data={"extractor_id": extractor_id},
+                files={"file": ("docs.zip", archive.getvalue())},
+                headers=headers,
+            )
+        assert response.status_code == 200, response.text
+        results = {
+            result["document"]: result
+            for result in map(json.loads, response.text.splitlines())
+        }
+        assert results["small.txt"]["data"][0] == "Small content"
+        assert "413" in results["bomb.txt"]["error"]
+        assert [call.args[1].filename for call in open_member.call_args_list] == [
+            "small.txt"
+        ]
+
+        with patch("server.bulk.settings.BULK_MAX_UNCOMPRESSED_SIZE_MB", 1):
+            response = await client.post(
+                "/extract/bulk",
+                data={"extractor_id": extractor_id},
+                files={"file": ("docs.zip", archive.getvalue())},
+                headers=headers,
+            )
+        assert response.status_code == 413
+        assert response.json() == {
+            "detail": "Archive files exceed the maximum total limit of 1 MB."
         }
@@ -0,0 +1,114 @@
+"""Code to test the extraction jobs API."""
+import asyncio
+from itertools import cycle
+from typing import Any, Dict
+from unittest.mock import patch
+from uuid import uuid4
+
+from httpx import AsyncClient
+from langchain_core.messages import AIMessage
+
+from extraction.chunking import TokenChunker
+from tests.db import get_async_client
+from tests.unit_tests.fake.chat_model import GenericFakeChatModel
+from tests.unit_tests.test_chunking import BYTE_ENCODING
+
+
+def mock_text_splitter(*args, **kwargs):
+    return TokenChunker(BYTE_ENCODING, chunk_size=4, chunk_overlap=0)
+
+
+def mock_get_model(*args, **kwargs):
+    """Extract a single name from every chunk."""
+    message = AIMessage(
+        content="",
+        tool_calls=[{"name": "extractor", "args": {"data": ["Alice"]}, "id": "1"}],
+    )
+    return GenericFakeChatModel(messages=cycle([message]))
+
+
+async def _wait_for_job(client: AsyncClient, job_id: str, headers: Dict) -> Any:
+    for _ in range(100):
+        response = await client.get(f"/extract/jobs/{job_id}", headers=headers)
+        assert response.status_code == 200, response.text
+        job = response.json()
+        if job["status"] == "succeeded":
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("The job did not complete.")
+
+
+@patch("server.extraction_runnable.get_model", mock_get_model)
+@patch("server.extraction_runnable.make_text_splitter", mock_text_splitter)
+async def test_extraction_job() -> None:
+    """Test running an extraction job and paging through its results."""
+    async with get_async_client() as client:
+        user_id = str(uuid4())
+        headers = {"x-key": user_id}
+        response = await client.post(
+            "/extractors",
+            json={
+                "name": "Test Name",
+                "description": "Test Description",
+                "schema": {"type": "object", "properties": {"name": {}}},
+                "instruction": "Test Instruction",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        extractor_id = response.json()["uuid"]
+
+        response = await client.post(
+            "/extract/jobs",
+            data={"extractor_id": extractor_id, "text": "aaa\nbbb\nccc\naaa"},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        job_id = response.json()["uuid"]
+
+        job = await _wait_for_job(client, job_id, headers)
+        assert job["status"] == "succeeded"
+        assert job["total_chunks"] == 4
+        assert job["completed_chunks"] == 3
+        assert job["failed_chunks"] == 0
+        # The last chunk repeats the first one
+        assert job["skipped_chunks"] == 1
+        assert job["tokens_used"] > 0
+
+        response = await client.get(
+            f"/extract/jobs/{job_id}/results",
+            params={"limit": 3},
+            headers=headers,
+        )
+        assert response.status_code == 200, response.text
+        page = response.json()
+        assert [chunk["data"] for chunk in page["chunks"]] == [["Alice"]] * 3
+        assert page["next_offset"] == 3
+        response = await client.get(
+            f"/extract/jobs/{job_id}/results",
+            params={"offset": 3},
+            headers=headers,
+        )
+        assert response.json() == {
+            "chunks": [
+                {
+                    "chunk": 3,
+                    "status": "skipped",
+                    "data": None,
+                    "error": None,
+                    "duplicate_of": 0,
+                }
+            ],
+            "next_offset": None,
+        }
+        for params in [{"limit": 0}, {"limit": 1001}, {"offset": -1}]:
+            response = await client.get(
+                f"/extract/jobs/{job_id}/results", params=params, headers=headers
+            )
+            assert response.status_code == 422, params
+
+        # Jobs are only visible to their owner
+        response = await client.get(
+            f"/extract/jobs/{job_id}", headers={"x-key": str(uuid4())}
+        )
+        assert response.status_code == 404
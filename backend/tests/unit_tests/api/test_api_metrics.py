@@ -0,0 +1,28 @@
+from tests.db import get_async_client
+
+
+async def test_metrics_api() -> None:
+    """Test the metrics API."""
+    async with get_async_client() as client:
+        response = await client.get("/metrics")
+        assert response.status_code == 200
+        result = response.json()
+        assert sorted(result) == [
+            "compiled_extractors",
+            "concurrency",
+            "document_cache",
+            "embedding_cache",
+            "executors",
+            "packed_extractors",
+            "prompt_cache",
+            "rate_limits",
+            "result_cache",
+        ]
+        assert sorted(result["result_cache"]) == [
+            "backend",
+            "hit_ratio",
+            "hits",
+            "misses",
+            "saved_tokens",
+        ]
+        assert sorted(result["executors"]) == ["cpu", "database", "pdf_parsing"]
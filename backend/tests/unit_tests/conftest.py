@@ -1,5 +1,27 @@
 import os
+import tempfile
+from typing import Iterator
+from unittest.mock import patch
+
+import pytest
 
 os.environ["OPENAI_API_KEY"] = "placeholder"
 os.environ["FIREWORKS_API_KEY"] = "placeholder"
 os.environ["TOGETHER_API_KEY"] = "placeholder"
+# Results are cached across requests by default, which would leak mocked
+# results between tests.
+os.environ["RESULT_CACHE_BACKEND"] = "none"
+# Documents and embeddings are cached out of the source tree.
+os.environ["DOCUMENT_CACHE_DIR"] = tempfile.mkdtemp(prefix="document-cache-")
+os.environ["EMBEDDING_CACHE_SQLITE_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="embedding-cache-"), "embedding_cache.sqlite3"
+)
+
+from tests.unit_tests.test_chunking import BYTE_ENCODING  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def byte_encoding() -> Iterator[None]:
+    """Count prompt tokens without downloading the encodings of the models."""
+    with patch("server.chunk_planner.get_encoding", return_value=BYTE_ENCODING):
+        yield
@@ -1,5 +1,5 @@
 """Fake Chat Model wrapper for testing purposes."""
-from typing import Any, Iterator, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 
 from langchain_core.callbacks.manager import (
     CallbackManagerForLLMRun,
@@ -10,6 +10,7 @@ from langchain_core.messages import (
     BaseMessage,
 )
 from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
 
 
 class GenericFakeChatModel(BaseChatModel):
@@ -43,3 +44,16 @@ class GenericFakeChatModel(BaseChatModel):
     @property
     def _llm_type(self) -> str:
         return "generic-fake-chat-model"
+
+    def with_structured_output(
+        self, schema: Dict[str, Any], *, include_raw: bool = False, **kwargs: Any
+    ) -> Runnable:
+        """Parse the arguments of the first tool call of the messages."""
+
+        def _parse(message: AIMessage) -> Any:
+            parsed = message.tool_calls[0]["args"] if message.tool_calls else None
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": None}
+            return parsed
+
+        return self | RunnableLambda(_parse)
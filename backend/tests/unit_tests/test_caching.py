@@ -0,0 +1,83 @@
+from unittest.mock import patch
+
+from server import settings
+from server.caching import LRUCache
+from server.extraction_runnable import (
+    COMPILED_EXTRACTORS,
+    ExtractRequest,
+    extraction_runnable,
+    get_compiled_extractor,
+)
+
+
+def test_lru_cache() -> None:
+    """Test eviction order and counters of the LRU cache."""
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # Evicts "b" which is the least recently used
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "maxsize": 2, "hits": 2, "misses": 1}
+
+    disabled = LRUCache(maxsize=0)
+    disabled.set("a", 1)
+    assert disabled.get("a") is None
+
+
+def test_compiled_extractor_cache() -> None:
+    """Compiled artifacts should be reused across chunks of the same request."""
+    COMPILED_EXTRACTORS.clear()
+    schema = {"type": "object", "properties": {"name": {"type": "string"}}}
+    requests = [
+        ExtractRequest(text=text, schema=schema, instructions="Be nice.")
+        for text in ["chunk 1", "chunk 2", "chunk 3"]
+    ]
+    compiled = [get_compiled_extractor(request) for request in requests]
+    assert compiled[0] is compiled[1] is compiled[2]
+    assert compiled[0].schema["title"] == "extractor"
+    assert COMPILED_EXTRACTORS.stats()["hits"] == 2
+    assert COMPILED_EXTRACTORS.stats()["misses"] == 1
+
+    # Changing the instructions should result in a different artifact
+    other = get_compiled_extractor(
+        ExtractRequest(text="chunk 1", schema=schema, instructions="Be mean.")
+    )
+    assert other is not compiled[0]
+
+    # An explicit cache key takes precedence over the content hash
+    keyed = get_compiled_extractor(requests[0], cache_key="extractor:v1")
+    assert keyed is not compiled[0]
+    assert get_compiled_extractor(requests[1], cache_key="extractor:v1") is keyed
+
+
+@patch.object(settings, "EXAMPLE_TOKEN_BUDGET", 100)
+async def test_compiled_extractor_cache_with_selected_examples() -> None:
+    """Chunks selecting the same examples share a compiled extractor."""
+    COMPILED_EXTRACTORS.clear()
+    examples = [
+        {"id": "cats", "text": "cats purr", "output": [], "token_count": 60},
+        {"id": "dogs", "text": "dogs bark", "output": [], "token_count": 60},
+    ]
+    config = {"metadata": {"extractor_cache_key": "extractor:v1"}}
+    compiled = []
+
+    async def mock_invoke_with_limits(runnable, *args, **kwargs):
+        compiled.append(runnable)
+        return {"data": []}
+
+    with patch(
+        "server.extraction_runnable.invoke_with_limits", mock_invoke_with_limits
+    ):
+        for text in ["cats sleep", "dogs run", "cats eat"]:
+            request = ExtractRequest(
+                text=text, schema={"type": "object"}, examples=examples
+            )
+            await extraction_runnable.ainvoke(request, config)
+    assert compiled[0] is compiled[2]
+    assert compiled[0] is not compiled[1]
+    assert COMPILED_EXTRACTORS.stats()["misses"] == 2
+    # Keyed by the extractor and the ids of the selected examples
+    assert "extractor:v1:cats" in COMPILED_EXTRACTORS
+    assert "extractor:v1:dogs" in COMPILED_EXTRACTORS
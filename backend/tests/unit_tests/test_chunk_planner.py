@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from server.chunk_planner import get_chunk_size
+
+MODELS = {
+    "small": {
+        "context_window": 8_000,
+        "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.0},
+    },
+    "other-tokenizer": {
+        "context_window": 8_000,
+        "tokenizer": {"encoding_name": "cl100k_base", "token_ratio": 1.25},
+    },
+}
+
+
+def test_get_chunk_size() -> None:
+    """Chunks fill the context window minus the overhead and output."""
+    with patch.dict("server.models.SUPPORTED_MODELS", MODELS), patch(
+        "server.chunk_planner.settings.OUTPUT_TOKEN_RESERVATION", 1_000
+    ):
+        assert get_chunk_size("small", 2_000) == 5_000
+        # Larger overheads (e.g., many examples) leave less room for text
+        assert get_chunk_size("small", 4_000) == 3_000
+        # Counts are converted to tokens of the encoding used for splitting
+        assert get_chunk_size("other-tokenizer", 2_000) == 4_000
+        # Unknown models fall back to a small default context window
+        assert get_chunk_size("unknown", 1_000) == 2_096
+        with patch.dict("server.chunk_planner.CHUNK_SIZES", {"small": 1_500}):
+            assert get_chunk_size("small", 2_000) == 1_500
+        with pytest.raises(HTTPException):
+            get_chunk_size("small", 7_000)
@@ -0,0 +1,83 @@
+import pytest
+import tiktoken
+from langchain.text_splitter import Tokenizer, split_text_on_tokens
+
+from extraction.chunking import (
+    IncrementalChunker,
+    TokenChunker,
+    compute_windows,
+    tokenize,
+)
+
+# A byte level encoding, so that tests do not need to download encodings.
+BYTE_ENCODING = tiktoken.Encoding(
+    name="bytes",
+    pat_str=r"\S+|\s+",
+    mergeable_ranks={bytes([idx]): idx for idx in range(256)},
+    special_tokens={},
+)
+
+
+def _split_with_langchain(text: str, chunk_size: int, chunk_overlap: int) -> list:
+    """Split a text the way langchain's TokenTextSplitter does."""
+    tokenizer = Tokenizer(
+        chunk_overlap=chunk_overlap,
+        tokens_per_chunk=chunk_size,
+        decode=BYTE_ENCODING.decode,
+        encode=BYTE_ENCODING.encode_ordinary,
+    )
+    return split_text_on_tokens(text=text, tokenizer=tokenizer)
+
+
+def test_compute_windows() -> None:
+    """Windows overlap and the last one ends with the document."""
+    assert compute_windows(10, 4, 1).tolist() == [[0, 4], [3, 7], [6, 10]]
+    assert compute_windows(3, 4, 1).tolist() == [[0, 3]]
+    assert compute_windows(4, 4, 1).tolist() == [[0, 4]]
+    assert compute_windows(0, 4, 1).tolist() == []
+    with pytest.raises(ValueError):
+        compute_windows(10, 4, 4)
+
+
+@pytest.mark.parametrize(
+    "text", ["", "short", "The quick brown fox. " * 100], ids=["empty", "short", "long"]
+)
+def test_chunker_matches_token_text_splitter(text: str) -> None:
+    """The chunker produces the same chunks as langchain's splitter."""
+    chunker = TokenChunker(BYTE_ENCODING, chunk_size=50, chunk_overlap=10)
+    chunks = chunker.split_text(text)
+    assert list(chunks) == _split_with_langchain(text, 50, 10)
+
+
+def test_chunks_are_sliced_lazily() -> None:
+    """Slicing the chunks does not decode them."""
+    chunker = TokenChunker(BYTE_ENCODING, chunk_size=4, chunk_overlap=0)
+    chunks = chunker.split_text("abcdefghij")
+    assert len(chunks) == 3
+    head = chunks[:2]
+    assert len(head) == 2
+    assert list(head) == ["abcd", "efgh"]
+    assert chunks[-1] == "ij"
+    assert chunks.num_tokens(2) == 2
+
+
+def test_tokenize_in_segments() -> None:
+    """Large texts are tokenized in segments cut after newlines."""
+    text = "line of text\n" * 100
+    tokens = tokenize(text, BYTE_ENCODING, segment_size=100)
+    assert BYTE_ENCODING.decode(tokens.tolist()) == text
+
+
+@pytest.mark.parametrize("num_pieces", [1, 3, 50])
+@pytest.mark.parametrize("text_size", [0, 9, 10, 16, 1000])
+def test_incremental_chunker(num_pieces: int, text_size: int) -> None:
+    """Feeding a text piece by piece makes the same chunks as splitting it."""
+    text = ("The quick brown fox. " * 50)[:text_size]
+    chunker = TokenChunker(BYTE_ENCODING, chunk_size=10, chunk_overlap=4)
+    incremental = IncrementalChunker(chunker)
+    piece_size = -(-len(text) // num_pieces) or 1
+    chunks = []
+    for start in range(0, len(text), piece_size):
+        chunks.extend(incremental.feed(text[start : start + piece_size]))
+    chunks.extend(incremental.finish())
+    assert chunks == list(chunker.split_text(text))
@@ -0,0 +1,93 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from server.concurrency import AdaptiveConcurrencyLimiter, is_overload_error
+
+
+class FakeAPIError(Exception):
+    """Error raised by the SDK of a provider."""
+
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"Status {status_code}")
+        self.status_code = status_code
+
+
+def test_is_overload_error() -> None:
+    """Test classification of errors returned by providers."""
+    assert is_overload_error(FakeAPIError(429))
+    assert is_overload_error(FakeAPIError(503))
+    assert is_overload_error(asyncio.TimeoutError())
+    assert not is_overload_error(FakeAPIError(400))
+    assert not is_overload_error(ValueError("Bad schema"))
+
+
+async def test_limiter_grows_and_backs_off() -> None:
+    """The limit grows additively on success and shrinks on overload."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+    for _ in range(5):
+        async with limiter.limit_concurrency():
+            pass
+    assert limiter.limit == 3
+
+    with pytest.raises(FakeAPIError):
+        async with limiter.limit_concurrency():
+            raise FakeAPIError(429)
+    assert limiter.limit == 1
+    assert limiter.stats()["overloads"] == 1
+
+    # Other errors do not change the limit
+    with pytest.raises(FakeAPIError):
+        async with limiter.limit_concurrency():
+            raise FakeAPIError(400)
+    assert limiter.limit == 1
+    assert limiter.stats()["errors"] == 1
+
+
+async def test_limiter_bounds_in_flight_calls() -> None:
+    """No more than `limit` calls should run at the same time."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+    in_flight = []
+
+    async def call() -> None:
+        async with limiter.limit_concurrency():
+            in_flight.append(limiter.stats()["in_flight"])
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[call() for _ in range(10)])
+    assert max(in_flight) == 2
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.stats()["successes"] == 10
+
+
+async def test_limiter_removes_cancelled_waiters() -> None:
+    """Waiters cancelled while queued are no longer counted as queued."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+
+    async def call() -> None:
+        async with limiter.limit_concurrency():
+            await asyncio.sleep(0.01)
+
+    running = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    waiting = [asyncio.create_task(call()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.stats()["queued"]["interactive"] == 3
+    waiting[0].cancel()
+    await asyncio.sleep(0)
+    assert limiter.stats()["queued"]["interactive"] == 2
+    await asyncio.gather(running, *waiting[1:])
+    assert limiter.stats()["in_flight"] == 0
+    assert limiter.stats()["successes"] == 3
+
+
+async def test_limiter_latency_excludes_waits() -> None:
+    """Only the time since the call started counts toward its latency."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, latency_target=5)
+    with patch("server.concurrency.time.monotonic", side_effect=[0.0, 10.0, 12.0]):
+        async with limiter.limit_concurrency() as slot:
+            # E.g., waiting for rate limits
+            slot.start()
+    assert limiter.latency_ewma == 2.0
+    assert limiter.limit == 2
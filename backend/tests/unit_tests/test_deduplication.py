@@ -1,3 +1,6 @@
+import os
+
+from server.deduplication import Deduplicator
 from server.extraction_runnable import ExtractResponse, deduplicate
 
 
@@ -52,3 +55,18 @@ async def test_deduplication_different_results() -> None:
     result = deduplicate([{"data": [1, "2"]}, {"data": ["1", "3"]}])
     expected = ExtractResponse(data=[1, "2", "1", "3"])
     assert expected == result
+
+
+def test_deduplicator_spills_to_disk() -> None:
+    """Items are still deduplicated once digests are spilled to disk."""
+    with Deduplicator(max_memory_items=3) as deduplicator:
+        items = [{"name": f"item {idx}"} for idx in range(10)]
+        assert deduplicator.filter(items) == items
+        assert len(deduplicator) == 10
+        assert deduplicator.filter([{"name": "item 1"}, {"name": "new"}]) == [
+            {"name": "new"}
+        ]
+        assert len(deduplicator) == 11
+        spill_path = deduplicator._spill_path
+        assert spill_path is not None
+    assert not os.path.exists(spill_path)
@@ -0,0 +1,59 @@
+import os
+from pathlib import Path
+from unittest.mock import patch
+
+from server.document_cache import DiskDocumentCache, get_document_cache_key
+
+
+def test_disk_document_cache(tmp_path: Path) -> None:
+    """Documents are cached as files, shared by the caches of a directory."""
+    cache = DiskDocumentCache(str(tmp_path), max_size=1024)
+    assert cache.lookup("a") is None
+    cache.update("a", ["page 1", "page 2"])
+    assert cache.lookup("a") == ["page 1", "page 2"]
+    assert DiskDocumentCache(str(tmp_path), max_size=1024).lookup("a") == [
+        "page 1",
+        "page 2",
+    ]
+    assert cache.stats() == {
+        "backend": "disk",
+        "hits": 1,
+        "misses": 1,
+        "hit_ratio": 0.5,
+        "evictions": 0,
+    }
+
+
+def test_disk_document_cache_eviction(tmp_path: Path) -> None:
+    """The least recently used documents are evicted once the cache is full."""
+    page = "a" * 100
+    cache = DiskDocumentCache(str(tmp_path), max_size=250)
+    cache.update("a", [page])
+    os.utime(tmp_path / "a.json", (0, 0))
+    cache.update("b", [page])
+    os.utime(tmp_path / "b.json", (1, 1))
+    # Looking up "a" makes "b" the least recently used document
+    assert cache.lookup("a") == [page]
+    cache.update("c", [page])
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") == [page]
+    assert cache.lookup("c") == [page]
+    assert cache.stats()["evictions"] == 1
+
+    # Documents larger than the cache are not cached
+    cache.update("d", [page * 3])
+    assert cache.lookup("d") is None
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.json", "c.json"]
+
+
+def test_document_cache_key() -> None:
+    """Keys depend on the digest of the file and on the parser version."""
+    key = get_document_cache_key("digest")
+    assert key == get_document_cache_key("digest")
+    assert key != get_document_cache_key("other")
+    with patch("server.document_cache.PARSER_VERSION", "0"):
+        assert key != get_document_cache_key("digest")
+    with patch("server.document_cache.settings.PDF_PARALLEL_PAGES", False):
+        assert key != get_document_cache_key("digest")
+    with patch("server.document_cache.HTML_PARSER", "other"):
+        assert key != get_document_cache_key("digest")
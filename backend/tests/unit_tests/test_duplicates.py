@@ -0,0 +1,28 @@
+import random
+
+from extraction.duplicates import find_duplicates, simhash
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu".split()
+
+
+def _make_text(seed: int, num_words: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+
+def test_find_exact_duplicates() -> None:
+    """Exact duplicates are found up to case and whitespace."""
+    texts = ["Page footer.", "Some content", "page   FOOTER.", "Page footer."]
+    assert find_duplicates(texts) == [None, None, 0, 0]
+
+
+def test_find_near_duplicates() -> None:
+    """Texts differing by a few words are near-duplicates."""
+    text = _make_text(0)
+    near_duplicate = text.replace("alpha", "omega", 1)
+    other = _make_text(1)
+    assert simhash(text) != simhash(near_duplicate)
+    texts = [text, other, near_duplicate]
+    assert find_duplicates(texts, threshold=0.9) == [None, None, 0]
+    # Only exact duplicates are found with a threshold of 1
+    assert find_duplicates(texts, threshold=1) == [None, None, None]
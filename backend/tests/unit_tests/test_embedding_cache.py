@@ -0,0 +1,99 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from server.embedding_cache import (
+    CachedEmbeddings,
+    EmbeddingCache,
+    InMemoryEmbeddingCache,
+    SQLiteEmbeddingCache,
+)
+from server.executors import DATABASE_EXECUTOR
+
+
+class CountingEmbeddings(Embeddings):
+    """Embed texts as their length, recording the embedded batches."""
+
+    def __init__(self) -> None:
+        self.batches: List[List[str]] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.batches.append([text])
+        return [float(len(text)), 0.0]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request: pytest.FixtureRequest, tmp_path: Path) -> EmbeddingCache:
+    """Each embedding cache backend."""
+    if request.param == "memory":
+        return InMemoryEmbeddingCache(maxsize=10)
+    return SQLiteEmbeddingCache(str(tmp_path / "cache.sqlite3"))
+
+
+def test_embedding_cache(cache: EmbeddingCache) -> None:
+    """Test the behavior shared by all the embedding cache backends."""
+    assert cache.lookup(["a", "b"]) == [None, None]
+    cache.update({"a": np.array([1.0, 2.0], dtype=np.float32)})
+    vector, missing = cache.lookup(["a", "b"])
+    assert vector.tolist() == [1.0, 2.0]
+    assert missing is None
+    assert cache.stats() == {
+        "backend": cache.name,
+        "hits": 1,
+        "misses": 3,
+        "hit_ratio": 0.25,
+        "query_hits": 0,
+        "query_misses": 0,
+    }
+
+
+def test_in_memory_embedding_cache_eviction() -> None:
+    """The least recently used vectors are evicted."""
+    cache = InMemoryEmbeddingCache(maxsize=1)
+    cache.update({"a": np.zeros(2, dtype=np.float32)})
+    cache.update({"b": np.ones(2, dtype=np.float32)})
+    assert cache.lookup(["a"]) == [None]
+    assert cache.lookup(["b"])[0].tolist() == [1.0, 1.0]
+
+
+def test_sqlite_embedding_cache_persists(tmp_path: Path) -> None:
+    """Vectors are kept across connections to the same file, as float32."""
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteEmbeddingCache(path).update({"a": np.array([0.5, 2.0])})
+    (vector,) = SQLiteEmbeddingCache(path).lookup(["a"])
+    assert vector.dtype == np.float32
+    assert vector.tolist() == [0.5, 2.0]
+
+
+async def test_cached_embeddings(cache: EmbeddingCache) -> None:
+    """Only the texts missing from the cache are embedded, in a single batch."""
+    embeddings = CountingEmbeddings()
+    cached = CachedEmbeddings(embeddings, cache)
+    completed = DATABASE_EXECUTOR.stats()["completed"]
+    assert await cached.aembed_documents(["a", "bb", "a"]) == [
+        [1.0, 1.0],
+        [2.0, 1.0],
+        [1.0, 1.0],
+    ]
+    assert cached.embed_documents(["bb", "ccc"]) == [[2.0, 1.0], [3.0, 1.0]]
+    assert embeddings.batches == [["a", "bb"], ["ccc"]]
+
+    # Queries are cached separately from documents
+    assert await cached.aembed_query("a") == [1.0, 0.0]
+    assert cached.embed_query("a") == [1.0, 0.0]
+    assert embeddings.batches[2:] == [["a"]]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 4)
+    assert (stats["query_hits"], stats["query_misses"]) == (1, 1)
+
+    # The async calls only query the blocking backends in the database pool:
+    # 2 lookups and 2 updates
+    num_queries = 4 if cache.blocking else 0
+    assert DATABASE_EXECUTOR.stats()["completed"] - completed == num_queries
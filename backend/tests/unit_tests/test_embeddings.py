@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from extraction.embeddings import HashingEmbeddings, hash_ngrams
+from server.models import get_embeddings
+
+
+def test_hash_ngrams() -> None:
+    """N-grams are counted per text, without crossing the end of a text."""
+    counts = hash_ngrams(["abcd", "", "ab"], num_features=64, ngram_range=(3, 4))
+    assert counts.shape == (3, 64)
+    # "abc", "bcd" and "abcd"
+    assert np.abs(counts[0]).sum() == 3
+    assert not counts[1].any()
+    assert not counts[2].any()
+
+
+def test_hashing_embeddings() -> None:
+    """Texts sharing n-grams are embedded close to each other."""
+    embeddings = HashingEmbeddings(num_features=256)
+    texts = [
+        "The cat sat on the mat.",
+        "the CAT sat on a mat",
+        "Quarterly revenue grew by ten percent.",
+    ]
+    vectors = np.array(embeddings.embed_documents(texts))
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+    similarities = vectors @ vectors.T
+    assert similarities[0, 1] > 0.5
+    assert similarities[0, 1] > similarities[0, 2]
+    # Texts are embedded independently of their batch
+    assert np.allclose(embeddings.embed_query(texts[2]), vectors[2])
+    assert embeddings.embed_documents([]) == []
+
+
+def test_get_embeddings() -> None:
+    assert isinstance(get_embeddings("local-hashing"), HashingEmbeddings)
+    with pytest.raises(ValueError):
+        get_embeddings("unknown")
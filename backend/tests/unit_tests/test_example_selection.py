@@ -0,0 +1,88 @@
+from typing import List
+from unittest.mock import patch
+
+from langchain_core.embeddings import Embeddings
+
+from server.embedding_cache import InMemoryEmbeddingCache
+from server.example_selection import select_examples, select_largest_examples
+from server.extraction_runnable import ExtractionExample
+
+
+def _make_example(text: str, token_count: int = 100) -> ExtractionExample:
+    return ExtractionExample(text=text, output=[{"name": "x"}], token_count=token_count)
+
+
+class WordEmbeddings(Embeddings):
+    """Embed texts as whether they contain words, recording the embedded texts."""
+
+    def __init__(self, model: str, words: List[str]) -> None:
+        self.model = model
+        self.words = words
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(word in text) for word in self.words]
+
+
+async def test_select_examples_under_budget() -> None:
+    """The most similar examples that fit in the budget are kept in order."""
+    examples = [
+        _make_example("The invoice total is 100 dollars."),
+        _make_example("Alice met Bob in Paris."),
+        _make_example("Bob was born in London."),
+        _make_example("Carol works at Acme."),
+    ]
+    selected = await select_examples(
+        examples, "Where was Bob born?", max_tokens=250, method="lexical"
+    )
+    assert selected == [examples[1], examples[2]]
+    # All examples are kept when they fit in the budget
+    assert await select_examples(examples, "", max_tokens=400) == examples
+    assert await select_examples(examples, "", max_tokens=0, method="all") == examples
+
+
+async def test_select_examples_estimates_missing_token_counts() -> None:
+    """Examples without a stored token count are estimated."""
+    examples = [
+        ExtractionExample(text="short", output=[]),
+        ExtractionExample(text="long " * 1000, output=[]),
+    ]
+    selected = await select_examples(
+        examples, "long text", max_tokens=100, method="lexical"
+    )
+    assert selected == [examples[0]]
+
+
+async def test_select_examples_by_embeddings() -> None:
+    """Embeddings of examples are cached per embedding model."""
+    examples = [_make_example("Alice met Bob."), _make_example("Carol works.")]
+    bob = WordEmbeddings("bob", ["Bob"])
+    carol = WordEmbeddings("carol", ["Carol"])
+    with patch("server.embedding_cache.EMBEDDING_CACHE", InMemoryEmbeddingCache(10)):
+        for _ in range(2):
+            selected = await select_examples(
+                examples, "Bob", max_tokens=100, method="embeddings", embeddings=bob
+            )
+            assert selected == [examples[0]]
+        selected = await select_examples(
+            examples, "Carol", max_tokens=100, method="embeddings", embeddings=carol
+        )
+        assert selected == [examples[1]]
+    assert bob.embedded == carol.embedded == [example.text for example in examples]
+
+
+def test_select_largest_examples() -> None:
+    """The examples taking the most tokens under the budget are selected."""
+    examples = [
+        _make_example("a", token_count=60),
+        _make_example("b", token_count=50),
+        _make_example("c", token_count=50),
+    ]
+    # Selecting the first examples that fit would only take 60 tokens
+    assert select_largest_examples(examples, max_tokens=100) == examples[1:]
+    assert select_largest_examples(examples, max_tokens=200) == examples
+    assert select_largest_examples(examples, max_tokens=40) == []
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from unittest.mock import patch
+
+from langchain.document_loaders import Blob
+
+from server.executors import BoundedExecutor, parse_blob_in_executor
+from tests.unit_tests.fixtures import get_sample_paths
+
+
+async def test_bounded_executor() -> None:
+    """At most max_workers calls run at once, the others are queued."""
+    executor = BoundedExecutor("test", kind="thread", max_workers=2)
+    release = threading.Event()
+    tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    stats = executor.stats()
+    assert stats["running"] == 2
+    assert stats["queued"] == 3
+
+    # A cancelled call leaves the queue
+    tasks[-1].cancel()
+    await asyncio.sleep(0)
+    assert executor.stats()["queued"] == 2
+
+    release.set()
+    assert await asyncio.gather(*tasks[:-1]) == [True] * 4
+    await asyncio.sleep(0.05)
+    assert executor.stats() == {
+        "kind": "thread",
+        "max_workers": 2,
+        "running": 0,
+        "queued": 0,
+        "completed": 4,
+        "errors": 0,
+    }
+
+
+async def test_bounded_executor_errors() -> None:
+    """Errors are raised to the caller."""
+    executor = BoundedExecutor("test", kind="thread", max_workers=1)
+    try:
+        await executor.run(int, "not a number")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected a ValueError")
+    await asyncio.sleep(0.05)
+    assert executor.stats()["errors"] == 1
+    assert await executor.run(int, "1") == 1
+
+
+async def test_parse_pdf_in_process() -> None:
+    """PDFs are parsed in a pool of processes."""
+    executor = BoundedExecutor("test", kind="process", max_workers=1)
+    (path,) = [path for path in get_sample_paths() if path.suffix == ".pdf"]
+    blob = Blob.from_data(
+        path.read_bytes(), path=path.name, mime_type="application/pdf"
+    )
+    with patch("server.executors.PDF_PARSING_EXECUTOR", executor):
+        documents = await parse_blob_in_executor(blob)
+    assert "LangChain" in documents[0].page_content
+    assert executor.stats()["completed"] == 1
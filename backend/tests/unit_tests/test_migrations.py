@@ -0,0 +1,19 @@
+from sqlalchemy import text
+
+from db.models import Base
+from scripts.run_migrations import add_missing_columns
+from tests.db import engine
+
+
+def test_add_missing_columns() -> None:
+    """Columns added to the models are added to existing tables."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE examples DROP COLUMN token_count"))
+        connection.execute(text("ALTER TABLE job_chunks DROP COLUMN attempts"))
+    assert sorted(add_missing_columns(engine)) == [
+        "examples.token_count",
+        "job_chunks.attempts",
+    ]
+    assert add_missing_columns(engine) == []
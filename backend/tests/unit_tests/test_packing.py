@@ -0,0 +1,126 @@
+import re
+from typing import Any, Dict, List
+from unittest.mock import patch
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+
+from server.extraction_runnable import CompiledExtractor, ExtractRequest
+from server.packing import pack_texts, packing_extraction_runnable
+from tests.db import get_async_client
+
+CALLS: List[str] = []
+
+
+def mock_packed_runnable(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the first word of each text, ignoring texts saying "skip"."""
+    CALLS.append("packed")
+    texts = re.findall(r'<text id="(\d+)">\n(.*?)\n</text>', inputs["texts"])
+    parsed = {
+        "results": [
+            {"id": int(idx), "data": [text.split()[0]]}
+            for idx, text in texts
+            if "skip" not in text
+        ]
+    }
+    return {"raw": AIMessage(content=""), "parsed": parsed, "parsing_error": None}
+
+
+def mock_invalid_packed_runnable(inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Fail to parse the packed output."""
+    CALLS.append("packed")
+    return {
+        "raw": AIMessage(content=""),
+        "parsed": None,
+        "parsing_error": OutputParserException("Invalid JSON."),
+    }
+
+
+def mock_extraction_runnable(extract_request: ExtractRequest) -> Dict[str, Any]:
+    CALLS.append("single")
+    return {"data": [extract_request.text.split()[0]]}
+
+
+def mock_get_packed_extractor(*args: Any, **kwargs: Any) -> CompiledExtractor:
+    return CompiledExtractor(
+        schema={},
+        prompt=None,
+        runnable=RunnableLambda(mock_packed_runnable),
+        prompt_overhead_tokens=100,
+    )
+
+
+def test_pack_texts() -> None:
+    """Texts are packed in order up to the max tokens and max inputs."""
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400, "e"]
+    # Each text is counted with the tokens of its tags
+    assert pack_texts(texts, max_tokens=100, max_inputs=10) == [[0, 1, 2], [3], [4]]
+    assert pack_texts(texts, max_tokens=1000, max_inputs=2) == [[0, 1], [2, 3], [4]]
+
+
+@patch("server.packing.get_packed_extractor", mock_get_packed_extractor)
+@patch("server.packing.extraction_runnable", RunnableLambda(mock_extraction_runnable))
+async def test_packing_extraction_runnable() -> None:
+    """Short texts are extracted together, and the results split per text."""
+    CALLS.clear()
+    requests = [
+        ExtractRequest(text=text, schema={"type": "object"})
+        for text in ["first text", "second text", "skip this", "last text"]
+    ]
+    responses = await packing_extraction_runnable.abatch(requests)
+    assert responses == [
+        {"data": ["first"]},
+        {"data": ["second"]},
+        # Texts missing from the packed results have nothing to extract
+        {"data": []},
+        {"data": ["last"]},
+    ]
+    assert CALLS == ["packed"]
+
+
+@patch("server.packing.extraction_runnable", RunnableLambda(mock_extraction_runnable))
+async def test_packing_falls_back_on_invalid_output() -> None:
+    """Texts are extracted on their own when the packed output is invalid."""
+    CALLS.clear()
+    requests = [
+        ExtractRequest(text=text, schema={"type": "object"})
+        for text in ["first text", "second text"]
+    ]
+    invalid_extractor = mock_get_packed_extractor()._replace(
+        runnable=RunnableLambda(mock_invalid_packed_runnable)
+    )
+    with patch("server.packing.get_packed_extractor", return_value=invalid_extractor):
+        responses = await packing_extraction_runnable.abatch(requests)
+    assert responses == [{"data": ["first"]}, {"data": ["second"]}]
+    assert CALLS == ["packed", "single", "single"]
+
+    # Malformed results are dropped without extracting the texts on their own
+    CALLS.clear()
+    malformed = {"results": [{"id": 0, "data": "first"}, "second", {"id": 1}]}
+    with patch("server.packing.invoke_with_limits", return_value=malformed), patch(
+        "server.packing.get_packed_extractor", mock_get_packed_extractor
+    ):
+        responses = await packing_extraction_runnable.abatch(requests)
+    assert responses == [{"data": []}, {"data": []}]
+    assert CALLS == []
+
+
+@patch("server.packing.get_packed_extractor", mock_get_packed_extractor)
+@patch("server.packing.extraction_runnable", RunnableLambda(mock_extraction_runnable))
+async def test_batch_endpoint_packs_texts() -> None:
+    """The batch endpoint packs the texts of a batch."""
+    CALLS.clear()
+    async with get_async_client() as client:
+        response = await client.post(
+            "/extract_text/batch",
+            json={
+                "inputs": [
+                    {"text": f"text {idx}", "schema": {"type": "object"}}
+                    for idx in range(5)
+                ]
+            },
+        )
+    assert response.status_code == 200, response.text
+    assert response.json()["output"] == [{"data": ["text"]}] * 5
+    assert CALLS == ["packed"]
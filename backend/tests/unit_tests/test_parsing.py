@@ -1,12 +1,18 @@
 """Test parsing logic."""
 import mimetypes
+from concurrent.futures import ThreadPoolExecutor
 
 from langchain.document_loaders import Blob
+from langchain.document_loaders.parsers import PDFMinerParser
 
+from extraction.html import LxmlHTMLParser
 from extraction.parsing import (
     MIMETYPE_BASED_PARSER,
     SUPPORTED_MIMETYPES,
 )
+from extraction.pdf import ParallelPDFParser, extract_page_texts, split_page_ranges
+from scripts.benchmark_html_parsing import make_html_page
+from scripts.benchmark_pdf_parsing import make_pdf
 from tests.unit_tests.fixtures import get_sample_paths
 
 
@@ -44,3 +50,112 @@ def test_attempt_to_parse_each_fixture() -> None:
 
     known_missing = {"application/msword"}
     assert set(SUPPORTED_MIMETYPES) - known_missing == seen_mimetypes
+
+
+def test_split_page_ranges() -> None:
+    """Pages are split into contiguous ranges of similar sizes."""
+    assert split_page_ranges(0, 4) == []
+    assert split_page_ranges(10, 4) == [
+        range(0, 3),
+        range(3, 6),
+        range(6, 9),
+        range(9, 10),
+    ]
+    assert split_page_ranges(10, 4, min_pages_per_range=4) == [
+        range(0, 5),
+        range(5, 10),
+    ]
+    assert split_page_ranges(3, 4, min_pages_per_range=8) == [range(0, 3)]
+
+
+def test_parallel_pdf_parser() -> None:
+    """Ranges of pages are parsed concurrently and reassembled in order."""
+    data = make_pdf(5)
+    blob = Blob.from_data(data, path="sample.pdf")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        parser = ParallelPDFParser(executor, max_workers=2, min_pages_per_range=1)
+        documents = parser.parse(blob)
+    assert [document.metadata for document in documents] == [
+        {"source": "sample.pdf", "page": page} for page in range(5)
+    ]
+    assert [document.page_content for document in documents] == [
+        extract_page_texts(data, range(page, page + 1))[0] for page in range(5)
+    ]
+    # The same text as parsing the PDF at once
+    (document,) = PDFMinerParser().parse(blob)
+    assert (
+        document.page_content
+        == "\f".join(document.page_content for document in documents) + "\f"
+    )
+
+
+def test_lxml_html_parser() -> None:
+    """The main text of pages is parsed, without boilerplate."""
+    html = """<html><head><title>The  title</title><meta charset="iso-8859-1">
+    <script>var tracking = true;</script></head><body>
+    <div id="cookie-banner">We use cookies. <a href="/ok">Accept</a></div>
+    <nav><a href="/">Home</a></nav>
+    <div><ul><li><a href="/a">About</a></li><li><a href="/b">Blog</a></li></ul></div>
+    <article><h1>Caf\u00e9</h1><p>First   paragraph with a <a href="/c">link</a>.</p>
+    <p>Second<br>paragraph</p><ul><li><a href="/d">Only a link</a></li></ul>
+    <table><tr><td>A</td><td>B</td></tr></table></article>
+    <footer>Copyright</footer></body></html>"""
+    blob = Blob.from_data(html.encode("iso-8859-1"), path="page.html")
+    (document,) = LxmlHTMLParser().parse(blob)
+    assert document.metadata == {"source": "page.html", "title": "The title"}
+    assert document.page_content == (
+        "# Caf\u00e9\n\nFirst paragraph with a link.\n\nSecond paragraph\n\nA B"
+    )
+
+    # Pages not declaring their charset are decoded as the blob
+    blob = Blob.from_data("<p>Caf\u00e9 \U0001f99c</p>".encode(), path="page.html")
+    (document,) = LxmlHTMLParser().parse(blob)
+    assert document.page_content == "Caf\u00e9 \U0001f99c"
+
+    (document,) = LxmlHTMLParser().parse(Blob.from_data(b"", path="empty.html"))
+    assert document.page_content == ""
+
+
+def test_lxml_html_parser_drops_boilerplate() -> None:
+    """Only the article of synthetic scraped pages is parsed."""
+    blob = Blob.from_data(make_html_page(20), path="page.html")
+    (document,) = LxmlHTMLParser().parse(blob)
+    blocks = document.page_content.split("\n\n")
+    # The logo of the header, the title and headings of the article
+    assert blocks[0] == "Site"
+    assert blocks[1].startswith("# ")
+    assert sum(block.startswith("## ") for block in blocks) == 2
+    assert len(blocks) == 2 + 2 + 20
+    assert "cookies" not in document.page_content
+    assert "Copyright" not in document.page_content
+
+
+def test_lxml_html_parser_keeps_content() -> None:
+    """Content is kept whatever the classes of the elements holding it."""
+    html = """<html><head><title>Post</title></head>
+    <body class="post-template has-sidebar">
+    <svg><title>Search icon</title></svg>
+    <article class="post comments-open"><div id="content" class="menu-open">
+    <p>Some content.</p><p><a href="/report">Read the full report</a></p>
+    <div class="sidebar"><a href="/a">Boilerplate</a></div>
+    </div></article></body></html>"""
+    (document,) = LxmlHTMLParser().parse(
+        Blob.from_data(html.encode(), path="page.html")
+    )
+    assert document.page_content == "Some content.\n\nRead the full report"
+    assert document.metadata["title"] == "Post"
+
+
+def test_lxml_html_parser_drops_link_lists() -> None:
+    """Lists and containers of several links are dropped, single links are not."""
+    html = """<html><body>
+    <ul>
+    <li><a href="/a">Home</a></li><li>More news on <a href="/b">the blog</a></li>
+    </ul>
+    <div><a href="/c">One</a> <a href="/d">Two</a> <a href="/e">Three</a></div>
+    <div><a href="/f">Only link</a></div>
+    </body></html>"""
+    (document,) = LxmlHTMLParser().parse(
+        Blob.from_data(html.encode(), path="page.html")
+    )
+    assert document.page_content == "More news on the blog\n\nOnly link"
@@ -0,0 +1,51 @@
+import asyncio
+from typing import AsyncIterator, List
+
+import pytest
+
+from extraction.chunking import TokenChunker
+from server.pipeline import buffered, chunk_pages
+from tests.unit_tests.test_chunking import BYTE_ENCODING
+
+
+async def _iterate(items: List[str], produced: List[str]) -> AsyncIterator[str]:
+    for item in items:
+        produced.append(item)
+        yield item
+        await asyncio.sleep(0)
+
+
+async def test_buffered() -> None:
+    """Items are produced ahead of the consumer, up to the buffer size."""
+    produced: List[str] = []
+    items = [str(idx) for idx in range(10)]
+    iterator = buffered(_iterate(items, produced), 2)
+    assert await iterator.__anext__() == "0"
+    await asyncio.sleep(0.01)
+    # 2 items in the buffer and 1 waiting for room
+    assert produced == ["0", "1", "2", "3"]
+    assert [item async for item in iterator] == items[1:]
+
+
+async def test_buffered_errors() -> None:
+    """Errors of the source are raised to the consumer."""
+
+    async def _fail() -> AsyncIterator[str]:
+        yield "a"
+        raise ValueError("Failed to parse.")
+
+    iterator = buffered(_fail(), 2)
+    assert await iterator.__anext__() == "a"
+    with pytest.raises(ValueError):
+        await iterator.__anext__()
+
+
+async def test_chunk_pages() -> None:
+    """Pages are joined with newlines and split into chunks as they come."""
+    pages = ["The quick brown fox.", "", "Jumps over the lazy dog. " * 3]
+    text_splitter = TokenChunker(BYTE_ENCODING, chunk_size=16, chunk_overlap=4)
+    produced: List[str] = []
+    chunks = [
+        chunk async for chunk in chunk_pages(_iterate(pages, produced), text_splitter)
+    ]
+    assert chunks == list(text_splitter.split_text("\n".join(pages)))
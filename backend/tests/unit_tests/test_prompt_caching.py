@@ -0,0 +1,50 @@
+from langchain_core.messages import AIMessage
+
+from server.prompt_caching import PromptCacheTracker, PromptUsage, get_prompt_usage
+
+
+def test_get_prompt_usage() -> None:
+    """Cached prompt tokens are read from the usage metadata of providers."""
+    openai_message = AIMessage(
+        content="",
+        response_metadata={
+            "token_usage": {
+                "prompt_tokens": 2000,
+                "completion_tokens": 10,
+                "prompt_tokens_details": {"cached_tokens": 1536},
+            }
+        },
+    )
+    assert get_prompt_usage(openai_message) == PromptUsage(2000, 1536)
+    anthropic_message = AIMessage(
+        content="",
+        response_metadata={
+            "usage": {
+                "input_tokens": 100,
+                "cache_creation_input_tokens": 0,
+                "cache_read_input_tokens": 1900,
+                "output_tokens": 10,
+            }
+        },
+    )
+    assert get_prompt_usage(anthropic_message) == PromptUsage(2000, 1900)
+    assert get_prompt_usage(AIMessage(content="")) is None
+
+
+def test_prompt_cache_tracker() -> None:
+    """Usage is aggregated per extractor, keeping the most recent extractors."""
+    tracker = PromptCacheTracker(maxsize=2)
+    tracker.record("a", PromptUsage(1000, 0), latency=2.0)
+    tracker.record("a", PromptUsage(1000, 800), latency=1.0)
+    assert tracker.stats()["a"] == {
+        "calls": 2,
+        "cached_calls": 1,
+        "prompt_tokens": 2000,
+        "cached_prompt_tokens": 800,
+        "cached_ratio": 0.4,
+        "average_latency": 1.5,
+        "average_cached_latency": 1.0,
+    }
+    tracker.record("b", PromptUsage(10, 0), latency=1.0)
+    tracker.record("c", PromptUsage(10, 0), latency=1.0)
+    assert sorted(tracker.stats()) == ["b", "c"]
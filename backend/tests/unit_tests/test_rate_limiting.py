@@ -0,0 +1,48 @@
+import asyncio
+from unittest.mock import patch
+
+from server.models import get_rate_limits
+from server.rate_limiting import RateLimiter
+
+
+def test_get_rate_limits() -> None:
+    """Rate limits are read per provider from the environment."""
+    with patch.dict(
+        "os.environ",
+        {"ACME_REQUESTS_PER_MINUTE": "60", "ACME_TOKENS_PER_MINUTE": "0"},
+    ):
+        assert get_rate_limits("ACME") == {
+            "requests_per_minute": 60,
+            "tokens_per_minute": None,
+        }
+
+
+async def test_rate_limiter_waits_for_capacity() -> None:
+    """Callers wait for capacity instead of failing."""
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=6_000)
+    # A full minute of capacity is available initially
+    await asyncio.wait_for(limiter.acquire(5_000), timeout=0.1)
+    assert limiter.stats()["waiting"] == 0
+
+    sleeps = []
+
+    async def fake_sleep(delay: float) -> None:
+        sleeps.append(delay)
+
+    with patch("server.rate_limiting.asyncio.sleep", fake_sleep):
+        # Needs 1000 tokens more than available, refilled at 100 tokens / second.
+        await limiter.acquire(2_000)
+    assert len(sleeps) == 1
+    assert 9 < sleeps[0] <= 10
+
+    # Refunded tokens pay back the debt
+    limiter.refund(2_000)
+    assert limiter.stats()["available_tokens"] > 0
+
+
+async def test_unlimited_rate_limiter() -> None:
+    """Without limits, acquiring never waits."""
+    limiter = RateLimiter()
+    for _ in range(100):
+        await asyncio.wait_for(limiter.acquire(100_000), timeout=0.1)
+    assert limiter.stats()["available_tokens"] is None
@@ -0,0 +1,99 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from db.models import Base
+from server.executors import DATABASE_EXECUTOR
+from server.extraction_runnable import ExtractRequest, extract_with_cache
+from server.result_cache import (
+    InMemoryResultCache,
+    PostgresResultCache,
+    ResultCache,
+    SQLiteResultCache,
+)
+from tests.db import TestingSession, engine
+
+
+def _check_result_cache(cache: ResultCache) -> None:
+    """Verify the behavior shared by all the result cache backends."""
+    assert cache.lookup("key") is None
+    cache.update("key", {"data": [{"name": "Chester"}]}, 100)
+    assert cache.lookup("key") == {"data": [{"name": "Chester"}]}
+    cache.update("key", {"data": []}, 50)
+    assert cache.lookup("key") == {"data": []}
+    assert cache.stats() == {
+        "backend": cache.name,
+        "hits": 2,
+        "misses": 1,
+        "hit_ratio": 2 / 3,
+        "saved_tokens": 150,
+    }
+
+
+def test_in_memory_result_cache() -> None:
+    """Test the in-memory result cache."""
+    _check_result_cache(InMemoryResultCache(maxsize=10))
+
+    cache = InMemoryResultCache(maxsize=10, ttl=10)
+    cache.update("key", {"data": []}, 1)
+    with patch("server.caching.time.monotonic", return_value=float("inf")):
+        assert cache.lookup("key") is None
+
+
+def test_sqlite_result_cache(tmp_path: Path) -> None:
+    """Test the sqlite result cache."""
+    _check_result_cache(SQLiteResultCache(str(tmp_path / "cache.sqlite3")))
+
+    cache = SQLiteResultCache(str(tmp_path / "cache.sqlite3"), ttl=10)
+    with patch("server.result_cache.time.time", return_value=0):
+        cache.update("key", {"data": []}, 1)
+    assert cache.lookup("key") is None
+
+
+def test_postgres_result_cache() -> None:
+    """Test the postgres result cache."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    _check_result_cache(PostgresResultCache(TestingSession))
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+async def test_extract_with_cache(backend: str, tmp_path: Path) -> None:
+    """Only chunks that are not cached yet should be sent to the model."""
+    seen_texts = []
+
+    def mock_extraction_runnable(extract_request: ExtractRequest) -> dict:
+        seen_texts.append(extract_request.text)
+        return {"data": [extract_request.text.upper()]}
+
+    cache: ResultCache
+    if backend == "memory":
+        cache = InMemoryResultCache(maxsize=10)
+    else:
+        cache = SQLiteResultCache(str(tmp_path / "cache.sqlite3"))
+    completed = DATABASE_EXECUTOR.stats()["completed"]
+    schema = {"type": "object"}
+    with patch("server.extraction_runnable.RESULT_CACHE", cache), patch(
+        "server.extraction_runnable.extraction_runnable",
+        RunnableLambda(mock_extraction_runnable),
+    ):
+        requests = [ExtractRequest(text=text, schema=schema) for text in "ab"]
+        assert await extract_with_cache(requests) == [
+            {"data": ["A"]},
+            {"data": ["B"]},
+        ]
+        requests = [ExtractRequest(text=text, schema=schema) for text in "bca"]
+        assert await extract_with_cache(requests) == [
+            {"data": ["B"]},
+            {"data": ["C"]},
+            {"data": ["A"]},
+        ]
+    assert seen_texts == ["a", "b", "c"]
+    # Only the blocking backends are queried in the database pool: 5 lookups
+    # and 3 updates
+    num_queries = 8 if cache.blocking else 0
+    assert DATABASE_EXECUTOR.stats()["completed"] - completed == num_queries
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["saved_tokens"] > 0
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import numpy as np
+
+from extraction.bm25 import BM25Index
+from extraction.embeddings import HashingEmbeddings
+from server.retrieval import retrieve_chunks
+
+CHUNKS = [
+    "The weather was sunny all week.",
+    "Alice Smith joined the company as a software engineer.",
+    "Quarterly revenue grew by ten percent.",
+    "Bob Jones, an engineer, left the company.",
+    "The office moved to a new building.",
+]
+
+
+def test_bm25_index() -> None:
+    """Texts are ranked by the terms they share with the query."""
+    index = BM25Index(CHUNKS)
+    scores = index.score("Engineers of the company")
+    assert scores.shape == (5,)
+    assert scores[1] > 0 and scores[3] > 0
+    assert scores[2] == 0
+    # Rare terms weigh more than common ones
+    assert index.score("revenue")[2] > index.score("the")[0]
+    assert not index.score("unknown words").any()
+    assert not BM25Index([]).score("anything").any()
+
+
+async def test_retrieve_chunks() -> None:
+    """The best chunks are retrieved in document order."""
+    query = "engineer company"
+    assert await retrieve_chunks(query, CHUNKS, top_k=2, rerank=False) == [1, 3]
+    assert await retrieve_chunks(query, CHUNKS, top_k=0, rerank=False) == []
+    # Chunks scoring less than half the best score are dropped
+    assert await retrieve_chunks(
+        "engineer revenue company", CHUNKS, top_k=5, min_bm25_score=0.5, rerank=False
+    ) == [1, 2, 3]
+
+
+@patch("server.retrieval.get_embeddings", lambda name: HashingEmbeddings())
+async def test_retrieve_chunks_reranked() -> None:
+    """The BM25 candidates are re-scored with embeddings."""
+    query = "software engineer"
+    retrieved = await retrieve_chunks(query, CHUNKS, top_k=1)
+    assert retrieved == [1]
+    # Only the chunks similar enough to the query are kept
+    assert await retrieve_chunks(query, CHUNKS, top_k=5, min_similarity=1.0) == []
+    # Without a matching term, every chunk is ranked with embeddings
+    retrieved = await retrieve_chunks("revenues", CHUNKS, top_k=1)
+    assert retrieved == [2]
+    assert np.all(BM25Index(CHUNKS).score("revenues") == 0)
@@ -0,0 +1,88 @@
+import asyncio
+from typing import List
+
+from server.concurrency import AdaptiveConcurrencyLimiter
+from server.scheduler import FairQueue, get_priority, get_scheduling_info
+
+
+def test_fair_queue_interleaves_owners() -> None:
+    """A large submission should not delay other owners until it completes."""
+    queue = FairQueue()
+    for idx in range(5):
+        queue.push(f"alice-{idx}", owner="alice", priority="interactive", cost=100)
+    queue.push("bob-0", owner="bob", priority="interactive", cost=100)
+    queue.push("bob-1", owner="bob", priority="interactive", cost=100)
+    assert queue.sizes() == {"interactive": 7, "bulk": 0}
+    popped = [queue.pop() for _ in range(4)]
+    assert popped == ["alice-0", "bob-0", "alice-1", "bob-1"]
+
+
+def test_fair_queue_favors_interactive() -> None:
+    """Interactive items are weighted more heavily than bulk items."""
+    queue = FairQueue()
+    for idx in range(10):
+        queue.push(f"bulk-{idx}", owner="alice", priority="bulk", cost=100)
+    queue.push("interactive", owner="alice", priority="interactive", cost=100)
+    assert queue.pop() == "interactive"
+    assert len(queue) == 10
+
+
+def test_fair_queue_remove() -> None:
+    """Removed items are no longer queued nor counted."""
+    queue = FairQueue()
+    bulk = [object() for _ in range(3)]
+    interactive = object()
+    for item in bulk:
+        queue.push(item, owner="alice", priority="bulk", cost=100)
+    queue.push(interactive, owner="bob", priority="interactive", cost=100)
+    assert queue.remove(bulk[1])
+    assert not queue.remove(bulk[1])
+    assert queue.remove(interactive)
+    assert queue.sizes() == {"interactive": 0, "bulk": 2}
+    assert [queue.pop() for _ in range(len(queue))] == [bulk[0], bulk[2]]
+
+
+def test_get_scheduling_info() -> None:
+    """Test reading the owner and priority from a run config."""
+    assert get_scheduling_info(None) == ("anonymous", "interactive")
+    assert get_scheduling_info(
+        {"configurable": {"owner_id": "alice", "priority": "bulk"}}
+    ) == ("alice", "bulk")
+    assert get_priority(1) == "interactive"
+    assert get_priority(10_000) == "bulk"
+
+
+async def test_limiter_admits_owners_fairly() -> None:
+    """Waiting calls are admitted in fair order across owners."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    order: List[str] = []
+
+    async def call(owner: str, name: str) -> None:
+        async with limiter.limit_concurrency(owner=owner, cost=10):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    tasks = [asyncio.create_task(call("alice", f"alice-{idx}")) for idx in range(4)]
+    tasks.append(asyncio.create_task(call("bob", "bob-0")))
+    await asyncio.gather(*tasks)
+    assert order.index("bob-0") <= 2
+
+
+async def test_limiter_skips_cancelled_waiters() -> None:
+    """Cancelled waiters should not hold on to slots."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+    release = asyncio.Event()
+
+    async def call() -> None:
+        async with limiter.limit_concurrency():
+            await release.wait()
+
+    first = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    waiting = asyncio.create_task(call())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    release.set()
+    await first
+    await asyncio.wait_for(call(), timeout=1)
+    assert limiter.stats()["in_flight"] == 0
@@ -1,4 +1,14 @@
-from extraction.parsing import _guess_mimetype
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+from extraction.parsing import _guess_mimetype, spool_binary_input
+from extraction.pdf import count_pages, extract_page_texts, get_pdf_source
 from tests.unit_tests.fixtures import get_sample_paths
 
 
@@ -20,3 +30,53 @@ async def test_mimetype_guessing() -> None:
         "sample.rtf": "text/rtf",
         "sample.txt": "text/plain",
     } == name_to_mime
+
+
+def test_spool_binary_input() -> None:
+    """Uploads are copied to a temporary file parsed from disk."""
+    path = next(path for path in get_sample_paths() if path.suffix == ".pdf")
+    with path.open("rb") as file:
+        blob = spool_binary_input(file)
+    try:
+        assert blob.data is None
+        assert blob.mimetype == "application/pdf"
+        assert Path(blob.path).read_bytes() == path.read_bytes()
+        assert blob.metadata["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+        # PDFs read from files are memory-mapped
+        source = get_pdf_source(blob)
+        assert source == str(blob.path)
+        assert count_pages(source) == 1
+        assert "LangChain" in extract_page_texts(source, range(1))[0]
+    finally:
+        os.remove(blob.path)
+
+
+@pytest.mark.parametrize("max_size", [1, 1024 * 1024])
+def test_spool_binary_input_spooled(max_size: int) -> None:
+    """Uploads are copied to disk whether they were spooled to disk or not."""
+    path = next(path for path in get_sample_paths() if path.suffix == ".pdf")
+    with tempfile.SpooledTemporaryFile(max_size) as file:
+        file.write(path.read_bytes())
+        file.seek(0)
+        blob = spool_binary_input(file)
+    try:
+        assert blob.mimetype == "application/pdf"
+        assert Path(blob.path).read_bytes() == path.read_bytes()
+        assert blob.metadata["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+    finally:
+        os.remove(blob.path)
+
+
+def test_spool_binary_input_too_large() -> None:
+    """Streams are rejected as soon as their byte count is too large."""
+    path = next(path for path in get_sample_paths() if path.suffix == ".rtf")
+    with path.open("rb") as file, patch(
+        "extraction.parsing._get_file_size_in_mb", return_value=0
+    ), patch("extraction.parsing.MAX_FILE_SIZE_MB", 1), patch(
+        "extraction.parsing.os.remove", wraps=os.remove
+    ) as remove:
+        with pytest.raises(HTTPException) as error:
+            spool_binary_input(file)
+    assert error.value.status_code == 413
+    (removed,) = remove.call_args.args
+    assert not os.path.exists(removed)
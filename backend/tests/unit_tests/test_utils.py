@@ -101,3 +101,22 @@ def test_make_prompt_template() -> None:
 
     prompt = _make_prompt_template(None, examples, "name")
     assert 5 == len(prompt.messages)
+
+
+def test_make_prompt_template_is_deterministic() -> None:
+    """The same examples are rendered identically, so prompts can be cached."""
+    examples = [
+        ExtractionExample(id="example-1", text="Test text.", output=[{"age": 0}]),
+        ExtractionExample(text="Other text.", output=[{"age": 1}]),
+    ]
+    first = _make_prompt_template("Test instructions.", examples, "name")
+    second = _make_prompt_template("Test instructions.", examples, "name")
+    assert first.format_messages(text="chunk") == second.format_messages(text="chunk")
+    tool_call_ids = [
+        message.tool_calls[0]["id"]
+        for message in first.messages
+        if isinstance(message, AIMessage)
+    ]
+    assert len(set(tool_call_ids)) == 2
+    # The chunk text comes last, after the static prefix
+    assert "chunk" in first.format_messages(text="chunk")[-1].content
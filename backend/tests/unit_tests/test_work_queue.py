@@ -0,0 +1,122 @@
+from typing import List
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert, select, update
+
+from db.models import Base, ExtractionJob, Extractor, JobChunk
+from server.work_queue import (
+    claim_chunks,
+    complete_chunk,
+    fail_chunk,
+    has_delayed_chunks,
+)
+from tests.db import TestingSession, engine
+
+
+def _create_job(num_chunks: int) -> UUID:
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    with TestingSession() as session:
+        extractor = Extractor(
+            owner_id=uuid4(), schema={"type": "object"}, instruction="Test"
+        )
+        session.add(extractor)
+        session.flush()
+        job = ExtractionJob(
+            owner_id=extractor.owner_id,
+            extractor_id=extractor.uuid,
+            model_name="gpt-3.5-turbo",
+            total_chunks=num_chunks,
+        )
+        session.add(job)
+        session.flush()
+        session.execute(
+            insert(JobChunk),
+            [
+                {"job_id": job.uuid, "index": idx, "text": f"chunk {idx}"}
+                for idx in range(num_chunks)
+            ],
+        )
+        session.commit()
+        return job.uuid
+
+
+def _get_job(job_id: UUID) -> ExtractionJob:
+    with TestingSession() as session:
+        return session.get(ExtractionJob, job_id)
+
+
+def _indexes(chunks: List) -> List[int]:
+    return [chunk.index for chunk in chunks]
+
+
+def test_claim_chunks() -> None:
+    """Chunks are claimed by a single worker until their lease expires."""
+    job_id = _create_job(3)
+    claimed = claim_chunks(TestingSession, "a", limit=2)
+    assert _indexes(claimed) == [0, 1]
+    assert _get_job(job_id).status == "running"
+    assert _indexes(claim_chunks(TestingSession, "b", limit=2)) == [2]
+    assert claim_chunks(TestingSession, "b", limit=2) == []
+    # Another worker cannot complete a chunk it does not hold
+    assert not complete_chunk(TestingSession, "b", claimed[0], ["x"], 10)
+
+    # Expired leases are claimed again
+    job_id = _create_job(1)
+    expired = claim_chunks(TestingSession, "a", limit=1, lease_seconds=-1)
+    reclaimed = claim_chunks(TestingSession, "b", limit=1)
+    assert _indexes(reclaimed) == [0]
+    assert reclaimed[0].attempts == 2
+    assert not complete_chunk(TestingSession, "a", expired[0], ["x"], 10)
+    assert complete_chunk(TestingSession, "b", reclaimed[0], ["x"], 10)
+    job = _get_job(job_id)
+    assert job.status == "succeeded"
+    assert job.completed_chunks == 1
+    assert job.tokens_used == 10
+
+
+def test_claim_skips_locked_chunks() -> None:
+    """Chunks locked by the transaction of another worker are skipped."""
+    _create_job(2)
+    with TestingSession() as session:
+        session.execute(
+            select(JobChunk).where(JobChunk.index == 0).with_for_update()
+        ).all()
+        assert _indexes(claim_chunks(TestingSession, "a", limit=2)) == [1]
+
+
+def test_failed_chunks_are_retried() -> None:
+    """Failed chunks are retried up to the max number of attempts."""
+    job_id = _create_job(2)
+    first, second = claim_chunks(TestingSession, "a", limit=2)
+    assert complete_chunk(TestingSession, "a", first, ["x"], 10)
+    assert fail_chunk(TestingSession, "a", second, "error", max_attempts=2)
+    # Failed chunks are only retried after a delay
+    assert claim_chunks(TestingSession, "a", limit=2) == []
+    assert has_delayed_chunks(TestingSession, job_id=job_id)
+    with TestingSession() as session:
+        session.execute(update(JobChunk).values(not_before=None))
+        session.commit()
+    assert not has_delayed_chunks(TestingSession, job_id=job_id)
+    (retry,) = claim_chunks(TestingSession, "a", limit=2)
+    assert retry.index == 1
+    assert _get_job(job_id).status == "running"
+    assert fail_chunk(TestingSession, "a", retry, "error", max_attempts=2)
+    assert claim_chunks(TestingSession, "a", limit=2) == []
+    job = _get_job(job_id)
+    assert job.status == "succeeded"
+    assert (job.completed_chunks, job.failed_chunks) == (1, 1)
+
+
+def test_exhausted_chunks_are_failed() -> None:
+    """Chunks whose lease expired on their last attempt are failed."""
+    job_id = _create_job(2)
+    claim_chunks(TestingSession, "a", limit=1, lease_seconds=-1, max_attempts=1)
+    assert _indexes(claim_chunks(TestingSession, "b", limit=2, max_attempts=1)) == [1]
+    with TestingSession() as session:
+        chunk = session.execute(
+            select(JobChunk).where(JobChunk.index == 0)
+        ).scalar_one()
+        assert (chunk.status, chunk.attempts) == ("error", 1)
+    job = _get_job(job_id)
+    assert (job.status, job.failed_chunks) == ("running", 1)